@@ -79,7 +79,7 @@ Smart Locker Team"""
     success = send_whatsapp_message(phone_number, message)
     
     if success:
-        print("✅ Message sent successfully!")
+        print("✅ Message queued for sending!")
     else:
         print("❌ Failed to send message")
     
@@ -118,7 +118,7 @@ def demo_otp_system():
     otp_code = send_otp_to_user(user, phone_number, "demo")
     
     if otp_code:
-        print(f"✅ OTP sent successfully!")
+        print(f"✅ OTP queued for sending!")
         print(f"📱 OTP Code: {otp_code} (for demo purposes)")
         
         # Demo verification
@@ -161,7 +161,7 @@ def demo_approval_system():
     success = messenger.send_parcel_approval_request(phone_number, booking_details)
     
     if success:
-        print("✅ Approval request sent successfully!")
+        print("✅ Approval request queued for sending!")
         print("📱 User will receive an interactive message with APPROVE/DENY options")
         
         print_step(2, "Checking for user response")
@@ -170,7 +170,15 @@ def demo_approval_system():
         import time
         time.sleep(15)
         
-        response = messenger.check_user_response(phone_number)
+        job_id = messenger.check_user_response(phone_number)
+        response = None
+        # The check runs on the WhatsApp worker; wait up to a minute for it
+        for _ in range(30 if job_id else 0):
+            job = WhatsAppMessenger.job_result(job_id)
+            if job['status'] != 'queued':
+                response = job['result']
+                break
+            time.sleep(2)
         
         if response:
             print(f"📨 User response received: '{response}'")
@@ -58,6 +58,14 @@ class Locker(models.Model):
     
     class Meta:
         unique_together = ['locker_bank', 'locker_number']
+        indexes = [
+            # Locker assignment picks an available locker by type
+            models.Index(
+                fields=['locker_type', 'size'],
+                condition=models.Q(status='available'),
+                name='locker_available_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.locker_bank.bank_id}-{self.locker_number}"
@@ -71,7 +79,7 @@ class LockerAccess(models.Model):
     )
     
     locker = models.ForeignKey(Locker, on_delete=models.CASCADE, related_name='access_logs')
-    access_code = models.CharField(max_length=100)  # QR code, OTP, or biometric hash
+    access_code = models.CharField(max_length=100)  # HMAC of the QR/OTP code (lockers/access_codes.py) or biometric hash
     access_type = models.CharField(max_length=20, choices=ACCESS_TYPES)
     is_active = models.BooleanField(default=True)
     expires_at = models.DateTimeField()
@@ -80,6 +88,13 @@ class LockerAccess(models.Model):
     used_by = models.ForeignKey('accounts.User', on_delete=models.CASCADE, null=True, blank=True, related_name='used_access_codes')
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Kiosk code checks only consider active codes
+            models.Index(fields=['access_code'], condition=models.Q(is_active=True), name='locker_access_active_code_idx'),
+            models.Index(fields=['locker', 'is_active', 'expires_at'], name='locker_access_locker_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.locker} - {self.access_type} - {self.access_code[:10]}..."
 
@@ -1,3 +1,18 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from .access_codes import generate_access_code, hash_access_code
+
+
+class AccessCodeTests(TestCase):
+
+    def test_hash_ignores_case_and_surrounding_whitespace(self):
+        self.assertEqual(hash_access_code(' ab12cd34 '), hash_access_code('AB12CD34'))
+        self.assertNotEqual(hash_access_code('AB12CD34'), hash_access_code('AB12CD35'))
+
+    @override_settings(LOCKER_ACCESS_CODE_BYTES=4)
+    def test_generated_code_comes_with_its_hash(self):
+        code, code_hash = generate_access_code()
+        self.assertEqual(len(code), 8)
+        self.assertEqual(code, code.upper())
+        self.assertEqual(code_hash, hash_access_code(code))
+        self.assertNotEqual(generate_access_code()[0], code)
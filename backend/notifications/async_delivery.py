@@ -0,0 +1,144 @@
+"""
+Asyncio delivery for non-browser channels (SMS, email, push, webhooks).
+
+Each worker process runs one event loop in a background thread with a
+shared httpx.AsyncClient, so a batch of notifications is sent as hundreds of
+concurrent requests over a small pool of kept-alive connections instead of
+one blocking call at a time. Callers stay synchronous: deliver() submits a
+batch to the loop and returns per-notification results, which
+NotificationService writes back with one bulk_update. If the batch overruns
+its deadline the outstanding sends are cancelled and only the notifications
+that had not succeeded by then are reported as failed.
+
+Transports implement send_async(); the base class runs the blocking send()
+in a thread, so every channel works, just without the multiplexing.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+import httpx
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDeliveryRunner:
+    """Event loop thread plus shared HTTP client for one process."""
+
+    def __init__(self, concurrency: Optional[int] = None, max_connections: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        self.concurrency = concurrency or settings.NOTIFICATION_ASYNC_CONCURRENCY
+        self.max_connections = max_connections or settings.NOTIFICATION_ASYNC_MAX_CONNECTIONS
+        self.timeout = timeout or settings.NOTIFICATION_ASYNC_TIMEOUT
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever,
+                name='notification-async-delivery',
+                daemon=True
+            )
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    async def _setup(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=1),
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client
+
+    def deliver(self, transport, notifications: Iterable[Notification]) -> Dict[int, bool]:
+        """
+        Send notifications concurrently through a transport; returns success
+        per pk. Notifications still in flight at the deadline are cancelled
+        and reported as failed.
+        """
+        notifications = list(notifications)
+        if not notifications:
+            return {}
+
+        self.start()
+        results = {notification.pk: False for notification in notifications}
+        future = asyncio.run_coroutine_threadsafe(self._deliver(transport, notifications, results), self._loop)
+        # Every request is bounded by the client timeout; allow for queueing behind the semaphore
+        waves = len(notifications) / self.concurrency + 1
+        try:
+            future.result(timeout=self.timeout * waves * 2)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            logger.warning(
+                f"{transport.channel} batch timed out, cancelled "
+                f"{sum(not success for success in results.values())} unfinished sends"
+            )
+        return dict(results)
+
+    async def _deliver(self, transport, notifications, results: Dict[int, bool]):
+        """Send a batch, recording each result in results as it completes."""
+        async def send(notification):
+            async with self._semaphore:
+                try:
+                    success = await transport.send_async(notification, self._client)
+                except Exception as e:
+                    logger.error(f"Error sending {transport.channel} notification {notification.notification_id}: {e}")
+                    success = False
+            results[notification.pk] = bool(success)
+
+        await asyncio.gather(*(send(notification) for notification in notifications))
+
+    def shutdown(self):
+        with self._lock:
+            if not self._loop:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout=5)
+            except Exception as e:
+                logger.debug(f"Error closing async delivery client: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = self._thread = self._client = None
+
+
+_runner: Optional[AsyncDeliveryRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_async_runner() -> AsyncDeliveryRunner:
+    """Return the process-wide async delivery runner."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = AsyncDeliveryRunner()
+    return _runner
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _shutdown_async_runner(**kwargs):
+    if _runner is not None:
+        _runner.shutdown()
@@ -0,0 +1,154 @@
+"""
+Coalescing of low-priority notifications into per-recipient digests.
+
+One booking can produce several notifications within minutes, and every
+WhatsApp send costs seconds of browser time. Low and medium priority
+notifications are therefore held for NOTIFICATION_COALESCE_WINDOW seconds
+(by setting scheduled_at, so the scheduler releases them). All held
+notifications of a recipient on a channel share the window opened by the
+first one and are merged into a single digest when it closes. Urgent and
+high priority notifications are never held, and neither are bulk/broadcast
+sends (metadata['broadcast'], set by bulk_send_notifications) or template
+types outside NOTIFICATION_COALESCE_TEMPLATE_TYPES.
+
+metadata['digest'] tracks the state: 'held' while waiting, 'sent' once the
+notification went out (alone or as the digest carrier), 'merged' when its
+text was folded into another notification.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+COALESCE_PRIORITIES = ('low', 'medium')
+
+DIGEST_HEADER = "You have {count} updates:"
+
+
+def _coalescible(notification: Notification) -> bool:
+    return (
+        notification.priority in COALESCE_PRIORITIES
+        and notification.retry_count == 0
+        and 'digest' not in notification.metadata
+        and not notification.metadata.get('broadcast')
+        and notification.template.channel in settings.NOTIFICATION_COALESCE_CHANNELS
+        and notification.template.template_type in settings.NOTIFICATION_COALESCE_TEMPLATE_TYPES
+    )
+
+
+def hold_for_digest(notifications: List[Notification]) -> Tuple[List[Notification], int]:
+    """
+    Hold coalescible notifications until their recipient's window closes.
+    Returns (notifications to send now, number held).
+    """
+    window = settings.NOTIFICATION_COALESCE_WINDOW
+    if not window:
+        return notifications, 0
+
+    held = [notification for notification in notifications if _coalescible(notification)]
+    if not held:
+        return notifications, 0
+
+    # Join a window that is already open for the recipient and channel
+    open_windows = {
+        (row['recipient_id'], row['template__channel']): row['closes_at']
+        for row in Notification.objects.filter(
+            status='pending',
+            metadata__digest='held',
+            recipient_id__in={notification.recipient_id for notification in held},
+            scheduled_at__isnull=False
+        ).values('recipient_id', 'template__channel').annotate(closes_at=Min('scheduled_at'))
+    }
+
+    now = timezone.now()
+    for notification in held:
+        key = (notification.recipient_id, notification.template.channel)
+        closes_at = open_windows.setdefault(key, now + timedelta(seconds=window))
+        notification.scheduled_at = closes_at
+        notification.metadata = {**notification.metadata, 'digest': 'held'}
+        notification.updated_at = now
+
+    Notification.objects.bulk_update(held, ['scheduled_at', 'metadata', 'updated_at'])
+
+    held_ids = {notification.pk for notification in held}
+    return [notification for notification in notifications if notification.pk not in held_ids], len(held)
+
+
+def build_digest(notifications: List[Notification]) -> str:
+    """Digest text for several notifications, oldest first."""
+    parts = [DIGEST_HEADER.format(count=len(notifications))]
+    parts.extend(notification.message for notification in notifications)
+    return "\n\n".join(parts)
+
+
+def merge_digests(notifications: List[Notification]) -> List[Notification]:
+    """
+    Merge released notifications with the other held ones of their recipient.
+
+    Each group is sent as its oldest notification carrying the digest text;
+    the rest are cancelled. Rows are locked, so a concurrent sender that
+    released part of the same window waits and then finds them settled.
+    Returns the notifications to send.
+    """
+    released = [notification for notification in notifications if notification.metadata.get('digest') == 'held']
+    if not released:
+        return notifications
+
+    now = timezone.now()
+    released_ids = {notification.pk for notification in released}
+
+    with transaction.atomic():
+        rows = list(
+            Notification.objects
+            .select_for_update(of=('self',))
+            .filter(
+                status='pending',
+                metadata__digest='held',
+                recipient_id__in={notification.recipient_id for notification in released},
+                template__channel__in={notification.template.channel for notification in released}
+            )
+            .select_related('template', 'recipient')
+            .order_by('created_at')
+        )
+
+        groups: Dict[Tuple, List[Notification]] = {}
+        for row in rows:
+            groups.setdefault((row.recipient_id, row.template.channel), []).append(row)
+
+        carriers = []
+        changed = []
+        for group in groups.values():
+            # Only windows that have been released in this call are closed
+            if not released_ids.intersection(row.pk for row in group):
+                continue
+
+            carrier, merged = group[0], group[1:]
+            carrier.metadata = {**carrier.metadata, 'digest': 'sent'}
+            carrier.scheduled_at = None
+            if merged:
+                carrier.message = build_digest(group)
+                carrier.metadata['digest_of'] = [str(row.notification_id) for row in merged]
+            for row in merged:
+                row.status = 'cancelled'
+                row.scheduled_at = None
+                row.metadata = {**row.metadata, 'digest': 'merged', 'digest_into': str(carrier.notification_id)}
+            for row in group:
+                row.updated_at = now
+            carriers.append(carrier)
+            changed.extend(group)
+
+        Notification.objects.bulk_update(changed, ['status', 'message', 'scheduled_at', 'metadata', 'updated_at'])
+
+    if len(changed) > len(carriers):
+        logger.info(f"Coalesced {len(changed)} notifications into {len(carriers)} digests")
+
+    return [notification for notification in notifications if notification.pk not in released_ids] + carriers
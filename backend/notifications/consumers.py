@@ -2,7 +2,7 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from .models import Notification
+from .receipts import record_receipt
 
 User = get_user_model()
 
@@ -41,15 +41,18 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'notification': event['notification']
         }))
 
+    async def notification_status(self, event):
+        # Delivered/read updates applied by the receipt buffer
+        await self.send(text_data=json.dumps({
+            'type': 'notification_status',
+            'updates': event['updates']
+        }))
+
     @database_sync_to_async
     def mark_notification_read(self, notification_id):
-        try:
-            notification = Notification.objects.get(notification_id=notification_id)
-            notification.status = 'read'
-            notification.read_at = timezone.now()
-            notification.save()
-        except Notification.DoesNotExist:
-            pass
+        # Applied with the next receipt flush instead of a save per click;
+        # an id that is not a UUID is dropped rather than buffered
+        record_receipt('read', notification_id=notification_id)
 
 class LockerStatusConsumer(AsyncWebsocketConsumer):
     async def connect(self):
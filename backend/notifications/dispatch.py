@@ -0,0 +1,300 @@
+"""
+Batch dispatcher for queued WhatsApp messages.
+
+Workers claim queued WhatsAppMessage rows with SELECT ... FOR UPDATE SKIP
+LOCKED, so several dispatchers can drain the queue at the same time without
+sending a message twice. Claimed rows are sent back to back on one pooled
+driver per session. Each message's status is written as soon as it settles,
+and before every send the rest of the batch has its claim refreshed, so
+release_stale_claims in another dispatcher only requeues claims whose worker
+has actually stopped. Messages whose session is down are rerouted to the
+next session on the recipient's hash ring, or failed for a later retry when
+no other session is active.
+
+Sends are paced by the shared rate limiter. A message that would wait too
+long for its recipient's bucket is put back in the queue; when a session or
+the global bucket runs dry the rest of that session's batch goes back too,
+and the run stops draining until the next trigger.
+
+The WhatsApp worker serves whatsapp.urgent and whatsapp from one solo
+process, so a long run would hold up OTP and approval jobs queued behind it.
+Between batches a run on the regular lane checks whatsapp.urgent and, if
+anything is waiting, hands the rest of the drain to a fresh task and returns.
+"""
+
+import logging
+import time
+from datetime import timedelta
+from itertools import groupby
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+from selenium.common.exceptions import WebDriverException
+
+from .driver_pool import get_driver_pool
+from .lanes import URGENT_PRIORITIES, WHATSAPP_URGENT_QUEUE, queue_depth
+from .models import Notification, WhatsAppMessage, WhatsAppSession
+from .ratelimit import get_rate_limiter
+from .receipts import record_receipts
+from .retry import schedule_retries
+from .session_router import get_session_router, reset_session_router
+
+logger = logging.getLogger(__name__)
+
+
+class WhatsAppBatchDispatcher:
+    """Claims, sends and settles batches of queued WhatsApp messages."""
+
+    def __init__(self, batch_size: int = None, urgent_only: bool = False):
+        self.batch_size = batch_size or settings.WHATSAPP_DISPATCH_BATCH_SIZE
+        self.urgent_only = urgent_only
+        self.claim_timeout = timedelta(seconds=settings.WHATSAPP_DISPATCH_CLAIM_TIMEOUT)
+        self.limiter = get_rate_limiter()
+        self.max_wait = settings.WHATSAPP_RATE_LIMIT_MAX_WAIT
+
+    def claim_batch(self) -> List[WhatsAppMessage]:
+        """
+        Atomically move up to batch_size queued messages to 'sending',
+        urgent and high priority first.
+        """
+        queued = WhatsAppMessage.objects.filter(status='queued')
+        if self.urgent_only:
+            queued = queued.filter(notification__priority__in=URGENT_PRIORITIES)
+
+        with transaction.atomic():
+            ids = list(
+                queued
+                .select_for_update(skip_locked=True, of=('self',))
+                .annotate(lane=Case(
+                    When(notification__priority__in=URGENT_PRIORITIES, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField()
+                ))
+                .order_by('lane', 'created_at')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return []
+
+            WhatsAppMessage.objects.filter(id__in=ids).update(
+                status='sending',
+                updated_at=timezone.now()
+            )
+
+        return list(
+            WhatsAppMessage.objects
+            .filter(id__in=ids)
+            .select_related('session', 'notification')
+            .order_by('session_id', 'created_at')
+        )
+
+    def release_stale_claims(self) -> int:
+        """Requeue messages left in 'sending' by a worker that died mid-batch."""
+        return WhatsAppMessage.objects.filter(
+            status='sending',
+            updated_at__lt=timezone.now() - self.claim_timeout
+        ).update(status='queued', updated_at=timezone.now())
+
+    def _throttle(self, message: WhatsAppMessage) -> str:
+        """
+        Wait for a rate limit token, up to max_wait seconds.
+        Returns '' when the message may be sent, else the scope that blocked.
+        """
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            scope, delay = self.limiter.acquire(message.session.session_id, message.recipient_phone)
+            if scope is None:
+                return ''
+            if time.monotonic() + delay > deadline:
+                return scope
+            time.sleep(delay)
+
+    def send_batch(self, messages: List[WhatsAppMessage]) -> Dict[str, int]:
+        """Send claimed messages, one driver lease per session."""
+        results = {'sent': 0, 'failed': 0, 'requeued': 0, 'deferred': 0}
+        saved = set()
+
+        def settle(settled: List[WhatsAppMessage]):
+            self._save(settled)
+            saved.update(m.pk for m in settled)
+
+        def heartbeat():
+            self._heartbeat([m for m in messages if m.pk not in saved])
+
+        for _, group in groupby(messages, key=lambda m: m.session_id):
+            group = list(group)
+            session = group[0].session
+
+            if session.status != 'active':
+                rerouted = self._reroute(group, session)
+                settle(group)
+                results['requeued'] += rerouted
+                results['failed'] += len(group) - rerouted
+                continue
+
+            try:
+                # Starting a driver can take a while
+                heartbeat()
+                with get_driver_pool().lease(session) as whatsapp_service:
+                    for index, message in enumerate(group):
+                        heartbeat()
+                        blocked = self._throttle(message)
+                        if blocked == 'recipient':
+                            self._defer([message])
+                            settle([message])
+                            results['deferred'] += 1
+                            continue
+                        if blocked:
+                            # Session or global bucket is empty: nothing else in the group can go
+                            self._defer(group[index:])
+                            settle(group[index:])
+                            results['deferred'] += len(group) - index
+                            break
+
+                        if whatsapp_service.send_message(
+                            message.recipient_phone,
+                            message.message_content,
+                            message.message_type,
+                            throttle=False
+                        ):
+                            self._mark_sent(message, whatsapp_service.last_sent_message_id)
+                            settle([message])
+                            results['sent'] += 1
+                            # The chat is open anyway: pick up ticks on earlier messages
+                            self._record_receipts(whatsapp_service)
+                        else:
+                            self._mark_failed(message, "Send failed")
+                            settle([message])
+                            results['failed'] += 1
+            except WebDriverException as e:
+                # Messages not settled before the driver died fail over to another session
+                logger.error(f"Driver for session {session.session_id} failed: {e}")
+                unsettled = [m for m in group if m.pk not in saved]
+                rerouted = self._reroute(unsettled, session)
+                settle(unsettled)
+                results['requeued'] += rerouted
+                results['failed'] += len(unsettled) - rerouted
+
+        leftover = [m for m in messages if m.pk not in saved]
+        if leftover:
+            self._save(leftover)
+        return results
+
+    def run(self, max_batches: int = 1) -> Dict[str, int]:
+        """
+        Drain up to max_batches batches from the queue, stopping early once
+        the rate limiter pushes back.
+        """
+        totals = {'sent': 0, 'failed': 0, 'requeued': 0, 'deferred': 0}
+
+        released = self.release_stale_claims()
+        if released:
+            logger.warning(f"Requeued {released} stale WhatsApp message claims")
+
+        for _ in range(max_batches):
+            messages = self.claim_batch()
+            if not messages:
+                break
+
+            results = self.send_batch(messages)
+            for key, count in results.items():
+                totals[key] += count
+            if results['deferred']:
+                break
+            if not self.urgent_only and queue_depth(WHATSAPP_URGENT_QUEUE):
+                self._yield_to_urgent(full=len(messages) == self.batch_size)
+                break
+
+        logger.info(
+            f"WhatsApp dispatch: {totals['sent']} sent, {totals['failed']} failed, "
+            f"{totals['requeued']} requeued, {totals['deferred']} deferred by rate limits"
+        )
+        return totals
+
+    def _yield_to_urgent(self, full: bool):
+        """Let queued urgent jobs run first; a full last batch means more may be waiting."""
+        from .tasks import dispatch_whatsapp_messages
+
+        logger.info("Urgent WhatsApp jobs waiting, yielding the worker")
+        if full:
+            dispatch_whatsapp_messages.delay()
+
+    def _heartbeat(self, messages: List[WhatsAppMessage]):
+        """Refresh the claim on messages this worker is still going to send."""
+        if messages:
+            WhatsAppMessage.objects.filter(
+                id__in=[m.pk for m in messages],
+                status='sending'
+            ).update(updated_at=timezone.now())
+
+    def _mark_sent(self, message: WhatsAppMessage, whatsapp_message_id: str = ''):
+        now = timezone.now()
+        message.status = 'sent'
+        message.sent_at = now
+        message.whatsapp_message_id = whatsapp_message_id
+        message.error_message = ''
+        message.notification.status = 'sent'
+        message.notification.sent_at = now
+
+    def _mark_failed(self, message: WhatsAppMessage, error: str):
+        # The notification itself is rescheduled by schedule_retries in _save
+        message.status = 'failed'
+        message.error_message = error
+        message.retry_count += 1
+
+    def _record_receipts(self, whatsapp_service):
+        record_receipts(
+            {'whatsapp_message_id': message_id, 'status': status}
+            for message_id, status in whatsapp_service.read_outgoing_receipts()
+        )
+
+    def _defer(self, messages: List[WhatsAppMessage]):
+        """Put messages back in the queue untouched, to be sent on a later run."""
+        for message in messages:
+            message.status = 'queued'
+
+    def _reroute(self, messages: List[WhatsAppMessage], failed_session: WhatsAppSession) -> int:
+        """
+        Requeue messages on the next session of their recipient's ring.
+        With no other session they fail and go through the notification
+        retry schedule, rather than being requeued on the dead session and
+        claimed again straight away. Returns the number requeued.
+        """
+        reset_session_router()
+        router = get_session_router()
+
+        rerouted = 0
+        for message in messages:
+            session = router.route(message.recipient_phone, exclude=(failed_session.session_id,))
+            if session is None:
+                self._mark_failed(message, f"Session {failed_session.session_id} failed and no other session is active")
+                continue
+            message.session = session
+            message.status = 'queued'
+            message.error_message = f"Rerouted from session {failed_session.session_id}"
+            rerouted += 1
+        return rerouted
+
+    def _save(self, messages: List[WhatsAppMessage]):
+        """Write back settled message and notification statuses with bulk updates."""
+        now = timezone.now()
+        for message in messages:
+            message.updated_at = now
+            message.notification.updated_at = now
+
+        with transaction.atomic():
+            WhatsAppMessage.objects.bulk_update(
+                messages,
+                ['session', 'status', 'sent_at', 'whatsapp_message_id', 'error_message', 'retry_count', 'updated_at']
+            )
+            Notification.objects.bulk_update(
+                [m.notification for m in messages if m.status == 'sent'],
+                ['status', 'sent_at', 'updated_at']
+            )
+            schedule_retries(
+                [m.notification for m in messages if m.status == 'failed'],
+                "WhatsApp send failed"
+            )
@@ -0,0 +1,105 @@
+"""
+Batched DOM extraction for WhatsApp Web.
+
+Walking the page with find_elements/get_attribute costs one WebDriver HTTP
+round trip per element and attribute. The helpers here run a single
+execute_script that returns the whole chat or chat list as compact arrays,
+so reading a chat costs one round trip however many messages it holds.
+"""
+
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+# Rows of [id, incoming (1/0), text, timestamp label, receipt] for the open
+# chat. arguments[0]: only return messages after this id; arguments[1]: keep
+# only the last N rows.
+CHAT_MESSAGES_JS = """
+var afterId = arguments[0], limit = arguments[1];
+var rows = [];
+var containers = document.querySelectorAll("[data-testid='msg-container']");
+for (var i = 0; i < containers.length; i++) {
+    var c = containers[i];
+    var holder = c.closest('[data-id]') || c.querySelector('[data-id]');
+    var id = holder ? holder.getAttribute('data-id') : '';
+    if (afterId && id === afterId) { rows = []; continue; }
+    var incoming = (c.className || '').indexOf('message-in') !== -1 || !!c.closest('.message-in');
+    var text = c.querySelector('.selectable-text');
+    var meta = c.querySelector('[data-pre-plain-text]');
+    var label = meta ? meta.getAttribute('data-pre-plain-text') : '';
+    var match = /\\[([^\\]]*)\\]/.exec(label);
+    var receipt = '';
+    var icon = c.querySelector("[data-icon^='msg-']");
+    if (icon) {
+        var aria = (icon.getAttribute('aria-label') || '').trim().toLowerCase();
+        var name = icon.getAttribute('data-icon');
+        if (aria === 'read' || name === 'msg-dblcheck-ack') { receipt = 'read'; }
+        else if (aria === 'delivered' || name === 'msg-dblcheck') { receipt = 'delivered'; }
+        else if (name === 'msg-check') { receipt = 'sent'; }
+    }
+    rows.push([id, incoming ? 1 : 0, text ? text.innerText : '', match ? match[1] : '', receipt]);
+}
+return limit ? rows.slice(-limit) : rows;
+"""
+
+# {chats: [[title, unread (1/0)], ...], open: title of the open chat or null}.
+# One row per sidebar item, in DOM order, so a row's index locates its item.
+CHAT_LIST_JS = """
+var chats = [];
+var items = document.querySelectorAll("[data-testid='cell-frame-container']");
+for (var i = 0; i < items.length; i++) {
+    var title = items[i].querySelector('span[title]');
+    var unread = !!items[i].querySelector("[data-testid='icon-unread-count']");
+    chats.push([title ? title.getAttribute('title') : '', unread ? 1 : 0]);
+}
+var header = document.querySelector("[data-testid='conversation-info-header'] span[title]");
+return {chats: chats, open: header ? header.getAttribute('title') : null};
+"""
+
+# data-id of the newest message in the open chat, e.g. 'false_919876543210@c.us_3EB0...'
+OPEN_CHAT_MESSAGE_ID_JS = """
+var holders = document.querySelectorAll("[data-testid='conversation-panel-messages'] [data-id]");
+return holders.length ? holders[holders.length - 1].getAttribute('data-id') : null;
+"""
+
+# Message ids embed the chat's JID; one-to-one chats are <phone digits>@c.us
+MESSAGE_JID_RE = re.compile(r'^(?:true|false)_(\d+)@c\.us_')
+
+
+class ChatMessage(NamedTuple):
+    id: str
+    incoming: bool
+    text: str
+    timestamp: str  # WhatsApp's "HH:MM, DD/MM/YYYY" label, locale dependent
+    receipt: str  # '', 'sent', 'delivered' or 'read' (outgoing only)
+
+
+class ChatList(NamedTuple):
+    chats: List[Tuple[str, bool]]  # (title, has unread badge), one per sidebar item in order
+    open_title: Optional[str]
+
+
+def read_chat(driver, after_id: Optional[str] = None, limit: Optional[int] = None) -> List[ChatMessage]:
+    """Messages of the open chat, oldest first, in one WebDriver call."""
+    rows = driver.execute_script(CHAT_MESSAGES_JS, after_id, limit) or []
+    return [
+        ChatMessage(id=row[0], incoming=bool(row[1]), text=row[2], timestamp=row[3], receipt=row[4])
+        for row in rows
+    ]
+
+
+def read_chat_list(driver) -> ChatList:
+    """Sidebar chats and the open conversation, in one WebDriver call."""
+    state = driver.execute_script(CHAT_LIST_JS) or {}
+    return ChatList(
+        chats=[(title, bool(unread)) for title, unread in state.get('chats', [])],
+        open_title=state.get('open')
+    )
+
+
+def open_chat_phone(driver) -> Optional[str]:
+    """
+    Phone digits of the open one-to-one chat, read from the JID in its
+    message ids. None for groups and chats without messages.
+    """
+    match = MESSAGE_JID_RE.match(driver.execute_script(OPEN_CHAT_MESSAGE_ID_JS) or '')
+    return match.group(1) if match else None
@@ -0,0 +1,229 @@
+"""
+Process-local pool of warm WhatsApp Web drivers.
+
+Launching Chrome and resolving the chromedriver binary costs several seconds,
+so the WhatsApp worker keeps one logged-in driver per WhatsAppSession alive
+for the lifetime of the process and leases it to tasks instead of starting
+and quitting a browser for every message. The DriverSupervisor recycles
+drivers whose memory, crash count or send latency degrade.
+"""
+
+import logging
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from selenium.common.exceptions import WebDriverException
+
+from .models import WhatsAppSession
+from .profiles import get_profile_manager
+from .services import WhatsAppAutomationService
+from .supervisor import DriverSupervisor, is_crash
+
+logger = logging.getLogger(__name__)
+
+
+class PooledDriver:
+    """A warm driver bound to one WhatsApp session."""
+
+    def __init__(self, session: WhatsAppSession):
+        self.service = WhatsAppAutomationService()
+        self.service.session = session
+        self.lock = threading.Lock()
+        self.started_at: Optional[float] = None
+        self.last_used_at: Optional[float] = None
+        self.leases = 0
+        # Health, see supervisor.py
+        self.crashes = 0
+        self.recycles = 0
+        self.start_failures = 0
+        self.rss: Optional[int] = None
+        self.checked_at = 0.0
+
+    @property
+    def session_id(self) -> str:
+        return self.service.session.session_id
+
+    def ensure_started(self, headless: bool = True):
+        """Start the browser and open WhatsApp Web if it is not already running."""
+        if self.service.driver and self.service.is_driver_alive():
+            return
+
+        self.stop()
+        self.service.initialize_driver(headless=headless)
+        if not self.service.open_whatsapp_web():
+            self.stop(snapshot=False)
+            # Start over from the last good snapshot on the next lease
+            get_profile_manager().discard(self.service.session)
+            raise WebDriverException(
+                f"WhatsApp Web did not load for session {self.session_id}"
+            )
+        self.started_at = time.monotonic()
+        logger.info(f"Started pooled WhatsApp driver for session {self.session_id}")
+
+    def stop(self, snapshot: bool = True):
+        """
+        Quit the browser without touching the session status. A cleanly
+        closed profile is snapshotted if the last snapshot is getting old.
+        The crash count is kept; only a recycle resets it.
+        """
+        if self.service.driver:
+            try:
+                self.service.driver.quit()
+            except Exception as e:
+                logger.warning(f"Error quitting driver for session {self.session_id}: {e}")
+                snapshot = False
+            self.service.driver = None
+            if snapshot and self.started_at is not None:
+                get_profile_manager().snapshot_if_stale(self.service.session, self.service.profile_dir)
+        self.started_at = None
+        self.rss = None
+        self.service.send_latencies.clear()
+
+
+class WhatsAppDriverPool:
+    """
+    Keeps one warm driver per WhatsApp session and leases it to callers.
+
+    A lease is exclusive: WebDriver is not thread safe, so concurrent callers
+    for the same session wait for the driver to be returned.
+    """
+
+    def __init__(self, idle_timeout: Optional[int] = None, headless: Optional[bool] = None):
+        self.idle_timeout = idle_timeout if idle_timeout is not None else settings.WHATSAPP_DRIVER_IDLE_TIMEOUT
+        self.headless = headless if headless is not None else settings.SELENIUM_HEADLESS
+        self._drivers: Dict[str, PooledDriver] = {}
+        self._lock = threading.Lock()
+        self.supervisor = DriverSupervisor()
+
+    def _get_or_create(self, session: WhatsAppSession) -> PooledDriver:
+        with self._lock:
+            pooled = self._drivers.get(session.session_id)
+            if pooled is None:
+                pooled = PooledDriver(session)
+                self._drivers[session.session_id] = pooled
+            return pooled
+
+    @contextmanager
+    def lease(self, session: WhatsAppSession, revive: bool = False) -> Iterator[WhatsAppAutomationService]:
+        """
+        Lease the warm driver for a session.
+
+        The driver is started on first use and reused afterwards, and is
+        recycled first if the supervisor finds it unhealthy. A WebDriver
+        failure inside the lease discards the browser so the next lease gets a
+        fresh one. Sessions in 'error' are only leased with revive=True.
+        """
+        if session.status == 'error' and not revive:
+            raise WebDriverException(f"WhatsApp session {session.session_id} is in error")
+
+        pooled = self._get_or_create(session)
+
+        with pooled.lock:
+            # Pick up status changes made by other processes
+            pooled.service.session = session
+            reason = self.supervisor.check(pooled)
+            if reason:
+                self.supervisor.recycle(pooled, reason, self.headless)
+            else:
+                self.supervisor.start(pooled, self.headless)
+            pooled.leases += 1
+
+            try:
+                yield pooled.service
+            except WebDriverException as e:
+                logger.exception(f"WebDriver failure on session {session.session_id}, recycling driver")
+                pooled.crashes += is_crash(e)
+                pooled.stop(snapshot=False)
+                raise
+            finally:
+                pooled.last_used_at = time.monotonic()
+
+        self.evict_idle()
+
+    def evict_idle(self):
+        """Quit drivers that have not been leased within the idle timeout."""
+        if not self.idle_timeout:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                session_id for session_id, pooled in self._drivers.items()
+                if pooled.last_used_at and now - pooled.last_used_at > self.idle_timeout
+                and not pooled.lock.locked()
+            ]
+            evicted = [self._drivers.pop(session_id) for session_id in idle]
+
+        for pooled in evicted:
+            logger.info(f"Evicting idle WhatsApp driver for session {pooled.session_id}")
+            pooled.stop()
+
+    def idle_drivers(self) -> List[PooledDriver]:
+        """Pooled drivers that are not leased right now."""
+        with self._lock:
+            return [pooled for pooled in self._drivers.values() if not pooled.lock.locked()]
+
+    def discard(self, session_id: str):
+        """Quit and forget the driver for a session."""
+        with self._lock:
+            pooled = self._drivers.pop(session_id, None)
+
+        if pooled:
+            with pooled.lock:
+                pooled.stop()
+
+    def shutdown(self):
+        """Quit every pooled driver."""
+        with self._lock:
+            drivers = list(self._drivers.values())
+            self._drivers.clear()
+
+        for pooled in drivers:
+            pooled.stop()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Return per-session pool statistics."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                session_id: {
+                    'running': pooled.started_at is not None,
+                    'uptime': now - pooled.started_at if pooled.started_at else 0,
+                    'leases': pooled.leases,
+                    'busy': pooled.lock.locked(),
+                    'rss_mb': pooled.rss // (1024 * 1024) if pooled.rss else None,
+                    'crashes': pooled.crashes,
+                    'recycles': pooled.recycles,
+                    'median_send_latency': (
+                        statistics.median(pooled.service.send_latencies)
+                        if pooled.service.send_latencies else None
+                    ),
+                }
+                for session_id, pooled in self._drivers.items()
+            }
+
+
+_pool: Optional[WhatsAppDriverPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool() -> WhatsAppDriverPool:
+    """Return the process-wide driver pool."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WhatsAppDriverPool()
+    return _pool
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _shutdown_driver_pool(**kwargs):
+    if _pool is not None:
+        _pool.shutdown()
@@ -0,0 +1,58 @@
+"""
+Idempotency keys for notifications tied to a booking.
+
+Celery retries and repeated approval replies can run the same notify step
+more than once. Each step derives a key from the booking, the template type
+and a hash of the payload; the first run claims it in Redis (SET NX with a
+TTL) and later runs skip the send. Notification.idempotency_key is unique,
+so the database still rejects duplicates when Redis is unavailable or the
+key has expired.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_store import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'notify:idem:'
+
+
+def make_idempotency_key(booking_id, template_type: str, payload: Optional[Dict[str, Any]] = None) -> str:
+    """Stable key for one notification about a booking."""
+    payload_hash = hashlib.sha256(
+        json.dumps(payload or {}, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()[:16]
+    raw = f"{booking_id}:{template_type}:{payload_hash}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def claim_idempotency_key(key: str, ttl: Optional[int] = None) -> bool:
+    """
+    Claim a key for this run. Returns False if another run already claimed
+    it within the TTL. Fails open when Redis is unavailable.
+    """
+    try:
+        return bool(get_redis().set(
+            KEY_PREFIX + key,
+            1,
+            nx=True,
+            ex=ttl or settings.NOTIFICATION_IDEMPOTENCY_TTL
+        ))
+    except RedisError as e:
+        logger.debug(f"Idempotency check unavailable, not deduplicating: {e}")
+        return True
+
+
+def release_idempotency_key(key: str):
+    """Forget a claim so a later run can retry a send that did not happen."""
+    try:
+        get_redis().delete(KEY_PREFIX + key)
+    except RedisError as e:
+        logger.debug(f"Could not release idempotency key: {e}")
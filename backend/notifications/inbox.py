@@ -0,0 +1,215 @@
+"""
+Incremental scanner for WhatsApp approval replies and receipts.
+
+Instead of opening every pending recipient's chat on every tick, the scanner
+reads the unread-chat list once, opens only chats that may belong to a
+pending approval, and reads the incoming messages newer than a per-chat
+high-water mark kept in Redis. Delivery and read ticks in every chat it opens
+are buffered as receipts.
+
+Sidebar titles are only a hint: a saved contact shows its name, and a number
+may be shown without its country code. Chats are clicked by their position
+in the sidebar, and which recipient an open chat belongs to is decided by the
+JID in its message ids.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.utils import timezone
+
+from redis.exceptions import RedisError
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from .dom import open_chat_phone, read_chat, read_chat_list
+from .models import WhatsAppMessage, WhatsAppSession
+from .receipts import record_receipts
+from .redis_store import get_redis
+from .services import WhatsAppAutomationService
+from .session_router import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# High-water marks used while Redis is unreachable, kept for the process lifetime
+_local_hwm: Dict[Tuple[str, str], str] = {}
+
+CHAT_ITEM_SELECTOR = "[data-testid='cell-frame-container']"
+
+
+class InboxScanner:
+    """Matches new incoming replies to pending approval messages for one session."""
+
+    def __init__(self, service: WhatsAppAutomationService, session: WhatsAppSession):
+        self.service = service
+        self.session = session
+        self.hwm_key = f"whatsapp:inbox:hwm:{session.session_id}"
+
+    def build_index(self) -> Dict[str, WhatsAppMessage]:
+        """Map recipient phone digits to the newest pending approval for it."""
+        pending = WhatsAppMessage.objects.filter(
+            session=self.session,
+            message_type='approval',
+            requires_response=True,
+            user_response='',
+            status='sent'
+        ).select_related('notification').order_by('sent_at')
+
+        return {normalize_phone(message.recipient_phone): message for message in pending}
+
+    def unread_chats(self) -> List[Tuple[Optional[int], str]]:
+        """Return (sidebar position, title) for each chat that may hold new replies."""
+        driver = self.service.driver
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='chat-list']"))
+        )
+
+        chat_list = read_chat_list(driver)
+        chats = [(position, title) for position, (title, unread) in enumerate(chat_list.chats) if unread]
+
+        # The chat left open by the last send never shows an unread badge
+        open_title = chat_list.open_title
+        if open_title and all(open_title != title for _, title in chats):
+            position = next(
+                (position for position, (title, _) in enumerate(chat_list.chats) if title == open_title),
+                None
+            )
+            chats.append((position, open_title))
+        return chats
+
+    def open_chat(self, position: Optional[int], title: str) -> Optional[str]:
+        """
+        Open the chat at a sidebar position, without reloading the page.
+        Returns the phone digits of the chat that is open afterwards.
+        """
+        driver = self.service.driver
+        if read_chat_list(driver).open_title != title:
+            items = driver.find_elements(By.CSS_SELECTOR, CHAT_ITEM_SELECTOR)
+            if position is None or position >= len(items):
+                return None
+            items[position].click()
+            WebDriverWait(driver, 10).until(lambda d: read_chat_list(d).open_title == title)
+            WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='conversation-panel-messages']"))
+            )
+        return open_chat_phone(driver)
+
+    def read_incoming_since(self, phone: str) -> List[Tuple[str, str]]:
+        """
+        Return (message id, text) for incoming messages in the open chat that
+        are newer than both our last outgoing message and the high-water mark.
+        """
+        new_messages = []
+
+        # One script call; messages up to the high-water mark are dropped in the page
+        for message in read_chat(self.service.driver, after_id=self._get_hwm(phone)):
+            if not message.incoming:
+                # Replies only count after our latest outgoing message
+                new_messages = []
+                continue
+            new_messages.append((message.id, message.text))
+
+        return new_messages
+
+    def scan(self) -> List[Tuple[WhatsAppMessage, str]]:
+        """Return (pending message, reply text) pairs found in this tick."""
+        index = self.build_index()
+        if not index:
+            return []
+
+        matches = []
+        for position, title in self.unread_chats():
+            if not _title_may_match(title, index):
+                continue
+
+            try:
+                phone = self.open_chat(position, title)
+                message = index.get(phone)
+                if not message:
+                    continue
+                replies = self.read_incoming_since(phone)
+                self.record_receipts()
+            except (TimeoutException, WebDriverException) as e:
+                logger.error(f"Error reading chat {title}: {e}")
+                continue
+
+            if not replies:
+                continue
+
+            last_id, last_text = replies[-1]
+            if last_id:
+                self._set_hwm(phone, last_id)
+            matches.append((message, last_text.strip().upper()))
+
+        return matches
+
+    def record_receipts(self):
+        """Buffer delivery and read ticks visible in the open chat."""
+        record_receipts(
+            {'whatsapp_message_id': message_id, 'status': status}
+            for message_id, status in self.service.read_outgoing_receipts()
+        )
+
+    def scan_receipts(self, max_chats: int, max_age: timedelta = timedelta(days=1)) -> int:
+        """
+        Open up to max_chats recent chats that may still have messages without
+        a read receipt and buffer their ticks. Returns the number of chats read.
+        """
+        waiting = set(
+            normalize_phone(phone)
+            for phone in WhatsAppMessage.objects.filter(
+                session=self.session,
+                status__in=('sent', 'delivered'),
+                sent_at__gte=timezone.now() - max_age
+            ).values_list('recipient_phone', flat=True).distinct()
+        )
+        if not waiting:
+            return 0
+
+        driver = self.service.driver
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='chat-list']"))
+        )
+
+        # The sidebar is ordered by recent activity, so recent sends come first
+        chats = read_chat_list(driver).chats
+        opened = 0
+        for position, (title, _) in enumerate(chats):
+            if opened >= max_chats:
+                break
+            if not _title_may_match(title, waiting):
+                continue
+            try:
+                # Count every chat opened, matching or not, against max_chats
+                opened += 1
+                if self.open_chat(position, title) in waiting:
+                    self.record_receipts()
+            except (TimeoutException, WebDriverException) as e:
+                logger.error(f"Error reading receipts in chat {title}: {e}")
+        return opened
+
+    def _get_hwm(self, phone: str) -> Optional[str]:
+        try:
+            return get_redis().hget(self.hwm_key, phone)
+        except RedisError:
+            return _local_hwm.get((self.hwm_key, phone))
+
+    def _set_hwm(self, phone: str, message_id: str):
+        try:
+            get_redis().hset(self.hwm_key, phone, message_id)
+        except RedisError:
+            _local_hwm[(self.hwm_key, phone)] = message_id
+
+
+def _title_may_match(title: str, phones) -> bool:
+    """
+    Whether a sidebar title could be the chat of one of phones (digits with
+    country code). Names and short numbers cannot be ruled out by title.
+    """
+    digits = normalize_phone(title)
+    if len(digits) < 7:
+        return bool(title)
+    return any(phone.endswith(digits) for phone in phones)
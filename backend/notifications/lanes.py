@@ -0,0 +1,101 @@
+"""
+Priority lanes for notification traffic.
+
+Urgent and high priority notifications, OTP sends and approval requests get
+their own Celery queues, served by dedicated workers, so a large reminder
+batch cannot sit in front of a locker-access OTP. Publish and start times
+are stamped on every task so per-lane wait time can be reported next to the
+queue depth read from the broker.
+"""
+
+import logging
+import time
+from typing import Dict
+
+from celery.signals import before_task_publish, task_prerun
+from redis.exceptions import RedisError
+
+from .metrics import LatencyMetric
+from .redis_store import get_redis
+
+logger = logging.getLogger(__name__)
+
+URGENT_QUEUE = 'notifications.urgent'
+DEFAULT_QUEUE = 'notifications'
+BULK_QUEUE = 'notifications.bulk'
+WHATSAPP_URGENT_QUEUE = 'whatsapp.urgent'
+WHATSAPP_QUEUE = 'whatsapp'
+
+LANE_QUEUES = (URGENT_QUEUE, DEFAULT_QUEUE, BULK_QUEUE, WHATSAPP_URGENT_QUEUE, WHATSAPP_QUEUE)
+
+PRIORITY_QUEUES = {
+    'urgent': URGENT_QUEUE,
+    'high': URGENT_QUEUE,
+    'medium': DEFAULT_QUEUE,
+    'low': BULK_QUEUE,
+}
+
+URGENT_PRIORITIES = ('urgent', 'high')
+
+_wait_metrics: Dict[str, LatencyMetric] = {}
+
+
+def queue_for_priority(priority: str) -> str:
+    """Return the Celery queue for a Notification.priority value."""
+    return PRIORITY_QUEUES.get(priority, DEFAULT_QUEUE)
+
+
+def whatsapp_queue_for_priority(priority: str) -> str:
+    """Return the WhatsApp worker queue for a Notification.priority value."""
+    return WHATSAPP_URGENT_QUEUE if priority in URGENT_PRIORITIES else WHATSAPP_QUEUE
+
+
+def wait_metric(queue: str) -> LatencyMetric:
+    metric = _wait_metrics.get(queue)
+    if metric is None:
+        metric = _wait_metrics[queue] = LatencyMetric(f"queue_wait:{queue}")
+    return metric
+
+
+def queue_depth(queue: str) -> int:
+    """Messages waiting in a broker queue; 0 if the broker cannot be read."""
+    try:
+        return get_redis().llen(queue)
+    except RedisError as e:
+        logger.debug(f"Error reading depth of {queue}: {e}")
+        return 0
+
+
+def lane_stats() -> Dict[str, Dict]:
+    """Return broker depth and wait-time percentiles for every lane."""
+    try:
+        pipe = get_redis().pipeline()
+        for queue in LANE_QUEUES:
+            pipe.llen(queue)
+        depths = dict(zip(LANE_QUEUES, pipe.execute()))
+    except RedisError as e:
+        logger.error(f"Error reading queue depths: {e}")
+        depths = {}
+
+    return {
+        queue: {
+            'depth': depths.get(queue),
+            'wait': wait_metric(queue).summary(),
+        }
+        for queue in LANE_QUEUES
+    }
+
+
+@before_task_publish.connect
+def _stamp_enqueued_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+
+
+@task_prerun.connect
+def _record_queue_wait(task=None, **kwargs):
+    request = task.request
+    enqueued_at = getattr(request, 'enqueued_at', None) or (getattr(request, 'headers', None) or {}).get('enqueued_at')
+    queue = (request.delivery_info or {}).get('routing_key')
+    if enqueued_at and queue in LANE_QUEUES:
+        wait_metric(queue).observe(max(0.0, time.time() - float(enqueued_at)))
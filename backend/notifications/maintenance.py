@@ -0,0 +1,140 @@
+"""
+Set-based cleanup of sessions, OTPs and AI interaction logs.
+
+Every job works in bounded batches: one statement picks up to
+MAINTENANCE_BATCH_SIZE row ids through an index (FOR UPDATE SKIP LOCKED, so
+it never waits on live traffic), updates or moves them and returns how many
+source rows it touched. Nothing is loaded into Python, a run stops after
+MAINTENANCE_MAX_BATCHES, and the next run carries on where it left off.
+
+Old OTPVerification and AIBotInteraction rows are moved with
+DELETE ... RETURNING into their Archived* tables in the same statement. A
+row whose id is already archived overwrites the archived copy, so a deleted
+row is never dropped.
+The SQL is PostgreSQL-specific, like the rest of the deployment.
+"""
+
+from datetime import timedelta
+from typing import Dict, Optional, Type
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .models import (
+    AIBotInteraction, ArchivedAIBotInteraction, ArchivedOTPVerification,
+    OTPVerification, WhatsAppSession
+)
+from .session_router import reset_session_router
+
+
+def _run_batches(sql: str, params: list, batch_size: int, max_batches: int) -> int:
+    """Run a LIMIT-ed statement selecting its row count until it touches fewer rows than a batch."""
+    total = 0
+    for _ in range(max_batches):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [*params, batch_size])
+            touched = cursor.fetchone()[0]
+        total += touched
+        if touched < batch_size:
+            break
+    return total
+
+
+def _update_in_batches(model: Type[models.Model], set_sql: str, set_params: list, where_sql: str,
+                       where_params: list, batch_size: int, max_batches: int) -> int:
+    table = connection.ops.quote_name(model._meta.db_table)
+    sql = (
+        f"WITH updated AS ("
+        f"UPDATE {table} SET {set_sql} WHERE id IN ("
+        f"SELECT id FROM {table} WHERE {where_sql} LIMIT %s FOR UPDATE SKIP LOCKED"
+        f") RETURNING id"
+        f") SELECT count(*) FROM updated"
+    )
+    return _run_batches(sql, [*set_params, *where_params], batch_size, max_batches)
+
+
+def _archive_in_batches(model: Type[models.Model], archive: Type[models.Model], where_sql: str,
+                        where_params: list, batch_size: int, max_batches: int) -> int:
+    """
+    Move matching rows into the archive table, copying the columns both
+    share. Counts the deleted rows; an id already in the archive is updated.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    archive_table = connection.ops.quote_name(archive._meta.db_table)
+    quoted = [
+        connection.ops.quote_name(field.column)
+        for field in archive._meta.concrete_fields
+        if field.column != 'archived_at'
+    ]
+    columns = ', '.join(quoted)
+    updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in [*quoted, 'archived_at'])
+    sql = (
+        f"WITH moved AS ("
+        f"DELETE FROM {table} WHERE id IN ("
+        f"SELECT id FROM {table} WHERE {where_sql} LIMIT %s FOR UPDATE SKIP LOCKED"
+        f") RETURNING {columns}"
+        f"), archived AS ("
+        f"INSERT INTO {archive_table} ({columns}, archived_at) "
+        f"SELECT {columns}, now() FROM moved "
+        f"ON CONFLICT (id) DO UPDATE SET {updates}"
+        f") SELECT count(*) FROM moved"
+    )
+    return _run_batches(sql, where_params, batch_size, max_batches)
+
+
+def expire_idle_sessions(idle_for: timedelta, batch_size: int, max_batches: int) -> int:
+    now = timezone.now()
+    expired = _update_in_batches(
+        WhatsAppSession,
+        "status = 'expired', updated_at = %s", [now],
+        "status = 'active' AND last_activity < %s", [now - idle_for],
+        batch_size, max_batches
+    )
+    if expired:
+        reset_session_router()
+    return expired
+
+
+def expire_otps(batch_size: int, max_batches: int) -> int:
+    return _update_in_batches(
+        OTPVerification,
+        "status = 'expired'", [],
+        "status IN ('generated', 'sent') AND expires_at < %s", [timezone.now()],
+        batch_size, max_batches
+    )
+
+
+def archive_otps(older_than: timedelta, batch_size: int, max_batches: int) -> int:
+    return _archive_in_batches(
+        OTPVerification, ArchivedOTPVerification,
+        "generated_at < %s", [timezone.now() - older_than],
+        batch_size, max_batches
+    )
+
+
+def archive_ai_interactions(older_than: timedelta, batch_size: int, max_batches: int) -> int:
+    return _archive_in_batches(
+        AIBotInteraction, ArchivedAIBotInteraction,
+        "created_at < %s", [timezone.now() - older_than],
+        batch_size, max_batches
+    )
+
+
+def run_cleanup(batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> Dict[str, int]:
+    """Run every cleanup job once; returns rows touched per job."""
+    batch_size = batch_size or settings.MAINTENANCE_BATCH_SIZE
+    max_batches = max_batches or settings.MAINTENANCE_MAX_BATCHES
+
+    return {
+        'sessions_expired': expire_idle_sessions(
+            timedelta(seconds=settings.WHATSAPP_SESSION_IDLE_EXPIRY), batch_size, max_batches
+        ),
+        'otps_expired': expire_otps(batch_size, max_batches),
+        'otps_archived': archive_otps(
+            timedelta(days=settings.OTP_ARCHIVE_AFTER_DAYS), batch_size, max_batches
+        ),
+        'ai_interactions_archived': archive_ai_interactions(
+            timedelta(days=settings.AI_INTERACTION_ARCHIVE_AFTER_DAYS), batch_size, max_batches
+        ),
+    }
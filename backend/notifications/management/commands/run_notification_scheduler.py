@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from notifications.scheduler import NotificationScheduler
+
+
+class Command(BaseCommand):
+    help = 'Send scheduled notifications at their scheduled_at (replaces the beat sweep)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Notifications loaded and claimed per query',
+        )
+        parser.add_argument(
+            '--lookahead',
+            type=int,
+            help='Seconds of upcoming notifications kept in memory',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            help='Stop after this many seconds (default: run until interrupted)',
+        )
+
+    def handle(self, *args, **options):
+        scheduler = NotificationScheduler(
+            batch_size=options['batch_size'],
+            lookahead=options['lookahead'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Notification scheduler running (lookahead {scheduler.lookahead}s)')
+        )
+
+        try:
+            scheduler.run(stop_after=options['duration'])
+        except KeyboardInterrupt:
+            self.stdout.write('Scheduler stopped')
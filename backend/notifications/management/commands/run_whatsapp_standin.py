@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from notifications.standin import StandInState, WhatsAppWebStandIn, load_reply_rules
+
+
+class Command(BaseCommand):
+    help = 'Serve an offline WhatsApp Web stand-in for load and regression testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Seconds added to every page load and API call',
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0.0,
+            help='Random +/- seconds added to the latency',
+        )
+        parser.add_argument(
+            '--send-latency',
+            type=float,
+            default=0.2,
+            help='Seconds before a sent message shows its single tick',
+        )
+        parser.add_argument(
+            '--deliver-after',
+            type=float,
+            default=1.0,
+            help='Seconds before a sent message shows as delivered',
+        )
+        parser.add_argument(
+            '--read-after',
+            type=float,
+            default=5.0,
+            help='Seconds before a sent message shows as read',
+        )
+        parser.add_argument(
+            '--replies',
+            type=str,
+            help='JSON file of scripted replies: [{"match": regex, "reply": text, "delay": seconds}]',
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=0.5,
+            help='Seconds between page refreshes of the chat state',
+        )
+        parser.add_argument('--verbose-requests', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        state = StandInState(
+            send_latency=options['send_latency'],
+            deliver_after=options['deliver_after'],
+            read_after=options['read_after'],
+            reply_rules=load_reply_rules(options['replies']) if options['replies'] else None,
+        )
+        server = WhatsAppWebStandIn(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            poll=options['poll'],
+            state=state,
+            verbose=options['verbose_requests'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'WhatsApp Web stand-in listening on {server.url}'))
+        self.stdout.write(f'Run workers with WHATSAPP_WEB_URL={server.url}')
+        self.stdout.write(f'{len(state.reply_rules)} scripted reply rules, stats at {server.url}/api/stats')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Stand-in stopped')
+        finally:
+            server.server_close()
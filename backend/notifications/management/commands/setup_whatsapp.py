@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from notifications.services import WhatsAppAutomationService
+from notifications.profiles import get_profile_manager
 from notifications.models import WhatsAppSession, AIBotConfiguration
 import os
 
@@ -80,8 +81,19 @@ class Command(BaseCommand):
         if setup_ai:
             self.setup_ai_bots()
         
-        # Close session
-        whatsapp_service.close_session()
+        if success:
+            # Close the browser cleanly and snapshot the logged-in profile so
+            # workers can restore it without another QR scan
+            whatsapp_service.driver.quit()
+            whatsapp_service.driver = None
+            snapshot = get_profile_manager().snapshot(session, whatsapp_service.profile_dir)
+            if snapshot:
+                self.stdout.write(
+                    self.style.SUCCESS(f'✅ Profile snapshot saved to {snapshot["path"]}')
+                )
+        else:
+            # Close session
+            whatsapp_service.close_session()
 
     def setup_ai_bots(self):
         """Set up AI bot configurations for different purposes."""
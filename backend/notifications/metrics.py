@@ -0,0 +1,72 @@
+"""
+Lightweight latency metrics shared between worker and web processes.
+
+Samples are kept in a capped Redis list per metric so the status API can
+report percentiles for work measured inside the WhatsApp worker. When Redis
+is unreachable the samples fall back to a process-local buffer.
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Dict, List
+
+from redis.exceptions import RedisError
+
+from .redis_store import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyMetric:
+    """Rolling window of latency samples (in seconds) for one operation."""
+
+    def __init__(self, name: str, window: int = 1000):
+        self.name = name
+        self.window = window
+        self.key = f"metrics:latency:{name}"
+        self._local = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """Record one sample."""
+        try:
+            pipe = get_redis().pipeline()
+            pipe.lpush(self.key, f"{seconds:.6f}")
+            pipe.ltrim(self.key, 0, self.window - 1)
+            pipe.execute()
+        except RedisError as e:
+            logger.debug(f"Recording {self.name} latency locally: {e}")
+            with self._lock:
+                self._local.append(seconds)
+
+    def samples(self) -> List[float]:
+        try:
+            return [float(value) for value in get_redis().lrange(self.key, 0, -1)]
+        except RedisError:
+            with self._lock:
+                return list(self._local)
+
+    def summary(self) -> Dict[str, float]:
+        """Return count, mean and p50/p95/p99/max of the current window."""
+        samples = sorted(self.samples())
+        if not samples:
+            return {'count': 0}
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            'count': len(samples),
+            'mean': sum(samples) / len(samples),
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+            'max': samples[-1],
+        }
+
+
+# Full send: chat navigation, typing and delivery confirmation
+whatsapp_send_latency = LatencyMetric('whatsapp_send')
+# ENTER pressed until the outgoing bubble shows a sent tick
+whatsapp_confirm_latency = LatencyMetric('whatsapp_confirm')
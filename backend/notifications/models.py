@@ -89,9 +89,18 @@ class Notification(models.Model):
     # Metadata
     metadata = models.JSONField(default=dict, blank=True)
     
+    # Booking + template type + payload hash, see notifications/idempotency.py
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Scheduler range scan: status='pending' AND scheduled_at <= now
+            models.Index(fields=['status', 'scheduled_at'], name='notification_status_sched_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.notification_id} - {self.recipient.username} - {self.template.name}"
 
@@ -113,6 +122,12 @@ class WhatsAppSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Router reloads (status='active') and the expiry sweep (status, last_activity <)
+            models.Index(fields=['status', 'last_activity'], name='wa_session_status_activity_idx'),
+        ]
+    
     def __str__(self):
         return f"WhatsApp Session - {self.phone_number} - {self.status}"
 
@@ -160,6 +175,28 @@ class WhatsAppMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # InboxScanner.build_index: unanswered approvals per session, oldest first
+            models.Index(
+                fields=['session', 'sent_at'],
+                condition=models.Q(message_type='approval', requires_response=True, user_response='', status='sent'),
+                name='wa_msg_pending_approval_idx'
+            ),
+            # Approval lookups across sessions
+            models.Index(
+                fields=['message_type', 'requires_response', 'user_response', 'status'],
+                name='wa_msg_type_response_idx'
+            ),
+            # Receipt sweep: recent sent/delivered messages per session
+            models.Index(fields=['session', 'status', 'sent_at'], name='wa_msg_session_status_idx'),
+            # Dispatcher claims: status='queued' ordered by created_at
+            models.Index(fields=['created_at'], condition=models.Q(status='queued'), name='wa_msg_queued_idx'),
+            # Receipt flush looks messages up by WhatsApp's id. Not partial:
+            # its IN lists exceed what the planner expands to prove a predicate
+            models.Index(fields=['whatsapp_message_id'], name='wa_msg_whatsapp_id_idx'),
+        ]
+    
     def __str__(self):
         return f"WhatsApp to {self.recipient_phone} - {self.message_type} - {self.status}"
 
@@ -231,6 +268,12 @@ class AIBotInteraction(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Archival scans by age, see notifications/maintenance.py
+            models.Index(fields=['created_at'], name='ai_interaction_created_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.bot_config.name} - {self.interaction_type} - {self.created_at}"
 
@@ -275,5 +318,64 @@ class OTPVerification(models.Model):
     # Metadata
     metadata = models.JSONField(default=dict, blank=True)
     
+    class Meta:
+        indexes = [
+            # OTP verification: live code of a user and type
+            models.Index(fields=['user', 'otp_type', 'status', 'expires_at'], name='otp_user_type_status_idx'),
+            # Expiry sweep only looks at codes that are still outstanding
+            models.Index(
+                fields=['expires_at'],
+                condition=models.Q(status__in=['generated', 'sent']),
+                name='otp_outstanding_expiry_idx'
+            ),
+            # Archival scans by age, see notifications/maintenance.py
+            models.Index(fields=['generated_at'], name='otp_generated_idx'),
+        ]
+    
     def __str__(self):
         return f"OTP {self.otp_code} - {self.user.username} - {self.otp_type}"
+
+
+# Cold copies of old rows, moved by notifications/maintenance.py. Column names
+# match the live tables; foreign keys are plain ids so archived rows outlive
+# their users and bots.
+
+class ArchivedOTPVerification(models.Model):
+    """OTPVerification rows past OTP_ARCHIVE_AFTER_DAYS. The code itself is not kept."""
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField(db_index=True)
+    otp_type = models.CharField(max_length=20)
+    phone_number = models.CharField(max_length=17)
+    status = models.CharField(max_length=20)
+    generated_by_ai = models.BooleanField(default=False)
+    ai_bot_id = models.BigIntegerField(null=True, blank=True)
+    generated_at = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+    verified_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    verification_attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    metadata = models.JSONField(default=dict, blank=True)
+    archived_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Archived OTP {self.id} - {self.otp_type} - {self.status}"
+
+class ArchivedAIBotInteraction(models.Model):
+    """AIBotInteraction rows past AI_INTERACTION_ARCHIVE_AFTER_DAYS."""
+    id = models.BigIntegerField(primary_key=True)
+    bot_config_id = models.BigIntegerField(db_index=True)
+    user_id = models.BigIntegerField(null=True, blank=True)
+    interaction_type = models.CharField(max_length=30)
+    input_text = models.TextField()
+    context_data = models.JSONField(default=dict, blank=True)
+    output_text = models.TextField(blank=True)
+    tokens_used = models.IntegerField(default=0)
+    response_time = models.DecimalField(max_digits=8, decimal_places=3, null=True, blank=True)
+    is_successful = models.BooleanField(default=False)
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Archived interaction {self.id} - {self.interaction_type}"
@@ -0,0 +1,154 @@
+"""
+Redis store for live OTP codes, with atomic verify-and-consume.
+
+When an OTP is sent, an HMAC of its code is stored in a Redis hash per
+(user, otp_type) that expires at OTPVerification.expires_at. Verification is
+one Lua script call: it counts the attempt with HINCRBY, compares the hash
+and marks the code consumed or exhausted, so parallel attempts from a kiosk
+cannot both succeed or exceed max_attempts. The outcome is written back to
+OTPVerification by a Celery task.
+
+If Redis is down, or holds nothing for the user (the OTP predates the store
+or the key was evicted), OTPManager falls back to the database under a row
+lock.
+"""
+
+import hashlib
+import hmac
+import logging
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .models import OTPVerification
+from .redis_store import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'otp:live:'
+
+# KEYS[1]: live OTP hash. ARGV[1]: HMAC of the submitted code.
+# Returns {outcome, otp id, attempts}; outcome is 'missing', 'verified',
+# 'invalid', 'exhausted' or 'consumed'. Verified and exhausted codes stay
+# until the key expires so replays are refused without touching the database.
+VERIFY_SCRIPT = """
+local live = redis.call('HMGET', KEYS[1], 'hash', 'max', 'id', 'state')
+if not live[1] then
+    return {'missing', '', 0}
+end
+if live[4] then
+    return {'consumed', live[3], 0}
+end
+local attempts = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+if attempts > tonumber(live[2]) then
+    redis.call('HSET', KEYS[1], 'state', 'failed')
+    return {'exhausted', live[3], attempts}
+end
+if live[1] == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'state', 'verified')
+    return {'verified', live[3], attempts}
+end
+if attempts == tonumber(live[2]) then
+    redis.call('HSET', KEYS[1], 'state', 'failed')
+    return {'exhausted', live[3], attempts}
+end
+return {'invalid', live[3], attempts}
+"""
+
+
+class VerifyResult(NamedTuple):
+    outcome: str
+    otp_id: Optional[int]
+    attempts: int
+
+    @property
+    def verified(self) -> bool:
+        return self.outcome == 'verified'
+
+
+def _key(user_id: int, otp_type: str) -> str:
+    return f"{KEY_PREFIX}{user_id}:{otp_type}"
+
+
+def _code_hash(user_id: int, otp_type: str, code: str) -> str:
+    message = f"{user_id}:{otp_type}:{code.strip()}".encode('utf-8')
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+class OTPStore:
+    """Live OTP hashes in Redis, one per user and OTP type."""
+
+    def __init__(self):
+        self._script = None
+
+    def store(self, otp: OTPVerification) -> bool:
+        """Make a sent OTP verifiable, replacing any earlier code of the same type."""
+        key = _key(otp.user_id, otp.otp_type)
+        try:
+            pipe = get_redis().pipeline(transaction=True)
+            pipe.delete(key)
+            pipe.hset(key, mapping={
+                'hash': _code_hash(otp.user_id, otp.otp_type, otp.otp_code),
+                'id': otp.pk,
+                'max': otp.max_attempts,
+                'attempts': otp.verification_attempts,
+            })
+            pipe.pexpireat(key, int(otp.expires_at.timestamp() * 1000))
+            pipe.execute()
+            return True
+        except RedisError as e:
+            logger.warning(f"Could not cache OTP {otp.pk}, verification will use the database: {e}")
+            return False
+
+    def discard(self, user_id: int, otp_type: str):
+        """Forget the live code, e.g. when it is superseded by a resend."""
+        try:
+            get_redis().delete(_key(user_id, otp_type))
+        except RedisError as e:
+            logger.debug(f"Could not discard cached OTP: {e}")
+
+    def verify(self, user_id: int, otp_type: str, code: str) -> Optional[VerifyResult]:
+        """
+        Count one attempt and consume the code if it matches. Returns None
+        when Redis is unavailable, so the caller can fall back to the database.
+        """
+        try:
+            if self._script is None:
+                self._script = get_redis().register_script(VERIFY_SCRIPT)
+            outcome, otp_id, attempts = self._script(
+                keys=[_key(user_id, otp_type)],
+                args=[_code_hash(user_id, otp_type, code)]
+            )
+        except RedisError as e:
+            logger.warning(f"OTP store unavailable, verifying against the database: {e}")
+            return None
+
+        return VerifyResult(outcome, int(otp_id) if otp_id else None, int(attempts))
+
+
+def record_verify_result(result: VerifyResult):
+    """Apply a Redis verification outcome to its OTPVerification row."""
+    if not result.otp_id or result.outcome in ('missing', 'consumed'):
+        return
+
+    live = OTPVerification.objects.filter(pk=result.otp_id, status='sent')
+    if result.outcome == 'verified':
+        live.update(status='verified', verified_at=timezone.now(), verification_attempts=result.attempts)
+    elif result.outcome == 'exhausted':
+        live.update(status='failed', verification_attempts=result.attempts)
+    else:
+        # Updates can arrive out of order; attempts only move forward
+        live.filter(verification_attempts__lt=result.attempts).update(verification_attempts=result.attempts)
+
+
+_store: Optional[OTPStore] = None
+
+
+def get_otp_store() -> OTPStore:
+    """Return the process-wide OTP store."""
+    global _store
+    if _store is None:
+        _store = OTPStore()
+    return _store
@@ -0,0 +1,228 @@
+"""
+Per-session Chrome profiles for WhatsApp Web, with snapshot and restore.
+
+Every (session, worker process) pair gets its own --user-data-dir, so
+workers no longer fight over one profile and a crash only damages the
+crashed worker's copy. Once a session is logged in, its profile is archived
+to WHATSAPP_PROFILE_SNAPSHOT_ROOT (caches and lock files left out) and the
+archive is recorded in WhatsAppSession.session_data['profile_snapshot'].
+A worker starting a session it has no profile for restores the latest
+snapshot instead of asking for a new QR scan.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import socket
+import tarfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import WhatsAppSession
+
+logger = logging.getLogger(__name__)
+
+# Regenerated by Chrome and not needed to stay logged in
+EXCLUDED_DIRS = (
+    'Cache', 'Code Cache', 'GPUCache', 'GrShaderCache', 'ShaderCache',
+    'DawnCache', 'Crashpad', 'BrowserMetrics', 'CacheStorage', 'ScriptCache',
+)
+LOCK_FILES = ('SingletonLock', 'SingletonCookie', 'SingletonSocket', 'lockfile')
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ChromeProfileManager:
+    """Creates, snapshots and restores per-session Chrome profile directories."""
+
+    def __init__(self, root: Optional[str] = None, snapshot_root: Optional[str] = None,
+                 keep: Optional[int] = None):
+        self.root = root or settings.WHATSAPP_PROFILE_ROOT
+        self.snapshot_root = snapshot_root or settings.WHATSAPP_PROFILE_SNAPSHOT_ROOT
+        self.keep = keep or settings.WHATSAPP_PROFILE_SNAPSHOTS_KEPT
+        self.hostname = socket.gethostname()
+        self._lock = threading.Lock()
+
+    def profile_dir(self, session: WhatsAppSession) -> str:
+        """Profile directory of a session for this worker process."""
+        return os.path.join(self.root, session.session_id, f"{self.hostname}-{os.getpid()}")
+
+    def prepare(self, session: WhatsAppSession) -> str:
+        """
+        Return a ready profile directory for the session, restoring the
+        latest snapshot when this worker has none yet.
+        """
+        path = self.profile_dir(session)
+        with self._lock:
+            self.purge_stale(session)
+
+            if not os.path.isdir(os.path.join(path, 'Default')):
+                # Another worker may have taken a newer snapshot since this row was loaded
+                session.refresh_from_db(fields=['session_data'])
+                if not self.restore(session, path):
+                    os.makedirs(path, exist_ok=True)
+
+            # A crashed Chrome leaves its singleton locks behind
+            for name in LOCK_FILES:
+                lock = os.path.join(path, name)
+                if os.path.lexists(lock):
+                    os.remove(lock)
+        return path
+
+    def scratch_dir(self) -> str:
+        """Throwaway profile for a driver that is not bound to a session yet."""
+        path = os.path.join(self.root, '_scratch', f"{self.hostname}-{os.getpid()}")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def discard(self, session: WhatsAppSession):
+        """Delete this worker's profile, e.g. after it stopped loading WhatsApp Web."""
+        shutil.rmtree(self.profile_dir(session), ignore_errors=True)
+
+    def purge_stale(self, session: WhatsAppSession):
+        """Delete profiles left on this host by worker processes that have exited."""
+        session_root = os.path.join(self.root, session.session_id)
+        if not os.path.isdir(session_root):
+            return
+
+        for name in os.listdir(session_root):
+            host, _, pid = name.rpartition('-')
+            if host == self.hostname and pid.isdigit() and not _pid_alive(int(pid)):
+                shutil.rmtree(os.path.join(session_root, name), ignore_errors=True)
+
+    def _filter(self, tarinfo: tarfile.TarInfo) -> Optional[tarfile.TarInfo]:
+        parts = tarinfo.name.split('/')
+        if any(part in EXCLUDED_DIRS for part in parts) or parts[-1] in LOCK_FILES:
+            return None
+        return tarinfo
+
+    def snapshot(self, session: WhatsAppSession, path: Optional[str] = None) -> Optional[Dict]:
+        """
+        Archive a logged-in profile and record it on the session.
+        The browser using the profile should be closed first.
+        """
+        path = path or self.profile_dir(session)
+        if not os.path.isdir(os.path.join(path, 'Default')):
+            return None
+
+        os.makedirs(self.snapshot_root, exist_ok=True)
+        archive = os.path.join(self.snapshot_root, f"{session.session_id}-{int(time.time())}.tar.gz")
+        partial = f"{archive}.partial"
+
+        started = time.monotonic()
+        with tarfile.open(partial, 'w:gz') as tar:
+            tar.add(path, arcname='.', filter=self._filter)
+        os.replace(partial, archive)
+
+        meta = {
+            'path': archive,
+            'sha256': _sha256(archive),
+            'size': os.path.getsize(archive),
+            'created_at': timezone.now().isoformat(),
+            'source': f"{self.hostname}-{os.getpid()}",
+        }
+
+        with transaction.atomic():
+            locked = WhatsAppSession.objects.select_for_update().get(pk=session.pk)
+            locked.session_data = {**locked.session_data, 'profile_snapshot': meta}
+            locked.save(update_fields=['session_data', 'updated_at'])
+        session.session_data = locked.session_data
+
+        self._prune(session)
+        logger.info(
+            f"Snapshot of session {session.session_id} profile: {meta['size']} bytes "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+        return meta
+
+    def snapshot_if_stale(self, session: WhatsAppSession, path: Optional[str] = None) -> Optional[Dict]:
+        """Snapshot unless the session has one newer than WHATSAPP_PROFILE_SNAPSHOT_INTERVAL."""
+        meta = session.session_data.get('profile_snapshot')
+        if meta:
+            age = (timezone.now() - datetime.fromisoformat(meta['created_at'])).total_seconds()
+            if age < settings.WHATSAPP_PROFILE_SNAPSHOT_INTERVAL:
+                return None
+        try:
+            return self.snapshot(session, path)
+        except (OSError, tarfile.TarError) as e:
+            logger.error(f"Error snapshotting profile of session {session.session_id}: {e}")
+            return None
+
+    def restore(self, session: WhatsAppSession, path: str) -> bool:
+        """Unpack the session's latest snapshot into path. Returns False if there is none."""
+        meta = session.session_data.get('profile_snapshot')
+        if not meta or not os.path.exists(meta['path']):
+            return False
+
+        if _sha256(meta['path']) != meta['sha256']:
+            logger.error(f"Snapshot {meta['path']} of session {session.session_id} is corrupt")
+            return False
+
+        staging = f"{path}.restoring"
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            with tarfile.open(meta['path'], 'r:gz') as tar:
+                if hasattr(tarfile, 'data_filter'):
+                    tar.extractall(staging, filter='data')
+                else:
+                    tar.extractall(staging)
+        except (OSError, tarfile.TarError) as e:
+            logger.error(f"Error restoring profile of session {session.session_id}: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(staging, path)
+        logger.info(f"Restored session {session.session_id} profile from {meta['created_at']} snapshot")
+        return True
+
+    def _prune(self, session: WhatsAppSession):
+        prefix = f"{session.session_id}-"
+        archives = sorted(
+            (
+                name for name in os.listdir(self.snapshot_root)
+                if name.startswith(prefix) and name.endswith('.tar.gz')
+                and name[len(prefix):-len('.tar.gz')].isdigit()
+            ),
+            key=lambda name: int(name[len(prefix):-len('.tar.gz')])
+        )
+        for name in archives[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.snapshot_root, name))
+            except OSError as e:
+                logger.warning(f"Could not remove old snapshot {name}: {e}")
+
+
+_manager: Optional[ChromeProfileManager] = None
+
+
+def get_profile_manager() -> ChromeProfileManager:
+    """Return the process-wide profile manager."""
+    global _manager
+    if _manager is None:
+        _manager = ChromeProfileManager()
+    return _manager
@@ -0,0 +1,171 @@
+"""
+Token-bucket rate limiting for WhatsApp sends.
+
+Every send takes one token from three buckets at once: global, per session
+(business number) and per recipient. Buckets live in Redis and are updated
+by a single Lua script, so all workers share them and a send either takes
+from all three or from none. When Redis is unreachable each process falls
+back to its own in-memory buckets.
+
+Callers get back how long to wait instead of a hard refusal, so the batch
+dispatcher can pace sends and put the rest back in the queue rather than
+drop them.
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_store import get_redis
+from .session_router import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# KEYS: bucket keys. ARGV: now, then (rate, capacity) per key.
+# Returns {index of the bucket that blocked (0 if none), wait seconds}.
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local blocked = 0
+local wait = 0
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        local needed = (1 - tokens) / rate
+        if needed > wait then
+            wait = needed
+            blocked = i
+        end
+    end
+end
+if blocked == 0 then
+    for i = 1, #KEYS do
+        local rate = tonumber(ARGV[i * 2])
+        local capacity = tonumber(ARGV[i * 2 + 1])
+        redis.call('HSET', KEYS[i], 'tokens', levels[i] - 1, 'ts', now)
+        redis.call('EXPIRE', KEYS[i], math.ceil(capacity / rate) + 1)
+    end
+end
+return {blocked, tostring(wait)}
+"""
+
+
+class Bucket(NamedTuple):
+    scope: str
+    key: str
+    rate: float  # tokens per second
+    capacity: float
+
+
+class LocalBuckets:
+    """Process-local token buckets, used while Redis is down."""
+
+    def __init__(self):
+        self._levels: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets: List[Bucket], now: float) -> Tuple[Optional[str], float]:
+        with self._lock:
+            levels = []
+            blocked, wait = None, 0.0
+            for bucket in buckets:
+                tokens, ts = self._levels.get(bucket.key, (bucket.capacity, now))
+                tokens = min(bucket.capacity, tokens + max(0.0, now - ts) * bucket.rate)
+                levels.append(tokens)
+                if tokens < 1 and (1 - tokens) / bucket.rate > wait:
+                    blocked, wait = bucket.scope, (1 - tokens) / bucket.rate
+
+            if blocked is None:
+                for bucket, tokens in zip(buckets, levels):
+                    self._levels[bucket.key] = (tokens - 1, now)
+            return blocked, wait
+
+
+class WhatsAppRateLimiter:
+    """Global, per-session and per-recipient send limits from WHATSAPP_RATE_LIMITS."""
+
+    def __init__(self, limits: Optional[Dict[str, Dict]] = None):
+        self.limits = limits if limits is not None else settings.WHATSAPP_RATE_LIMITS
+        self._local = LocalBuckets()
+        self._script = None
+
+    def buckets(self, session_id: str, phone_number: str) -> List[Bucket]:
+        ids = {
+            'global': 'all',
+            'session': session_id,
+            'recipient': normalize_phone(phone_number),
+        }
+        buckets = []
+        for scope, limit in self.limits.items():
+            if not limit.get('per_minute'):
+                continue
+            rate = limit['per_minute'] / 60.0
+            buckets.append(Bucket(
+                scope=scope,
+                key=f"whatsapp:rate:{scope}:{ids[scope]}",
+                rate=rate,
+                capacity=max(1, limit.get('burst', 1)),
+            ))
+        return buckets
+
+    def acquire(self, session_id: str, phone_number: str) -> Tuple[Optional[str], float]:
+        """
+        Try to take a token for one send.
+        Returns (None, 0) on success, otherwise (blocking scope, seconds to wait).
+        """
+        buckets = self.buckets(session_id, phone_number)
+        if not buckets:
+            return None, 0.0
+
+        now = time.time()
+        try:
+            if self._script is None:
+                self._script = get_redis().register_script(TAKE_SCRIPT)
+            args = [now]
+            for bucket in buckets:
+                args.extend((bucket.rate, bucket.capacity))
+            blocked, wait = self._script(keys=[bucket.key for bucket in buckets], args=args)
+        except RedisError as e:
+            logger.debug(f"Rate limiter using local buckets: {e}")
+            return self._local.take(buckets, now)
+
+        blocked = int(blocked)
+        return (buckets[blocked - 1].scope if blocked else None), float(wait)
+
+    def wait(self, session_id: str, phone_number: str, max_wait: Optional[float] = None) -> bool:
+        """
+        Block until a send is allowed. Returns False without taking a token
+        if that would take longer than max_wait seconds.
+        """
+        max_wait = settings.WHATSAPP_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            scope, delay = self.acquire(session_id, phone_number)
+            if scope is None:
+                return True
+            if time.monotonic() + delay > deadline:
+                logger.warning(f"WhatsApp {scope} rate limit reached for {phone_number}")
+                return False
+            time.sleep(math.ceil(delay * 1000) / 1000)
+
+
+_limiter: Optional[WhatsAppRateLimiter] = None
+
+
+def get_rate_limiter() -> WhatsAppRateLimiter:
+    """Return the process-wide rate limiter."""
+    global _limiter
+    if _limiter is None:
+        _limiter = WhatsAppRateLimiter()
+    return _limiter
@@ -0,0 +1,206 @@
+"""
+Buffered ingestion of delivery and read receipts.
+
+Receipts come from WhatsApp ticks scraped while a chat is open, from
+transports posting provider callbacks and from the notification websocket
+('mark_read'). They are appended to a Redis list instead of saved one by one;
+flush_receipts() drains the buffer every few seconds, advances
+Notification and WhatsAppMessage statuses (sent -> delivered -> read, never
+backwards) with bulk_update, and publishes the changes to each recipient's
+NotificationConsumer group.
+"""
+
+import json
+import logging
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .models import Notification, WhatsAppMessage
+from .redis_store import get_redis
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = 'notifications:receipts'
+
+STATUS_RANK = {'sent': 1, 'delivered': 2, 'read': 3}
+
+# Receipts recorded while Redis is unreachable; flushed by the same process
+_local_buffer = deque(maxlen=10000)
+_local_lock = threading.Lock()
+
+
+def receipt_error(receipt: Dict) -> Optional[str]:
+    """Why a receipt cannot be buffered, or None if it is valid."""
+    if receipt.get('status') not in STATUS_RANK:
+        return f"status must be one of {', '.join(STATUS_RANK)}"
+    if not (receipt.get('notification_id') or receipt.get('whatsapp_message_id')):
+        return 'notification_id or whatsapp_message_id is required'
+    if receipt.get('whatsapp_message_id') and not isinstance(receipt['whatsapp_message_id'], str):
+        return 'whatsapp_message_id must be a string'
+    if receipt.get('notification_id'):
+        try:
+            uuid.UUID(str(receipt['notification_id']))
+        except ValueError:
+            return 'notification_id must be a UUID'
+    return None
+
+
+def record_receipt(status: str, notification_id: str = None, whatsapp_message_id: str = None,
+                   at: Optional[datetime] = None) -> int:
+    """Buffer one receipt; status is 'delivered' or 'read'. Returns 1 if it was valid."""
+    return record_receipts([{
+        'status': status,
+        'notification_id': notification_id,
+        'whatsapp_message_id': whatsapp_message_id,
+        'at': at,
+    }])
+
+
+def record_receipts(receipts: Iterable[Dict]) -> int:
+    """Buffer several receipts with one round trip; invalid ones are dropped. Returns the number buffered."""
+    now = timezone.now()
+    payloads = [
+        json.dumps({
+            'status': receipt['status'],
+            'notification_id': str(uuid.UUID(str(receipt['notification_id']))) if receipt.get('notification_id') else None,
+            'whatsapp_message_id': receipt.get('whatsapp_message_id') or None,
+            'at': (receipt.get('at') or now).isoformat(),
+        })
+        for receipt in receipts
+        if receipt_error(receipt) is None
+    ]
+    if not payloads:
+        return 0
+
+    try:
+        get_redis().rpush(BUFFER_KEY, *payloads)
+    except RedisError as e:
+        logger.debug(f"Buffering receipts locally: {e}")
+        with _local_lock:
+            _local_buffer.extend(payloads)
+    return len(payloads)
+
+
+def _parse(payload: str) -> Optional[Dict]:
+    """Decode a buffered receipt; None for one that cannot be applied."""
+    try:
+        receipt = json.loads(payload)
+        if receipt_error(receipt) is None:
+            return {
+                'status': receipt['status'],
+                'notification_id': receipt.get('notification_id'),
+                'whatsapp_message_id': receipt.get('whatsapp_message_id'),
+                'at': datetime.fromisoformat(receipt['at']),
+            }
+    except (ValueError, TypeError, KeyError, AttributeError):
+        pass
+    logger.warning(f"Skipping malformed receipt: {payload!r}")
+    return None
+
+
+def _drain(limit: int) -> List[Dict]:
+    with _local_lock:
+        payloads = [_local_buffer.popleft() for _ in range(min(limit, len(_local_buffer)))]
+
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.lrange(BUFFER_KEY, 0, limit - len(payloads) - 1)
+        pipe.ltrim(BUFFER_KEY, limit - len(payloads), -1)
+        payloads.extend(pipe.execute()[0])
+    except RedisError as e:
+        logger.debug(f"Receipt buffer unavailable: {e}")
+
+    # Already trimmed from the buffer, so one bad entry must not fail the batch
+    return [receipt for receipt in map(_parse, payloads) if receipt]
+
+
+def _advance(obj, status: str, at: datetime) -> bool:
+    """Move obj forward to status; returns True if anything changed."""
+    changed = False
+    if status in ('delivered', 'read') and not obj.delivered_at:
+        obj.delivered_at = at
+        changed = True
+    if status == 'read' and not obj.read_at:
+        obj.read_at = at
+        changed = True
+    if obj.status in STATUS_RANK and STATUS_RANK[status] > STATUS_RANK[obj.status]:
+        obj.status = status
+        changed = True
+    return changed
+
+
+def flush_receipts(limit: Optional[int] = None) -> int:
+    """Apply buffered receipts in bulk and publish them. Returns receipts applied."""
+    receipts = _drain(limit or settings.NOTIFICATION_RECEIPT_BATCH_SIZE)
+    if not receipts:
+        return 0
+
+    messages = WhatsAppMessage.objects.filter(
+        whatsapp_message_id__in={r['whatsapp_message_id'] for r in receipts if r['whatsapp_message_id']}
+    ).select_related('notification').in_bulk(field_name='whatsapp_message_id')
+    notifications = Notification.objects.filter(
+        notification_id__in={r['notification_id'] for r in receipts if r['notification_id']}
+    ).in_bulk(field_name='notification_id')
+    notifications = {str(key): value for key, value in notifications.items()}
+
+    changed_messages = {}
+    changed_notifications = {}
+    for receipt in receipts:
+        at = receipt['at']
+        message = messages.get(receipt['whatsapp_message_id'])
+        notification = message.notification if message else notifications.get(receipt['notification_id'])
+
+        if message and _advance(message, receipt['status'], at):
+            changed_messages[message.pk] = message
+        if notification and _advance(notification, receipt['status'], at):
+            changed_notifications[notification.pk] = notification
+
+    now = timezone.now()
+    for obj in [*changed_messages.values(), *changed_notifications.values()]:
+        obj.updated_at = now
+
+    with transaction.atomic():
+        WhatsAppMessage.objects.bulk_update(
+            changed_messages.values(), ['status', 'delivered_at', 'read_at', 'updated_at']
+        )
+        Notification.objects.bulk_update(
+            changed_notifications.values(), ['status', 'delivered_at', 'read_at', 'updated_at']
+        )
+
+    publish_status_updates(changed_notifications.values())
+    return len(receipts)
+
+
+def publish_status_updates(notifications: Iterable[Notification]):
+    """Send status changes to each recipient's NotificationConsumer group."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    by_recipient: Dict[int, List[Dict]] = {}
+    for notification in notifications:
+        by_recipient.setdefault(notification.recipient_id, []).append({
+            'notification_id': str(notification.notification_id),
+            'status': notification.status,
+            'delivered_at': notification.delivered_at.isoformat() if notification.delivered_at else None,
+            'read_at': notification.read_at.isoformat() if notification.read_at else None,
+        })
+
+    for recipient_id, updates in by_recipient.items():
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f'notifications_{recipient_id}',
+                {'type': 'notification_status', 'updates': updates}
+            )
+        except Exception as e:
+            logger.error(f"Error publishing status updates for user {recipient_id}: {e}")
@@ -0,0 +1,27 @@
+"""
+Shared Redis connection for notification hot paths (metrics, rate limits,
+dedupe keys, OTP state).
+"""
+
+import threading
+
+import redis
+from django.conf import settings
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis() -> redis.Redis:
+    """Return the process-wide Redis client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    settings.REDIS_URL,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    decode_responses=True,
+                )
+    return _client
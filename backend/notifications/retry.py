@@ -0,0 +1,76 @@
+"""
+Retry scheduling for failed notifications.
+
+A failed send is not retried in place: the notification goes back to
+'pending' with scheduled_at set to an exponential backoff (with jitter), and
+the notification scheduler re-enqueues it once due. Once retry_count reaches
+max_retries the notification stays 'failed' and shows up in the dead-letter
+view.
+"""
+
+import logging
+import random
+from datetime import timedelta
+from typing import Iterable, Tuple
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(retry_count: int) -> float:
+    """
+    Seconds to wait before retry number retry_count + 1.
+    Equal jitter: half the exponential delay is fixed, half is random.
+    """
+    delay = min(
+        settings.NOTIFICATION_RETRY_MAX_DELAY,
+        settings.NOTIFICATION_RETRY_BASE_DELAY * (2 ** retry_count)
+    )
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def schedule_retries(notifications: Iterable[Notification], error: str = '') -> Tuple[int, int]:
+    """
+    Reschedule failed notifications, or dead-letter those out of retries.
+    Returns (scheduled, dead_lettered).
+    """
+    now = timezone.now()
+    scheduled = dead = 0
+    notifications = list(notifications)
+
+    for notification in notifications:
+        if error:
+            notification.error_message = error
+        notification.updated_at = now
+
+        if notification.retry_count >= notification.max_retries:
+            notification.status = 'failed'
+            notification.scheduled_at = None
+            dead += 1
+        else:
+            notification.status = 'pending'
+            notification.scheduled_at = now + timedelta(seconds=retry_delay(notification.retry_count))
+            notification.retry_count += 1
+            scheduled += 1
+
+    Notification.objects.bulk_update(
+        notifications,
+        ['status', 'scheduled_at', 'retry_count', 'error_message', 'updated_at']
+    )
+
+    if dead:
+        logger.warning(f"{dead} notifications exhausted their retries")
+    return scheduled, dead
+
+
+def dead_letter_queryset():
+    """Notifications that failed and have no retries left."""
+    return Notification.objects.filter(
+        status='failed',
+        retry_count__gte=F('max_retries')
+    )
@@ -0,0 +1,166 @@
+"""
+Dispatch of notifications at their Notification.scheduled_at.
+
+Scheduled notifications (collection reminders, backoff retries) are stored
+as 'pending' rows with a scheduled_at and no Celery ETA task. The scheduler
+reads them by index range on (status, scheduled_at) in bounded batches and
+hands due ones to the send pipeline on their priority lane.
+
+A claimed row keeps status 'pending' but loses its scheduled_at, so a
+concurrent scheduler cannot claim it again and the send task accepts it.
+"""
+
+import heapq
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+
+def _group_by_priority(rows: Iterable[Tuple[int, str, str]]) -> Dict[str, List[str]]:
+    by_priority: Dict[str, List[str]] = {}
+    for _, notification_id, priority in rows:
+        by_priority.setdefault(priority, []).append(str(notification_id))
+    return by_priority
+
+
+def claim_due_notifications(limit: int, ids: Optional[Iterable[int]] = None) -> Dict[str, List[str]]:
+    """
+    Claim pending notifications whose scheduled_at has passed, oldest first,
+    grouped by priority. Restrict to ids when given.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = Notification.objects.select_for_update(skip_locked=True).filter(
+            status='pending',
+            scheduled_at__lte=now
+        )
+        if ids is not None:
+            due = due.filter(id__in=list(ids))
+        rows = list(due.order_by('scheduled_at').values_list('id', 'notification_id', 'priority')[:limit])
+
+        Notification.objects.filter(id__in=[row[0] for row in rows]).update(
+            scheduled_at=None,
+            updated_at=now
+        )
+
+    return _group_by_priority(rows)
+
+
+def enqueue_notifications(by_priority: Dict[str, List[str]]) -> int:
+    """Enqueue send tasks in chunks on each priority's lane."""
+    from .lanes import queue_for_priority
+    from .tasks import send_notifications_batch_task
+
+    chunk_size = settings.NOTIFICATION_SEND_CHUNK_SIZE
+    for priority, notification_ids in by_priority.items():
+        for start in range(0, len(notification_ids), chunk_size):
+            send_notifications_batch_task.apply_async(
+                args=(notification_ids[start:start + chunk_size],),
+                queue=queue_for_priority(priority)
+            )
+    return sum(len(ids) for ids in by_priority.values())
+
+
+def dispatch_due_notifications(batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> int:
+    """Claim and enqueue everything due now, in bounded batches."""
+    batch_size = batch_size or settings.NOTIFICATION_SCHEDULER_BATCH_SIZE
+    max_batches = max_batches or settings.NOTIFICATION_SCHEDULER_MAX_BATCHES
+
+    dispatched = 0
+    for _ in range(max_batches):
+        claimed = enqueue_notifications(claim_due_notifications(batch_size))
+        dispatched += claimed
+        if claimed < batch_size:
+            break
+    return dispatched
+
+
+class NotificationScheduler:
+    """
+    Long-running scheduler with an in-memory min-heap of upcoming sends.
+
+    Every refill reads the next lookahead window from the database; the loop
+    then sleeps until the earliest entry is due, so sends go out on time
+    without polling the table every second. Entries are only hints: rows are
+    re-checked when claimed, so cancelled or rescheduled notifications are
+    skipped and picked up again by a later refill.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, lookahead: Optional[int] = None,
+                 max_sleep: float = 5.0):
+        self.batch_size = batch_size or settings.NOTIFICATION_SCHEDULER_BATCH_SIZE
+        self.lookahead = lookahead or settings.NOTIFICATION_SCHEDULER_LOOKAHEAD
+        self.max_sleep = max_sleep
+        self._heap: List[Tuple[float, int]] = []
+        self._known: Set[int] = set()
+        self._refilled_at = 0.0
+
+    def refill(self) -> int:
+        """Load upcoming notifications within the lookahead window."""
+        horizon = timezone.now() + timedelta(seconds=self.lookahead)
+        upcoming = (
+            Notification.objects
+            .filter(status='pending', scheduled_at__lte=horizon)
+            .exclude(id__in=self._known)
+            .order_by('scheduled_at')
+            .values_list('id', 'scheduled_at')[:self.batch_size]
+        )
+
+        added = 0
+        for pk, scheduled_at in upcoming:
+            heapq.heappush(self._heap, (scheduled_at.timestamp(), pk))
+            self._known.add(pk)
+            added += 1
+
+        self._refilled_at = time.monotonic()
+        return added
+
+    def pop_due(self, now: float) -> List[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, pk = heapq.heappop(self._heap)
+            self._known.discard(pk)
+            due.append(pk)
+        return due
+
+    def tick(self) -> int:
+        """Refill when stale, then dispatch whatever is due. Returns notifications enqueued."""
+        if not self._heap or time.monotonic() - self._refilled_at >= self.lookahead / 2:
+            self.refill()
+
+        due = self.pop_due(time.time())
+        dispatched = 0
+        for start in range(0, len(due), self.batch_size):
+            dispatched += enqueue_notifications(
+                claim_due_notifications(self.batch_size, ids=due[start:start + self.batch_size])
+            )
+        return dispatched
+
+    def next_wakeup(self) -> float:
+        """Seconds until the earliest known entry, capped at max_sleep."""
+        if not self._heap:
+            return self.max_sleep
+        return max(0.0, min(self.max_sleep, self._heap[0][0] - time.time()))
+
+    def run(self, stop_after: Optional[float] = None):
+        """Run until interrupted, or for stop_after seconds."""
+        started = time.monotonic()
+        while stop_after is None or time.monotonic() - started < stop_after:
+            try:
+                dispatched = self.tick()
+                if dispatched:
+                    logger.info(f"Dispatched {dispatched} scheduled notifications")
+            except Exception as e:
+                logger.error(f"Error dispatching scheduled notifications: {e}")
+                self._heap.clear()
+                self._known.clear()
+            time.sleep(self.next_wakeup())
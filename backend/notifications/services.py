@@ -1,7 +1,7 @@
 import time
-import random
-import string
 import logging
+import functools
+from collections import deque
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from selenium import webdriver
@@ -10,7 +10,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 from django.conf import settings
 from django.utils import timezone
@@ -23,9 +23,46 @@ from .models import (
     WhatsAppSession, WhatsAppMessage, AIBotConfiguration, 
     AIBotInteraction, OTPVerification, Notification
 )
+from .retry import schedule_retries
+from .dom import read_chat
+from .coalesce import hold_for_digest, merge_digests
+from .supervisor import REVIVAL_KEY
 
 logger = logging.getLogger(__name__)
 
+# Id and tick state of the newest outgoing message bubble, in one round trip.
+# arguments[0] is the CSS selector that marks a bubble as confirmed.
+LAST_OUTGOING_MESSAGE_JS = """
+var bubbles = document.querySelectorAll('.message-out');
+if (!bubbles.length) { return null; }
+var last = bubbles[bubbles.length - 1];
+var holder = last.closest('[data-id]') || last.querySelector('[data-id]');
+return {
+    id: holder ? holder.getAttribute('data-id') : null,
+    confirmed: !!last.querySelector(arguments[0])
+};
+"""
+
+# NotificationTemplate.template_type -> WhatsAppMessage.message_type
+WHATSAPP_MESSAGE_TYPES = {
+    'otp_verification': 'otp',
+    'parcel_approval': 'approval',
+    'collection_reminder': 'reminder',
+    'booking_confirmation': 'confirmation',
+    'payment_confirmation': 'confirmation',
+}
+
+
+@functools.lru_cache(maxsize=1)
+def get_chrome_driver_path() -> str:
+    """
+    Resolve the chromedriver binary once per process.
+    ChromeDriverManager().install() hits the network and the disk cache on
+    every call, so the result is memoized.
+    """
+    return settings.CHROME_DRIVER_PATH or ChromeDriverManager().install()
+
+
 class WhatsAppAutomationService:
     """
     WhatsApp Web automation service using Selenium for sending messages,
@@ -35,10 +72,20 @@ class WhatsAppAutomationService:
     def __init__(self):
         self.driver = None
         self.session = None
+        self.profile_dir = None
         self.wait_timeout = 30
+        self.last_sent_message_id = ''
+        self.last_send_latency = None
+        self.send_latencies = deque(maxlen=20)
+        
+    def initialize_driver(self, headless: bool = True, profile_dir: Optional[str] = None) -> webdriver.Chrome:
+        """
+        Initialize Chrome WebDriver with appropriate options.
+        Uses the session's own profile directory (restored from its latest
+        snapshot if needed) unless profile_dir is given.
+        """
+        from .profiles import get_profile_manager
         
-    def initialize_driver(self, headless: bool = True) -> webdriver.Chrome:
-        """Initialize Chrome WebDriver with appropriate options."""
         chrome_options = Options()
         
         if headless:
@@ -51,15 +98,44 @@ class WhatsAppAutomationService:
         chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
         
         # Add user data directory for session persistence
-        chrome_options.add_argument(f"--user-data-dir=/tmp/whatsapp_session")
+        if profile_dir is None:
+            manager = get_profile_manager()
+            profile_dir = manager.prepare(self.session) if self.session else manager.scratch_dir()
+        self.profile_dir = profile_dir
+        chrome_options.add_argument(f"--user-data-dir={profile_dir}")
         
         self.driver = webdriver.Chrome(
-            service=webdriver.chrome.service.Service(ChromeDriverManager().install()),
+            service=webdriver.chrome.service.Service(get_chrome_driver_path()),
             options=chrome_options
         )
         
         return self.driver
     
+    def is_driver_alive(self) -> bool:
+        """Check whether the browser behind the driver still responds."""
+        if not self.driver:
+            return False
+        
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+    
+    def open_whatsapp_web(self) -> bool:
+        """
+        Load WhatsApp Web and wait for the chat list of a logged-in session.
+        Used to warm up a driver before it starts taking jobs.
+        """
+        try:
+            self.driver.get(settings.WHATSAPP_WEB_URL)
+            wait = WebDriverWait(self.driver, self.wait_timeout)
+            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='chat-list']")))
+            return True
+        except TimeoutException:
+            logger.error("WhatsApp Web chat list did not load, session may need a QR scan")
+            return False
+    
     def create_session(self, phone_number: str) -> WhatsAppSession:
         """Create a new WhatsApp session."""
         session_id = f"wa_session_{phone_number}_{int(time.time())}"
@@ -79,10 +155,11 @@ class WhatsAppAutomationService:
         Returns True if login successful, False otherwise.
         """
         try:
+            self.session = session
             if not self.driver:
                 self.initialize_driver(headless=False)  # Need to see QR code
             
-            self.driver.get("https://web.whatsapp.com")
+            self.driver.get(settings.WHATSAPP_WEB_URL)
             
             # Wait for QR code to appear
             wait = WebDriverWait(self.driver, self.wait_timeout)
@@ -122,6 +199,8 @@ class WhatsAppAutomationService:
                 except TimeoutException:
                     session.status = 'error'
                     session.error_message = "QR code scan timeout"
+                    # Needs a person, not the supervisor's automatic revival
+                    session.session_data.pop(REVIVAL_KEY, None)
                     session.save()
                     logger.error(f"QR code scan timeout for session {session.session_id}")
                     return False
@@ -129,24 +208,87 @@ class WhatsAppAutomationService:
         except Exception as e:
             session.status = 'error'
             session.error_message = str(e)
+            session.session_data.pop(REVIVAL_KEY, None)
             session.save()
             logger.error(f"Error logging in to WhatsApp: {e}")
             return False
     
-    def send_message(self, phone_number: str, message: str, message_type: str = 'text') -> bool:
+    def _last_outgoing_message(self) -> Optional[Dict]:
+        """Return the id and confirmation state of the newest outgoing bubble."""
+        return self.driver.execute_script(
+            LAST_OUTGOING_MESSAGE_JS,
+            settings.WHATSAPP_SEND_CONFIRM_SELECTOR
+        )
+    
+    def read_outgoing_receipts(self) -> List[Tuple[str, str]]:
+        """Return (whatsapp message id, 'delivered' | 'read') for the open chat."""
+        try:
+            return [
+                (message.id, message.receipt)
+                for message in read_chat(self.driver)
+                if not message.incoming and message.id and message.receipt in ('delivered', 'read')
+            ]
+        except WebDriverException as e:
+            logger.debug(f"Could not read message receipts: {e}")
+            return []
+    
+    def _wait_for_send_confirmation(self, previous_id: Optional[str]) -> Tuple[Optional[str], bool]:
+        """
+        Poll until a new outgoing bubble shows a sent/delivered tick.
+        Returns (whatsapp message id, confirmed). The id is None if no new
+        bubble appeared at all.
+        """
+        state = {'id': None, 'confirmed': False}
+        
+        def confirmed(driver):
+            last = self._last_outgoing_message()
+            if last and last.get('id') and last['id'] != previous_id:
+                state.update(last)
+                return last.get('confirmed')
+            return False
+        
+        try:
+            WebDriverWait(
+                self.driver,
+                settings.WHATSAPP_SEND_CONFIRM_TIMEOUT,
+                poll_frequency=settings.WHATSAPP_SEND_CONFIRM_POLL
+            ).until(confirmed)
+        except TimeoutException:
+            pass
+        
+        return state['id'], bool(state['confirmed'])
+    
+    def send_message(self, phone_number: str, message: str, message_type: str = 'text',
+                     throttle: bool = True) -> bool:
         """
         Send a message to a specific phone number via WhatsApp Web.
+        Returns as soon as the outgoing bubble is confirmed; the WhatsApp
+        message id and latency are left in last_sent_message_id and
+        last_send_latency.
+        With throttle, waits for the rate limiter first (callers that already
+        took a token, like the batch dispatcher, pass throttle=False).
         """
+        from .metrics import whatsapp_send_latency, whatsapp_confirm_latency
+        from .ratelimit import get_rate_limiter
+        
+        self.last_sent_message_id = ''
+        self.last_send_latency = None
+        
         try:
             if not self.driver or not self.session or self.session.status != 'active':
                 logger.error("WhatsApp session not active")
                 return False
             
+            if throttle and not get_rate_limiter().wait(self.session.session_id, phone_number):
+                return False
+            
+            started = time.monotonic()
+            
             # Format phone number (remove + and spaces)
             clean_phone = phone_number.replace('+', '').replace(' ', '').replace('-', '')
             
             # Navigate to chat
-            chat_url = f"https://web.whatsapp.com/send?phone={clean_phone}"
+            chat_url = f"{settings.WHATSAPP_WEB_URL}/send?phone={clean_phone}"
             self.driver.get(chat_url)
             
             wait = WebDriverWait(self.driver, self.wait_timeout)
@@ -161,15 +303,34 @@ class WhatsAppAutomationService:
             # Find message input box
             message_box = self.driver.find_element(By.CSS_SELECTOR, "[data-testid='conversation-compose-box-input']")
             
+            # Remember the newest outgoing bubble so the confirmation wait
+            # does not match a message that was already in the chat
+            previous = self._last_outgoing_message()
+            previous_id = previous.get('id') if previous else None
+            
             # Clear and type message
             message_box.clear()
             message_box.send_keys(message)
             
             # Send message
             message_box.send_keys(Keys.ENTER)
+            entered = time.monotonic()
+            
+            message_id, confirmed = self._wait_for_send_confirmation(previous_id)
+            
+            if not message_id:
+                logger.error(f"Message to {phone_number} did not appear in the chat")
+                return False
             
-            # Wait a bit for message to be sent
-            time.sleep(2)
+            if confirmed:
+                whatsapp_confirm_latency.observe(time.monotonic() - entered)
+            else:
+                logger.warning(f"Message {message_id} to {phone_number} is still pending confirmation")
+            
+            self.last_sent_message_id = message_id
+            self.last_send_latency = time.monotonic() - started
+            self.send_latencies.append(self.last_send_latency)
+            whatsapp_send_latency.observe(self.last_send_latency)
             
             # Update session activity
             self.session.last_activity = timezone.now()
@@ -182,9 +343,10 @@ class WhatsAppAutomationService:
             logger.error(f"Error sending message to {phone_number}: {e}")
             return False
     
-    def send_otp_message(self, phone_number: str, otp_code: str, purpose: str = "verification") -> bool:
-        """Send OTP message via WhatsApp."""
-        message = f"""🔐 *Smart Locker OTP*
+    @staticmethod
+    def format_otp_message(otp_code: str, purpose: str = "verification") -> str:
+        """Build the OTP message text."""
+        return f"""🔐 *Smart Locker OTP*
 
 Your verification code is: *{otp_code}*
 
@@ -193,12 +355,11 @@ This code is valid for 10 minutes and is for {purpose}.
 ⚠️ Do not share this code with anyone.
 
 Smart Locker Team"""
-        
-        return self.send_message(phone_number, message, 'otp')
     
-    def send_approval_request(self, phone_number: str, booking_details: Dict) -> bool:
-        """Send parcel approval request with interactive options."""
-        message = f"""📦 *Parcel Delivery Approval*
+    @staticmethod
+    def format_approval_request(booking_details: Dict) -> str:
+        """Build the parcel approval request text."""
+        return f"""📦 *Parcel Delivery Approval*
 
 Hello {booking_details.get('recipient_name', 'Customer')},
 
@@ -216,7 +377,15 @@ Please reply with:
 You have 30 minutes to respond.
 
 Smart Locker Team"""
-        
+    
+    def send_otp_message(self, phone_number: str, otp_code: str, purpose: str = "verification") -> bool:
+        """Send OTP message via WhatsApp."""
+        message = self.format_otp_message(otp_code, purpose)
+        return self.send_message(phone_number, message, 'otp')
+    
+    def send_approval_request(self, phone_number: str, booking_details: Dict) -> bool:
+        """Send parcel approval request with interactive options."""
+        message = self.format_approval_request(booking_details)
         return self.send_message(phone_number, message, 'approval')
     
     def check_for_responses(self, phone_number: str) -> Optional[str]:
@@ -229,23 +398,18 @@ Smart Locker Team"""
                 return None
             
             clean_phone = phone_number.replace('+', '').replace(' ', '').replace('-', '')
-            chat_url = f"https://web.whatsapp.com/send?phone={clean_phone}"
+            chat_url = f"{settings.WHATSAPP_WEB_URL}/send?phone={clean_phone}"
             self.driver.get(chat_url)
             
             wait = WebDriverWait(self.driver, 10)
             wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='conversation-panel-messages']")))
             
-            # Get all messages in the chat
-            messages = self.driver.find_elements(By.CSS_SELECTOR, "[data-testid='msg-container']")
+            # Only the last message matters; read it in one script call
+            messages = read_chat(self.driver, limit=1)
             
-            if messages:
-                # Get the last message
-                last_message = messages[-1]
-                
-                # Check if it's an incoming message (from user)
-                if "message-in" in last_message.get_attribute("class"):
-                    message_text = last_message.find_element(By.CSS_SELECTOR, ".selectable-text").text
-                    return message_text.strip().upper()
+            # Check if it's an incoming message (from user)
+            if messages and messages[-1].incoming:
+                return messages[-1].text.strip().upper()
             
             return None
             
@@ -283,32 +447,6 @@ class AIBotService:
         genai.configure(api_key=api_key)
         self.gemini_client = genai.GenerativeModel('gemini-pro')
     
-    def generate_otp(self, length: int = 6, use_ai: bool = False) -> str:
-        """
-        Generate OTP code. Can use AI for more secure/random generation.
-        """
-        if use_ai and self.openai_client:
-            try:
-                response = self.openai_client.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "Generate a secure numeric OTP code."},
-                        {"role": "user", "content": f"Generate a {length}-digit OTP code for user verification."}
-                    ],
-                    max_tokens=10,
-                    temperature=1.0
-                )
-                
-                ai_otp = ''.join(filter(str.isdigit, response.choices[0].message.content))
-                if len(ai_otp) >= length:
-                    return ai_otp[:length]
-                    
-            except Exception as e:
-                logger.error(f"Error generating AI OTP: {e}")
-        
-        # Fallback to random generation
-        return ''.join(random.choices(string.digits, k=length))
-    
     def personalize_message(self, template: str, user_data: Dict, bot_config: AIBotConfiguration) -> str:
         """
         Use AI to personalize message templates based on user data.
@@ -357,10 +495,16 @@ class AIBotService:
         return self._simple_template_substitution(template, user_data)
     
     def _simple_template_substitution(self, template: str, user_data: Dict) -> str:
-        """Simple template variable substitution."""
-        for key, value in user_data.items():
-            template = template.replace(f"{{{key}}}", str(value))
-        return template
+        """
+        Simple template variable substitution using the compiled template cache.
+        Placeholders without a value are logged and left in the text.
+        """
+        from .templating import compile_source
+        
+        text, missing = compile_source(template).render(user_data)
+        if missing:
+            logger.warning(f"Template placeholders without a value: {', '.join(missing)}")
+        return text
     
     def analyze_user_response(self, response_text: str, bot_config: AIBotConfiguration) -> Dict:
         """
@@ -435,125 +579,154 @@ class NotificationService:
     
     def send_notification(self, notification: Notification) -> bool:
         """
-        Send notification based on the template channel.
+        Send notification through the transport registered for its template channel.
+        A released digest window goes out as its carrier, which may be another
+        notification than the one passed in. Returns False if any send failed.
         """
         try:
-            if notification.template.channel == 'whatsapp':
-                return self._send_whatsapp_notification(notification)
-            elif notification.template.channel == 'sms':
-                return self._send_sms_notification(notification)
-            elif notification.template.channel == 'email':
-                return self._send_email_notification(notification)
-            elif notification.template.channel == 'push':
-                return self._send_push_notification(notification)
-            else:
-                logger.error(f"Unsupported notification channel: {notification.template.channel}")
-                return False
-                
+            to_send = self.coalesce([notification])
         except Exception as e:
             logger.error(f"Error sending notification {notification.notification_id}: {e}")
-            notification.status = 'failed'
-            notification.error_message = str(e)
-            notification.save()
+            schedule_retries([notification], str(e))
             return False
+        
+        # Held for a digest counts as handled
+        return all([self._send_one(pending) for pending in to_send])
     
-    def _send_whatsapp_notification(self, notification: Notification) -> bool:
-        """Send WhatsApp notification."""
+    def _send_one(self, notification: Notification) -> bool:
+        from .transports import get_transport
+        
         try:
-            # Get or create active WhatsApp session
-            session = WhatsAppSession.objects.filter(status='active').first()
+            channel = notification.template.channel
+            transport = get_transport(channel)
             
-            if not session:
-                # Create new session (requires manual QR scan)
-                session = self.whatsapp_service.create_session(settings.WHATSAPP_BUSINESS_NUMBER)
-                if not self.whatsapp_service.login_to_whatsapp(session):
-                    return False
+            if not transport:
+                logger.error(f"Unsupported notification channel: {channel}")
+                return False
             
-            # Create WhatsApp message record
-            whatsapp_msg = WhatsAppMessage.objects.create(
-                notification=notification,
-                session=session,
-                recipient_phone=notification.recipient_phone,
-                message_type=notification.template.template_type,
-                message_content=notification.message,
-                requires_response=notification.template.template_type in ['parcel_approval']
-            )
-            
-            # Send the message
-            success = False
-            if notification.template.template_type == 'otp_verification':
-                # Extract OTP from message
-                otp_code = self._extract_otp_from_message(notification.message)
-                success = self.whatsapp_service.send_otp_message(
-                    notification.recipient_phone, 
-                    otp_code, 
-                    "verification"
-                )
-            elif notification.template.template_type == 'parcel_approval':
-                # Send approval request
-                booking_data = notification.metadata.get('booking_details', {})
-                success = self.whatsapp_service.send_approval_request(
-                    notification.recipient_phone,
-                    booking_data
-                )
-            else:
-                # Send regular message
-                success = self.whatsapp_service.send_message(
-                    notification.recipient_phone,
-                    notification.message
-                )
+            success = transport.send(notification)
             
-            if success:
-                whatsapp_msg.status = 'sent'
-                whatsapp_msg.sent_at = timezone.now()
+            # Deferred transports settle the status themselves
+            if success and not transport.deferred:
                 notification.status = 'sent'
                 notification.sent_at = timezone.now()
-            else:
-                whatsapp_msg.status = 'failed'
-                notification.status = 'failed'
-            
-            whatsapp_msg.save()
-            notification.save()
+                notification.save(update_fields=['status', 'sent_at', 'updated_at'])
+            elif not success:
+                schedule_retries([notification], f"{channel} transport failed")
             
             return success
-            
+                
         except Exception as e:
-            logger.error(f"Error sending WhatsApp notification: {e}")
+            logger.error(f"Error sending notification {notification.notification_id}: {e}")
+            schedule_retries([notification], str(e))
             return False
     
+    def coalesce(self, notifications: List[Notification]) -> List[Notification]:
+        """
+        Hold low-priority notifications for a digest and merge the ones whose
+        window has closed. Returns what should be sent now.
+        """
+        notifications, _ = hold_for_digest(merge_digests(notifications))
+        return notifications
+    
+    def send_notifications(self, notifications: List[Notification]) -> int:
+        """
+        Send a batch of notifications, one transport call per channel, and
+        write their statuses back with a single bulk_update. Non-browser
+        channels go through the asyncio runner when NOTIFICATION_ASYNC_DELIVERY
+        is on. Notifications held for a digest are not sent and not counted.
+        Returns the number of notifications accepted by their transport.
+        """
+        from .async_delivery import get_async_runner
+        from .transports import get_transport
+        
+        use_async = settings.NOTIFICATION_ASYNC_DELIVERY
+        notifications = self.coalesce(notifications)
+        
+        by_channel = {}
+        for notification in notifications:
+            by_channel.setdefault(notification.template.channel, []).append(notification)
+        
+        accepted = 0
+        settled = []
+        failed = []
+        now = timezone.now()
+        
+        for channel, group in by_channel.items():
+            transport = get_transport(channel)
+            if not transport:
+                logger.error(f"Unsupported notification channel: {channel}")
+                continue
+            
+            try:
+                if use_async and not transport.deferred:
+                    results = get_async_runner().deliver(transport, group)
+                else:
+                    results = transport.send_many(group)
+            except Exception as e:
+                logger.error(f"Error sending {channel} notifications: {e}")
+                results = {}
+            
+            for notification in group:
+                success = results.get(notification.pk, False)
+                accepted += success
+                if not success:
+                    failed.append(notification)
+                elif not transport.deferred:
+                    notification.status = 'sent'
+                    notification.sent_at = now
+                    notification.updated_at = now
+                    settled.append(notification)
+        
+        Notification.objects.bulk_update(settled, ['status', 'sent_at', 'updated_at'])
+        if failed:
+            schedule_retries(failed, "Transport failed")
+        return accepted
+    
+    def queue_whatsapp_notification(self, notification: Notification) -> Optional[WhatsAppMessage]:
+        """Create the queued WhatsAppMessage row for a notification."""
+        whatsapp_msg = self.build_whatsapp_message(notification)
+        if whatsapp_msg:
+            whatsapp_msg.save()
+        return whatsapp_msg
+    
+    def build_whatsapp_message(self, notification: Notification) -> Optional[WhatsAppMessage]:
+        """Build the unsaved, queued WhatsAppMessage for a notification; None if no session is active."""
+        from .session_router import get_session_router
+        
+        # Spread recipients across active sessions
+        session = get_session_router().route(notification.recipient_phone)
+        
+        if not session:
+            # Logging in needs a QR scan, which cannot happen in a send path;
+            # the notification fails and is retried once a session is active
+            logger.warning(f"No active WhatsApp session for notification {notification.notification_id}")
+            return None
+        
+        template_type = notification.template.template_type
+        
+        if template_type == 'otp_verification':
+            # Extract OTP from message
+            otp_code = self._extract_otp_from_message(notification.message)
+            content = WhatsAppAutomationService.format_otp_message(otp_code, "verification")
+        elif template_type == 'parcel_approval':
+            booking_data = notification.metadata.get('booking_details', {})
+            content = WhatsAppAutomationService.format_approval_request(booking_data)
+        else:
+            content = notification.message
+        
+        return WhatsAppMessage(
+            notification=notification,
+            session=session,
+            recipient_phone=notification.recipient_phone,
+            message_type=WHATSAPP_MESSAGE_TYPES.get(template_type, 'text'),
+            message_content=content,
+            requires_response=template_type in ['parcel_approval'],
+            response_options=['Approve', 'Deny'] if template_type == 'parcel_approval' else [],
+        )
+    
     def _extract_otp_from_message(self, message: str) -> str:
         """Extract OTP code from message text."""
         import re
         otp_match = re.search(r'\b\d{4,8}\b', message)
         return otp_match.group() if otp_match else "123456"
-    
-    def _send_sms_notification(self, notification: Notification) -> bool:
-        """Send SMS notification using free SMS services or APIs."""
-        # Implementation for SMS sending
-        # Could use services like TextBelt, SMS APIs, etc.
-        logger.info(f"SMS notification sent to {notification.recipient_phone}")
-        return True
-    
-    def _send_email_notification(self, notification: Notification) -> bool:
-        """Send email notification."""
-        from django.core.mail import send_mail
-        
-        try:
-            send_mail(
-                subject=notification.subject,
-                message=notification.message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[notification.recipient_email],
-                fail_silently=False,
-            )
-            return True
-        except Exception as e:
-            logger.error(f"Error sending email: {e}")
-            return False
-    
-    def _send_push_notification(self, notification: Notification) -> bool:
-        """Send push notification to mobile apps."""
-        # Implementation for push notifications
-        # Could use Firebase Cloud Messaging, OneSignal, etc.
-        logger.info(f"Push notification sent to user {notification.recipient.username}")
-        return True
\ No newline at end of file
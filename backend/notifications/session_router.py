@@ -0,0 +1,100 @@
+"""
+Routing of WhatsApp traffic across every active business number.
+
+Recipients are mapped onto a consistent-hash ring of active sessions so a
+conversation stays on one number while sessions come and go. The ring only
+decides affinity: a recipient moves to the next session on the ring when its
+own session is excluded (e.g. down), never because of load. Sending rates are
+enforced at send time by the token buckets in ratelimit.py, which delay a
+message on its session rather than moving it.
+"""
+
+import bisect
+import hashlib
+import logging
+import re
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+from .models import WhatsAppSession
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_phone(phone: str) -> str:
+    """Reduce a phone number or chat title to its digits."""
+    return re.sub(r'\D', '', phone or '')
+
+
+def _hash(value: str) -> int:
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class SessionRouter:
+    """Consistent-hash router over a snapshot of active WhatsApp sessions."""
+
+    virtual_nodes = 64
+
+    def __init__(self, sessions: Optional[List[WhatsAppSession]] = None):
+        if sessions is None:
+            sessions = list(WhatsAppSession.objects.filter(status='active').order_by('id'))
+        self.sessions = sessions
+
+        self._ring: List[Tuple[int, WhatsAppSession]] = sorted(
+            (
+                (_hash(f"{session.session_id}#{replica}"), session)
+                for session in sessions
+                for replica in range(self.virtual_nodes)
+            ),
+            key=lambda node: node[0]
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    def candidates(self, phone_number: str, exclude: Tuple[str, ...] = ()) -> Iterator[WhatsAppSession]:
+        """Yield distinct sessions in ring order starting at the recipient's position."""
+        if not self._ring:
+            return
+
+        start = bisect.bisect(self._keys, _hash(normalize_phone(phone_number)))
+        seen = set(exclude)
+        for offset in range(len(self._ring)):
+            _, session = self._ring[(start + offset) % len(self._ring)]
+            if session.session_id not in seen:
+                seen.add(session.session_id)
+                yield session
+
+    def home_session(self, phone_number: str) -> Optional[WhatsAppSession]:
+        """Return the session a recipient hashes to."""
+        return next(self.candidates(phone_number), None)
+
+    def route(self, phone_number: str, exclude: Tuple[str, ...] = ()) -> Optional[WhatsAppSession]:
+        """Pick the session for a recipient: its home session, or the next one on the ring not excluded."""
+        return next(self.candidates(phone_number, exclude), None)
+
+
+_router: Optional[SessionRouter] = None
+_router_built_at = 0.0
+_router_lock = threading.Lock()
+
+
+def get_session_router() -> SessionRouter:
+    """
+    Return a router over the current active sessions.
+    The session snapshot is reused for WHATSAPP_ROUTER_REFRESH seconds.
+    """
+    global _router, _router_built_at
+    with _router_lock:
+        if _router is None or time.monotonic() - _router_built_at > settings.WHATSAPP_ROUTER_REFRESH:
+            _router = SessionRouter()
+            _router_built_at = time.monotonic()
+        return _router
+
+
+def reset_session_router():
+    """Drop the cached snapshot, e.g. after a session changed status."""
+    global _router
+    with _router_lock:
+        _router = None
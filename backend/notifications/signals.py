@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import NotificationTemplate
+from .templating import invalidate_template
+
+
+@receiver(post_save, sender=NotificationTemplate)
+@receiver(post_delete, sender=NotificationTemplate)
+def invalidate_template_cache(sender, instance, **kwargs):
+    """Drop cached and compiled copies of an edited or deleted template."""
+    invalidate_template(instance)
@@ -0,0 +1,401 @@
+"""
+Offline stand-in for WhatsApp Web, for load and regression testing.
+
+A stdlib HTTP server that serves the parts of the WhatsApp Web DOM that
+WhatsAppAutomationService, InboxScanner and dom.py rely on: the chat list
+(chat-list, cell-frame-container, span[title], icon-unread-count), the
+conversation panel (conversation-info-header, conversation-panel-messages,
+msg-container with message-in/message-out, data-pre-plain-text,
+selectable-text and msg-* tick icons) and conversation-compose-box-input.
+The session is always logged in, so no QR code is shown.
+
+Point WHATSAPP_WEB_URL at it and the real driver code runs unchanged, with
+configurable response latency, tick timings and scripted replies, so send and
+scan throughput and approval round trips can be measured without network
+access or a phone. Run it with "manage.py run_whatsapp_standin".
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse
+
+BUSINESS_NAME = 'Smart Locker'
+
+
+class ReplyRule(NamedTuple):
+    """Reply with text after delay seconds to outgoing messages matching pattern."""
+    pattern: re.Pattern
+    reply: str
+    delay: float
+
+
+DEFAULT_REPLY_RULES = [
+    ReplyRule(re.compile(r'Parcel Delivery Approval'), 'APPROVE', 2.0),
+]
+
+
+def load_reply_rules(path: str) -> List[ReplyRule]:
+    """Read rules from a JSON list of {"match": regex, "reply": text, "delay": seconds}."""
+    with open(path) as f:
+        return [
+            ReplyRule(re.compile(rule['match'], re.IGNORECASE), rule['reply'], float(rule.get('delay', 0)))
+            for rule in json.load(f)
+        ]
+
+
+class StandInMessage:
+    __slots__ = ('id', 'incoming', 'text', 'at')
+
+    def __init__(self, phone: str, incoming: bool, text: str, at: float):
+        self.id = f"{'false' if incoming else 'true'}_{phone}@c.us_{uuid.uuid4().hex[:20].upper()}"
+        self.incoming = incoming
+        self.text = text
+        self.at = at  # replies are stored ahead of time and appear once this passes
+
+
+class StandInChat:
+    __slots__ = ('phone', 'messages', 'read_at', 'last_activity')
+
+    def __init__(self, phone: str):
+        self.phone = phone
+        self.messages: List[StandInMessage] = []
+        self.read_at = time.time()
+        self.last_activity = time.time()
+
+    @property
+    def title(self) -> str:
+        return f"+{self.phone}"
+
+
+class StandInState:
+    """Chats of the single logged-in account; shared by all request threads."""
+
+    def __init__(self, send_latency: float = 0.2, deliver_after: float = 1.0, read_after: float = 5.0,
+                 reply_rules: Optional[List[ReplyRule]] = None):
+        self.send_latency = send_latency
+        self.deliver_after = deliver_after
+        self.read_after = read_after
+        self.reply_rules = DEFAULT_REPLY_RULES if reply_rules is None else reply_rules
+        self.chats: Dict[str, StandInChat] = {}
+        self.stats = {'sent': 0, 'replies': 0, 'injected': 0, 'state_polls': 0}
+        self.lock = threading.Lock()
+
+    def _chat(self, phone: str) -> StandInChat:
+        chat = self.chats.get(phone)
+        if chat is None:
+            chat = self.chats[phone] = StandInChat(phone)
+        return chat
+
+    def send(self, phone: str, text: str) -> str:
+        """Store an outgoing message and schedule the first matching reply."""
+        now = time.time()
+        with self.lock:
+            chat = self._chat(phone)
+            message = StandInMessage(phone, False, text, now)
+            chat.messages.append(message)
+            chat.last_activity = now
+            self.stats['sent'] += 1
+
+            for rule in self.reply_rules:
+                if rule.pattern.search(text):
+                    chat.messages.append(StandInMessage(phone, True, rule.reply, now + rule.delay))
+                    self.stats['replies'] += 1
+                    break
+        return message.id
+
+    def inject(self, phone: str, text: str, delay: float = 0) -> str:
+        """Store an incoming message, as if the recipient had typed it."""
+        with self.lock:
+            message = StandInMessage(phone, True, text, time.time() + delay)
+            self._chat(phone).messages.append(message)
+            self.stats['injected'] += 1
+        return message.id
+
+    def receipt(self, message: StandInMessage, now: float) -> str:
+        age = now - message.at
+        if age >= self.read_after:
+            return 'read'
+        if age >= self.deliver_after:
+            return 'delivered'
+        if age >= self.send_latency:
+            return 'sent'
+        return 'pending'
+
+    def snapshot(self, open_phone: Optional[str]) -> Dict:
+        """Chat list and the open chat's messages as the page renders them."""
+        now = time.time()
+        with self.lock:
+            self.stats['state_polls'] += 1
+            if open_phone:
+                chat = self._chat(open_phone)
+                chat.read_at = now
+
+            chats = []
+            for chat in self.chats.values():
+                visible = [m for m in chat.messages if m.at <= now]
+                if visible:
+                    chat.last_activity = max(chat.last_activity, visible[-1].at)
+                unread = any(m.incoming and m.at > chat.read_at for m in visible)
+                chats.append((chat.last_activity, chat.title, unread))
+            chats.sort(reverse=True)
+
+            messages = []
+            if open_phone:
+                for message in self.chats[open_phone].messages:
+                    if message.at > now:
+                        continue
+                    label = time.strftime('%H:%M, %d/%m/%Y', time.localtime(message.at))
+                    author = f"+{open_phone}" if message.incoming else BUSINESS_NAME
+                    messages.append([
+                        message.id,
+                        1 if message.incoming else 0,
+                        message.text,
+                        f"[{label}] {author}: ",
+                        '' if message.incoming else self.receipt(message, now),
+                    ])
+
+        return {
+            'chats': [[title, 1 if unread else 0] for _, title, unread in chats],
+            'open': f"+{open_phone}" if open_phone else None,
+            'messages': messages,
+        }
+
+    def reset(self):
+        with self.lock:
+            self.chats.clear()
+            for key in self.stats:
+                self.stats[key] = 0
+
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>WhatsApp</title>
+<style>
+body { margin: 0; font-family: sans-serif; display: flex; height: 100vh; }
+#side { width: 30%; border-right: 1px solid #ddd; overflow-y: auto; }
+#main { flex: 1; display: flex; flex-direction: column; }
+[data-testid='cell-frame-container'] { padding: 12px; border-bottom: 1px solid #eee; cursor: pointer; }
+[data-testid='conversation-panel-messages'] { flex: 1; overflow-y: auto; padding: 12px; }
+.message-in, .message-out { margin: 4px 0; }
+.message-out { text-align: right; }
+[data-testid='conversation-compose-box-input'] { border-top: 1px solid #ddd; padding: 12px; min-height: 20px; }
+</style>
+</head>
+<body>
+<div id="side"><div data-testid="chat-list" id="chat-list"></div></div>
+<div id="main"></div>
+<script>
+var openPhone = __OPEN_PHONE__;
+var pollInterval = __POLL__;
+var lastChats = null, lastMessages = null;
+
+var ICONS = {
+    pending: ['msg-time', 'Pending'],
+    sent: ['msg-check', ' Sent '],
+    delivered: ['msg-dblcheck', ' Delivered '],
+    read: ['msg-dblcheck-ack', ' Read ']
+};
+
+function el(tag, attrs, text) {
+    var node = document.createElement(tag);
+    for (var key in attrs) { node.setAttribute(key, attrs[key]); }
+    if (text !== undefined) { node.textContent = text; }
+    return node;
+}
+
+function renderChats(chats) {
+    var key = JSON.stringify(chats);
+    if (key === lastChats) { return; }
+    lastChats = key;
+    var list = document.getElementById('chat-list');
+    list.textContent = '';
+    chats.forEach(function (chat) {
+        var item = el('div', {'data-testid': 'cell-frame-container'});
+        item.appendChild(el('span', {title: chat[0]}, chat[0]));
+        if (chat[1]) { item.appendChild(el('span', {'data-testid': 'icon-unread-count'}, '1')); }
+        item.addEventListener('click', function () { openChat(chat[0].replace(/\\D/g, '')); });
+        list.appendChild(item);
+    });
+}
+
+function renderConversation(state) {
+    var main = document.getElementById('main');
+    if (!state.open) { main.textContent = ''; lastMessages = null; return; }
+
+    var header = main.querySelector("[data-testid='conversation-info-header'] span[title]");
+    if (!header || header.getAttribute('title') !== state.open) {
+        main.textContent = '';
+        lastMessages = null;
+        var head = el('header', {'data-testid': 'conversation-info-header'});
+        head.appendChild(el('span', {title: state.open}, state.open));
+        main.appendChild(head);
+        main.appendChild(el('div', {'data-testid': 'conversation-panel-messages'}));
+        var compose = el('div', {'contenteditable': 'true', 'data-testid': 'conversation-compose-box-input'});
+        compose.addEventListener('keydown', onComposeKey);
+        main.appendChild(compose);
+    }
+
+    var key = JSON.stringify(state.messages);
+    if (key === lastMessages) { return; }
+    lastMessages = key;
+    var panel = main.querySelector("[data-testid='conversation-panel-messages']");
+    panel.textContent = '';
+    state.messages.forEach(function (row) {
+        var holder = el('div', {'data-id': row[0], 'class': row[1] ? 'message-in' : 'message-out'});
+        var container = el('div', {'data-testid': 'msg-container'});
+        var copyable = el('div', {'class': 'copyable-text', 'data-pre-plain-text': row[3]});
+        copyable.appendChild(el('span', {'class': 'selectable-text'}, row[2]));
+        container.appendChild(copyable);
+        if (!row[1] && ICONS[row[4]]) {
+            container.appendChild(el('span', {'data-icon': ICONS[row[4]][0], 'aria-label': ICONS[row[4]][1]}));
+        }
+        holder.appendChild(container);
+        panel.appendChild(holder);
+    });
+}
+
+function refresh() {
+    var url = '/api/state' + (openPhone ? '?open=' + openPhone : '');
+    return fetch(url).then(function (r) { return r.json(); }).then(function (state) {
+        renderChats(state.chats);
+        renderConversation(state);
+    });
+}
+
+function openChat(phone) {
+    openPhone = phone;
+    history.replaceState(null, '', '/send?phone=' + phone);
+    refresh();
+}
+
+function onComposeKey(event) {
+    if (event.key !== 'Enter') { return; }
+    event.preventDefault();
+    var box = event.target, text = box.innerText.trim();
+    box.textContent = '';
+    if (!text) { return; }
+    fetch('/api/send', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({phone: openPhone, text: text})
+    }).then(refresh);
+}
+
+refresh();
+setInterval(refresh, pollInterval);
+</script>
+</body>
+</html>
+"""
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server_version = 'WhatsAppStandIn/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _delay(self):
+        latency, jitter = self.server.latency, self.server.jitter
+        if latency or jitter:
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+    def _respond(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, payload, status: int = 200):
+        self._respond(status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+    def _body(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def do_GET(self):
+        self._delay()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        phone = re.sub(r'\D', '', query.get('phone', query.get('open', ['']))[0])
+        state: StandInState = self.server.state
+
+        if url.path in ('/', '/send'):
+            page = PAGE.replace('__OPEN_PHONE__', json.dumps(phone or None)).replace(
+                '__POLL__', str(int(self.server.poll * 1000))
+            )
+            self._respond(200, page.encode('utf-8'), 'text/html; charset=utf-8')
+        elif url.path == '/api/state':
+            self._json(state.snapshot(phone or None))
+        elif url.path == '/api/stats':
+            with state.lock:
+                self._json({**state.stats, 'chats': len(state.chats)})
+        else:
+            self._json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        self._delay()
+        url = urlparse(self.path)
+        data = self._body()
+        phone = re.sub(r'\D', '', str(data.get('phone') or ''))
+        state: StandInState = self.server.state
+
+        if url.path == '/api/send' and phone and data.get('text'):
+            self._json({'id': state.send(phone, data['text'])})
+        elif url.path == '/api/incoming' and phone and data.get('text'):
+            self._json({'id': state.inject(phone, data['text'], float(data.get('delay', 0)))})
+        elif url.path == '/api/reset':
+            state.reset()
+            self._json({'reset': True})
+        else:
+            self._json({'error': 'bad request'}, 400)
+
+
+class WhatsAppWebStandIn(ThreadingHTTPServer):
+    """
+    The stand-in server. serve_forever() blocks; start() serves from a
+    daemon thread, e.g. inside a benchmark or test process.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, latency: float = 0.0,
+                 jitter: float = 0.0, poll: float = 0.5, state: Optional[StandInState] = None,
+                 verbose: bool = False):
+        super().__init__((host, port), StandInHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.poll = poll
+        self.state = state or StandInState()
+        self.verbose = verbose
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'WhatsAppWebStandIn':
+        self._thread = threading.Thread(target=self.serve_forever, name='whatsapp-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
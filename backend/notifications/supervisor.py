@@ -0,0 +1,236 @@
+"""
+Health supervision for pooled WhatsApp Web drivers.
+
+Headless Chrome grows over days of uptime. For each pooled driver the
+supervisor tracks the memory of the chromedriver/Chrome process tree (from
+/proc, or the page's JS heap over CDP where /proc is unavailable), page
+crashes and recent send latency, and recycles the browser once any of them
+crosses its WHATSAPP_DRIVER_* threshold. A session whose browser repeatedly
+fails to start is marked 'error' and taken out of routing; the periodic
+supervise task retries it with exponential backoff, up to
+WHATSAPP_DRIVER_MAX_REVIVALS times, and marks it 'active' again once it
+starts. The retry state lives in session_data[REVIVAL_KEY], so sessions put
+in 'error' for other reasons (QR timeout, logout) are left for a person.
+"""
+
+import logging
+import os
+import statistics
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from selenium.common.exceptions import WebDriverException
+
+from .models import WhatsAppSession
+from .session_router import reset_session_router
+
+if TYPE_CHECKING:
+    from .driver_pool import PooledDriver, WhatsAppDriverPool
+
+logger = logging.getLogger(__name__)
+
+# WebDriverException messages that mean the page or browser died
+CRASH_MARKERS = ('tab crashed', 'page crash', 'chrome not reachable', 'session deleted', 'disconnected')
+
+# session_data key of the supervisor's retry state for sessions it marked 'error'
+REVIVAL_KEY = 'driver_revival'
+
+
+def is_crash(error: WebDriverException) -> bool:
+    message = (getattr(error, 'msg', None) or str(error)).lower()
+    return any(marker in message for marker in CRASH_MARKERS)
+
+
+def process_tree_rss(root_pid: int) -> Optional[int]:
+    """Resident memory in bytes of a process and all its descendants, from /proc."""
+    if not os.path.isdir('/proc'):
+        return None
+
+    children: Dict[int, list] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Fields after the parenthesised command name; ppid is the second
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            pass
+        stack.extend(children.get(pid, ()))
+    return total
+
+
+class DriverSupervisor:
+    """Measures pooled drivers and decides when to recycle them."""
+
+    def __init__(self):
+        self.max_rss = settings.WHATSAPP_DRIVER_MAX_RSS_MB * 1024 * 1024
+        self.max_crashes = settings.WHATSAPP_DRIVER_MAX_CRASHES
+        self.max_latency = settings.WHATSAPP_DRIVER_MAX_SEND_LATENCY
+        self.max_start_failures = settings.WHATSAPP_DRIVER_MAX_START_FAILURES
+        self.interval = settings.WHATSAPP_DRIVER_HEALTH_INTERVAL
+        self.max_revivals = settings.WHATSAPP_DRIVER_MAX_REVIVALS
+        self.revival_backoff = settings.WHATSAPP_DRIVER_REVIVAL_BACKOFF
+        self.revival_backoff_max = settings.WHATSAPP_DRIVER_REVIVAL_BACKOFF_MAX
+
+    def memory(self, pooled: 'PooledDriver') -> Optional[int]:
+        """Bytes used by the driver's browser, or None if it cannot be measured."""
+        driver = pooled.service.driver
+        if not driver:
+            return None
+
+        process = getattr(getattr(driver, 'service', None), 'process', None)
+        if process is not None:
+            rss = process_tree_rss(process.pid)
+            if rss is not None:
+                return rss
+
+        try:
+            driver.execute_cdp_cmd('Performance.enable', {})
+            metrics = driver.execute_cdp_cmd('Performance.getMetrics', {})['metrics']
+            return int(next(m['value'] for m in metrics if m['name'] == 'JSHeapTotalSize'))
+        except (WebDriverException, KeyError, StopIteration) as e:
+            logger.debug(f"Could not measure driver memory: {e}")
+            return None
+
+    def check(self, pooled: 'PooledDriver', force: bool = False) -> Optional[str]:
+        """Return why the driver should be recycled, or None if it is healthy."""
+        # A crash stops the browser, so the count is looked at even when it is down
+        if pooled.crashes >= self.max_crashes:
+            return f"{pooled.crashes} page crashes"
+
+        if pooled.started_at is None:
+            return None
+
+        latencies = pooled.service.send_latencies
+        if self.max_latency and len(latencies) >= 5 and statistics.median(latencies) > self.max_latency:
+            return f"median send latency {statistics.median(latencies):.1f}s"
+
+        now = time.monotonic()
+        if not force and now - pooled.checked_at < self.interval:
+            return None
+        pooled.checked_at = now
+
+        pooled.rss = self.memory(pooled)
+        if self.max_rss and pooled.rss and pooled.rss > self.max_rss:
+            return f"memory {pooled.rss // (1024 * 1024)} MB"
+        return None
+
+    def recycle(self, pooled: 'PooledDriver', reason: str, headless: bool):
+        """Restart the browser in place; raises if the new one does not come up."""
+        logger.warning(f"Recycling WhatsApp driver for session {pooled.session_id}: {reason}")
+        pooled.stop()
+        pooled.crashes = 0
+        pooled.recycles += 1
+        self.start(pooled, headless)
+
+    def start(self, pooled: 'PooledDriver', headless: bool):
+        """Start the driver, tracking consecutive failures on the session."""
+        session = pooled.service.session
+        try:
+            pooled.ensure_started(headless=headless)
+        except WebDriverException as e:
+            pooled.start_failures += 1
+            if pooled.start_failures >= self.max_start_failures:
+                self.mark_session(session, 'error', f"Driver failed to start: {e}")
+            raise
+
+        pooled.start_failures = 0
+        if session.status == 'error':
+            self.mark_session(session, 'active')
+
+    def mark_session(self, session: WhatsAppSession, status: str, error: str = ''):
+        """
+        Set the session status. Marking it 'error' here makes it eligible for
+        revival by supervise(); any other status clears the retry state.
+        """
+        if session.status == status and session.error_message == error:
+            return
+        logger.warning(f"Marking WhatsApp session {session.session_id} {status}" + (f": {error}" if error else ''))
+
+        def update(data):
+            if status == 'error':
+                data.setdefault(REVIVAL_KEY, {'attempts': 0, 'next_attempt_at': time.time()})
+            else:
+                data.pop(REVIVAL_KEY, None)
+
+        self._update_session(session, update, status=status, error_message=error)
+        reset_session_router()
+
+    def _update_session(self, session: WhatsAppSession, update_data, **fields):
+        """Save fields and a change to session_data without losing concurrent session_data writes."""
+        with transaction.atomic():
+            locked = WhatsAppSession.objects.select_for_update().get(pk=session.pk)
+            data = dict(locked.session_data)
+            update_data(data)
+            locked.session_data = data
+            for name, value in fields.items():
+                setattr(locked, name, value)
+            locked.save(update_fields=['session_data', *fields, 'updated_at'])
+
+        session.session_data = locked.session_data
+        for name, value in fields.items():
+            setattr(session, name, value)
+
+    def _record_failed_revival(self, session: WhatsAppSession, revival: Dict) -> Dict:
+        attempts = revival['attempts'] + 1
+        delay = min(self.revival_backoff * 2 ** (attempts - 1), self.revival_backoff_max)
+        revival = {'attempts': attempts, 'next_attempt_at': time.time() + delay}
+        self._update_session(session, lambda data: data.update({REVIVAL_KEY: revival}))
+        return revival
+
+    def supervise(self, pool: 'WhatsAppDriverPool') -> Dict[str, str]:
+        """
+        Check every idle pooled driver and retry sessions this supervisor
+        marked 'error' whose backoff has elapsed.
+        Returns {session_id: action} for drivers that were touched.
+        """
+        actions = {}
+        for pooled in pool.idle_drivers():
+            if not pooled.lock.acquire(blocking=False):
+                continue
+            try:
+                reason = self.check(pooled, force=True)
+                if reason:
+                    self.recycle(pooled, reason, pool.headless)
+                    actions[pooled.session_id] = f"recycled ({reason})"
+            except WebDriverException as e:
+                actions[pooled.session_id] = f"failed ({e})"
+            finally:
+                pooled.lock.release()
+
+        now = time.time()
+        for session in WhatsAppSession.objects.filter(status='error'):
+            revival = session.session_data.get(REVIVAL_KEY)
+            if not revival or revival['attempts'] >= self.max_revivals or now < revival['next_attempt_at']:
+                continue
+
+            try:
+                with pool.lease(session, revive=True):
+                    pass
+                actions[session.session_id] = 'revived'
+            except WebDriverException as e:
+                revival = self._record_failed_revival(session, revival)
+                if revival['attempts'] >= self.max_revivals:
+                    logger.error(
+                        f"Giving up on WhatsApp session {session.session_id} after "
+                        f"{revival['attempts']} revival attempts: {e}"
+                    )
+                    actions[session.session_id] = 'gave up'
+                else:
+                    logger.info(f"WhatsApp session {session.session_id} still failing: {e}")
+
+        return actions
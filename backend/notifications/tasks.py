@@ -1,4 +1,6 @@
 from celery import shared_task
+from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
 from datetime import timedelta
 import logging
@@ -7,7 +9,15 @@ from .models import (
     Notification, WhatsAppSession, WhatsAppMessage, 
     OTPVerification, AIBotConfiguration
 )
-from .services import NotificationService, WhatsAppAutomationService, AIBotService
+from .services import NotificationService, AIBotService
+from .driver_pool import get_driver_pool
+from .session_router import get_session_router
+from .scheduler import dispatch_due_notifications
+from .receipts import flush_receipts
+from .maintenance import run_cleanup
+from .idempotency import claim_idempotency_key, make_idempotency_key, release_idempotency_key
+from .otp import generate_otp_code
+from .otp_store import VerifyResult, get_otp_store, record_verify_result
 
 logger = logging.getLogger(__name__)
 
@@ -37,50 +47,137 @@ def send_notification_task(notification_id):
         return False
 
 @shared_task
-def process_whatsapp_responses():
+def dispatch_whatsapp_messages(batch_size=None, max_batches=None, urgent_only=False):
     """
-    Celery task to check for WhatsApp responses and process them.
+    Drain queued WhatsApp messages in batches on pooled drivers.
+    Safe to run on several workers at once: rows are claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED. Urgent and high priority messages
+    are always claimed first; urgent_only restricts the run to them.
+    """
+    from .dispatch import WhatsAppBatchDispatcher
+    
+    try:
+        dispatcher = WhatsAppBatchDispatcher(batch_size=batch_size, urgent_only=urgent_only)
+        return dispatcher.run(max_batches=max_batches or settings.WHATSAPP_DISPATCH_MAX_BATCHES)
+    except Exception as e:
+        logger.error(f"Error dispatching WhatsApp messages: {e}")
+        return None
+
+WHATSAPP_JOB_ACTIONS = (
+    'send_message',
+    'send_otp_message',
+    'send_approval_request',
+    'check_for_responses',
+)
+
+@shared_task
+def run_whatsapp_job(action, *args):
+    """
+    Run a single WhatsAppAutomationService call on a pooled driver.
+    Routed to the 'whatsapp' queue so the job executes in the worker
+    that keeps the browser sessions warm.
+    """
+    if action not in WHATSAPP_JOB_ACTIONS:
+        logger.error(f"Unsupported WhatsApp job action: {action}")
+        return None
+    
+    try:
+        router = get_session_router()
+        phone_number = args[0]
+        # Replies arrive on the number the conversation lives on
+        if action == 'check_for_responses':
+            session = router.home_session(phone_number)
+        else:
+            session = router.route(phone_number)
+        
+        if not session:
+            logger.error("No active WhatsApp session found")
+            return None
+        
+        with get_driver_pool().lease(session) as whatsapp_service:
+            return getattr(whatsapp_service, action)(*args)
+            
+    except Exception as e:
+        logger.error(f"Error running WhatsApp job {action}: {e}")
+        return None
+
+@shared_task
+def send_notifications_batch_task(notification_ids):
+    """
+    Send a chunk of notifications, grouped into one transport call per channel.
     """
     try:
-        # Get all pending approval messages
-        pending_messages = WhatsAppMessage.objects.filter(
-            message_type='approval',
-            requires_response=True,
-            user_response='',
-            status='sent'
+        notifications = list(
+            Notification.objects.filter(
+                Q(scheduled_at__isnull=True) | Q(scheduled_at__lte=timezone.now()),
+                notification_id__in=notification_ids,
+                status='pending'
+            ).select_related('template', 'recipient')
         )
         
-        whatsapp_service = WhatsAppAutomationService()
+        accepted = NotificationService().send_notifications(notifications)
+        logger.info(f"Accepted {accepted}/{len(notifications)} notifications for delivery")
+        return accepted
         
-        # Get active session
-        session = WhatsAppSession.objects.filter(status='active').first()
-        if not session:
+    except Exception as e:
+        logger.error(f"Error sending notification batch: {e}")
+        return 0
+
+@shared_task
+def dispatch_scheduled_notifications():
+    """
+    Enqueue pending notifications whose scheduled_at has passed, including
+    retries whose backoff has elapsed.
+    """
+    try:
+        dispatched = dispatch_due_notifications()
+        if dispatched:
+            logger.info(f"Dispatched {dispatched} scheduled notifications")
+        return dispatched
+        
+    except Exception as e:
+        logger.error(f"Error dispatching scheduled notifications: {e}")
+        return 0
+
+@shared_task
+def process_whatsapp_responses():
+    """
+    Celery task to check for WhatsApp responses and process them.
+    Reads the unread-chat list once per tick and only opens chats that
+    belong to a pending approval request.
+    """
+    from .inbox import InboxScanner
+    
+    try:
+        sessions = WhatsAppSession.objects.filter(status='active')
+        if not sessions:
             logger.warning("No active WhatsApp session found")
             return
         
-        whatsapp_service.session = session
-        whatsapp_service.initialize_driver(headless=True)
-        
-        responses_processed = 0
-        
-        for message in pending_messages:
+        # Each business number has its own inbox
+        matches = []
+        for session in sessions:
             try:
-                response = whatsapp_service.check_for_responses(message.recipient_phone)
-                
-                if response:
-                    message.user_response = response
-                    message.response_received_at = timezone.now()
-                    message.save()
-                    
-                    # Process the response
-                    process_approval_response.delay(message.id, response)
-                    responses_processed += 1
-                    
+                with get_driver_pool().lease(session) as whatsapp_service:
+                    matches.extend(InboxScanner(whatsapp_service, session).scan())
             except Exception as e:
-                logger.error(f"Error checking response for message {message.id}: {e}")
+                logger.error(f"Error scanning inbox of session {session.session_id}: {e}")
+        
+        now = timezone.now()
+        for message, response in matches:
+            message.user_response = response[:50]
+            message.response_received_at = now
+        
+        WhatsAppMessage.objects.bulk_update(
+            [message for message, _ in matches],
+            ['user_response', 'response_received_at']
+        )
         
-        whatsapp_service.close_session()
+        for message, response in matches:
+            # Process the response
+            process_approval_response.delay(message.id, response)
         
+        responses_processed = len(matches)
         logger.info(f"Processed {responses_processed} WhatsApp responses")
         return responses_processed
         
@@ -88,6 +185,52 @@ def process_whatsapp_responses():
         logger.error(f"Error processing WhatsApp responses: {e}")
         return 0
 
+@shared_task
+def collect_whatsapp_receipts():
+    """
+    Read delivery and read ticks from recent chats of every active session.
+    Receipts are buffered and applied by flush_delivery_receipts.
+    """
+    from .inbox import InboxScanner
+    
+    chats = 0
+    for session in WhatsAppSession.objects.filter(status='active'):
+        try:
+            with get_driver_pool().lease(session) as whatsapp_service:
+                chats += InboxScanner(whatsapp_service, session).scan_receipts(
+                    settings.WHATSAPP_RECEIPT_SCAN_CHATS
+                )
+        except Exception as e:
+            logger.error(f"Error collecting receipts for session {session.session_id}: {e}")
+    return chats
+
+@shared_task
+def supervise_whatsapp_drivers():
+    """
+    Recycle unhealthy pooled drivers in this worker and retry sessions
+    marked 'error'. Returns {session_id: action}.
+    """
+    pool = get_driver_pool()
+    actions = pool.supervisor.supervise(pool)
+    for session_id, action in actions.items():
+        logger.info(f"WhatsApp driver {session_id}: {action}")
+    return actions
+
+@shared_task
+def flush_delivery_receipts():
+    """
+    Apply buffered delivery/read receipts in bulk and push them to dashboards.
+    """
+    try:
+        applied = flush_receipts()
+        if applied:
+            logger.info(f"Applied {applied} delivery receipts")
+        return applied
+        
+    except Exception as e:
+        logger.error(f"Error applying delivery receipts: {e}")
+        return 0
+
 @shared_task
 def process_approval_response(message_id, response_text):
     """
@@ -152,16 +295,19 @@ def send_confirmation_message(phone_number, intent, booking_id):
     """
     Send confirmation message after processing approval response.
     """
+    # Repeated approval replies with the same intent get one confirmation
+    key = make_idempotency_key(booking_id, 'approval_confirmation', {'intent': intent})
+    if not claim_idempotency_key(key):
+        logger.info(f"Skipping duplicate {intent} confirmation for booking {booking_id}")
+        return
+    
     try:
-        whatsapp_service = WhatsAppAutomationService()
-        session = WhatsAppSession.objects.filter(status='active').first()
+        session = get_session_router().route(phone_number)
         
         if not session:
+            release_idempotency_key(key)
             return
         
-        whatsapp_service.session = session
-        whatsapp_service.initialize_driver(headless=True)
-        
         if intent == 'approve':
             message = f"""✅ *Delivery Approved*
 
@@ -195,23 +341,34 @@ Booking ID: {booking_id}
 
 Smart Locker Team"""
         
-        whatsapp_service.send_message(phone_number, message)
-        whatsapp_service.close_session()
+        with get_driver_pool().lease(session) as whatsapp_service:
+            if not whatsapp_service.send_message(phone_number, message):
+                release_idempotency_key(key)
         
     except Exception as e:
         logger.error(f"Error sending confirmation message: {e}")
+        release_idempotency_key(key)
 
 @shared_task
 def assign_locker_and_notify(booking_id):
     """
     Assign locker to approved booking and notify all parties.
     """
+    key = make_idempotency_key(booking_id, 'locker_assignment')
+    if not claim_idempotency_key(key):
+        logger.info(f"Locker assignment for booking {booking_id} already running or done")
+        return
+    
     try:
         from bookings.models import Booking
         from lockers.models import Locker
         
         booking = Booking.objects.get(booking_id=booking_id)
         
+        if booking.locker_id:
+            logger.info(f"Booking {booking_id} already has a locker")
+            return
+        
         # Find available locker
         available_locker = Locker.objects.filter(
             status='available',
@@ -225,15 +382,15 @@ def assign_locker_and_notify(booking_id):
             available_locker.save()
             booking.save()
             
-            # Generate access code
+            # Generate access code; only its hash is stored
             from lockers.models import LockerAccess
-            import secrets
+            from lockers.access_codes import generate_access_code
             
-            access_code = secrets.token_hex(4).upper()
+            access_code, access_code_hash = generate_access_code()
             
             LockerAccess.objects.create(
                 locker=available_locker,
-                access_code=access_code,
+                access_code=access_code_hash,
                 access_type='qr_code',
                 expires_at=timezone.now() + timedelta(hours=24),
                 created_by=booking.customer
@@ -247,16 +404,23 @@ def assign_locker_and_notify(booking_id):
             
         else:
             logger.error(f"No available locker for booking {booking_id}")
+            release_idempotency_key(key)
             # Could implement waiting list or alternative handling
             
     except Exception as e:
         logger.error(f"Error assigning locker for booking {booking_id}: {e}")
+        release_idempotency_key(key)
 
 @shared_task
 def notify_locker_assignment(booking_id, access_code):
     """
     Notify customer about locker assignment.
     """
+    key = make_idempotency_key(booking_id, 'locker_assignment_notice', {'access_code': access_code})
+    if not claim_idempotency_key(key):
+        logger.info(f"Skipping duplicate locker assignment notice for booking {booking_id}")
+        return
+    
     try:
         from bookings.models import Booking
         
@@ -282,17 +446,18 @@ Instructions:
 
 Smart Locker Team"""
         
-        whatsapp_service = WhatsAppAutomationService()
-        session = WhatsAppSession.objects.filter(status='active').first()
+        session = get_session_router().route(booking.recipient_phone)
         
+        sent = False
         if session:
-            whatsapp_service.session = session
-            whatsapp_service.initialize_driver(headless=True)
-            whatsapp_service.send_message(booking.recipient_phone, message)
-            whatsapp_service.close_session()
+            with get_driver_pool().lease(session) as whatsapp_service:
+                sent = whatsapp_service.send_message(booking.recipient_phone, message)
+        if not sent:
+            release_idempotency_key(key)
             
     except Exception as e:
         logger.error(f"Error notifying locker assignment for booking {booking_id}: {e}")
+        release_idempotency_key(key)
 
 @shared_task
 def notify_delivery_agent(booking_id):
@@ -370,28 +535,16 @@ Smart Locker Team"""
 @shared_task
 def cleanup_expired_sessions():
     """
-    Clean up expired WhatsApp sessions and OTP verifications.
+    Expire idle WhatsApp sessions and stale OTPs, and archive old OTP and
+    AI interaction rows, in bounded set-based batches.
     """
     try:
-        # Clean up expired WhatsApp sessions
-        expired_sessions = WhatsAppSession.objects.filter(
-            last_activity__lt=timezone.now() - timedelta(hours=2),
-            status='active'
-        )
-        
-        for session in expired_sessions:
-            session.status = 'expired'
-            session.save()
-        
-        # Clean up expired OTP verifications
-        expired_otps = OTPVerification.objects.filter(
-            expires_at__lt=timezone.now(),
-            status__in=['generated', 'sent']
+        counts = run_cleanup()
+        logger.info(
+            f"Cleanup: {counts['sessions_expired']} sessions and {counts['otps_expired']} OTPs expired, "
+            f"{counts['otps_archived']} OTPs and {counts['ai_interactions_archived']} AI interactions archived"
         )
-        
-        expired_otps.update(status='expired')
-        
-        logger.info(f"Cleaned up {expired_sessions.count()} sessions and {expired_otps.count()} OTPs")
+        return counts
         
     except Exception as e:
         logger.error(f"Error cleaning up expired sessions: {e}")
@@ -399,26 +552,16 @@ def cleanup_expired_sessions():
 @shared_task
 def generate_ai_otp(user_id, otp_type, phone_number):
     """
-    Generate OTP using AI service.
+    Generate an OTP and queue it for sending over WhatsApp.
+    The code comes from the local OTP generator (notifications/otp.py); the
+    task keeps its name for existing callers.
     """
     try:
         from accounts.models import User
         
         user = User.objects.get(id=user_id)
         
-        # Get AI bot configuration for OTP generation
-        ai_bot = AIBotConfiguration.objects.filter(
-            purpose='otp_generation',
-            is_active=True
-        ).first()
-        
-        ai_service = AIBotService()
-        
-        if ai_bot and ai_bot.provider == 'openai':
-            ai_service.initialize_openai(ai_bot.api_key)
-            otp_code = ai_service.generate_otp(length=6, use_ai=True)
-        else:
-            otp_code = ai_service.generate_otp(length=6, use_ai=False)
+        otp_code = generate_otp_code(user.id, otp_type)
         
         # Create OTP verification record
         otp_verification = OTPVerification.objects.create(
@@ -426,9 +569,7 @@ def generate_ai_otp(user_id, otp_type, phone_number):
             otp_type=otp_type,
             otp_code=otp_code,
             phone_number=phone_number,
-            expires_at=timezone.now() + timedelta(minutes=10),
-            generated_by_ai=bool(ai_bot),
-            ai_bot=ai_bot
+            expires_at=timezone.now() + timedelta(minutes=10)
         )
         
         # Send OTP via WhatsApp
@@ -437,7 +578,7 @@ def generate_ai_otp(user_id, otp_type, phone_number):
         return otp_code
         
     except Exception as e:
-        logger.error(f"Error generating AI OTP: {e}")
+        logger.error(f"Error generating OTP: {e}")
         return None
 
 @shared_task
@@ -448,21 +589,18 @@ def send_otp_whatsapp(otp_verification_id):
     try:
         otp_verification = OTPVerification.objects.get(id=otp_verification_id)
         
-        whatsapp_service = WhatsAppAutomationService()
-        session = WhatsAppSession.objects.filter(status='active').first()
+        session = get_session_router().route(otp_verification.phone_number)
         
         if not session:
             logger.error("No active WhatsApp session for OTP sending")
             return False
         
-        whatsapp_service.session = session
-        whatsapp_service.initialize_driver(headless=True)
-        
-        success = whatsapp_service.send_otp_message(
-            otp_verification.phone_number,
-            otp_verification.otp_code,
-            otp_verification.otp_type
-        )
+        with get_driver_pool().lease(session) as whatsapp_service:
+            success = whatsapp_service.send_otp_message(
+                otp_verification.phone_number,
+                otp_verification.otp_code,
+                otp_verification.otp_type
+            )
         
         if success:
             otp_verification.status = 'sent'
@@ -471,10 +609,18 @@ def send_otp_whatsapp(otp_verification_id):
             otp_verification.status = 'failed'
         
         otp_verification.save()
-        whatsapp_service.close_session()
+        if success:
+            get_otp_store().store(otp_verification)
         
         return success
         
     except Exception as e:
         logger.error(f"Error sending OTP via WhatsApp: {e}")
-        return False
\ No newline at end of file
+        return False
+
+@shared_task(ignore_result=True)
+def record_otp_verification(outcome, otp_id, attempts):
+    """
+    Write an OTP verification outcome from the Redis store to the database.
+    """
+    record_verify_result(VerifyResult(outcome, otp_id, attempts))
@@ -0,0 +1,129 @@
+"""
+Process-local cache of compiled notification templates.
+
+Templates are parsed once into literal and placeholder segments, keyed by
+(template_type, channel, language, updated_at), so rendering is a single join
+instead of one str.replace per context key. A post_save signal on
+NotificationTemplate (see signals.py) drops stale entries.
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from .models import NotificationTemplate
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+
+
+class RenderResult(NamedTuple):
+    text: str
+    missing: Tuple[str, ...]
+
+
+class CompiledTemplate:
+    """A template split into literal segments and placeholder names."""
+
+    __slots__ = ('source', 'literals', 'placeholders')
+
+    def __init__(self, source: str):
+        self.source = source
+        # literals[i] precedes placeholders[i]; literals has one extra tail item
+        parts = PLACEHOLDER_RE.split(source)
+        self.literals: List[str] = parts[0::2]
+        self.placeholders: List[str] = parts[1::2]
+
+    def render(self, context: Dict) -> RenderResult:
+        """
+        Fill placeholders from context. Unknown placeholders are kept verbatim
+        and returned in RenderResult.missing.
+        """
+        out = [self.literals[0]]
+        missing = []
+        for name, literal in zip(self.placeholders, self.literals[1:]):
+            if name in context:
+                out.append(str(context[name]))
+            else:
+                missing.append(name)
+                out.append(f"{{{name}}}")
+            out.append(literal)
+        return RenderResult(''.join(out), tuple(missing))
+
+
+_compiled: Dict[Tuple, CompiledTemplate] = {}
+_by_source: Dict[str, CompiledTemplate] = {}
+_templates: Dict[Tuple[str, str, Optional[str]], Tuple[float, Optional[NotificationTemplate]]] = {}
+_lock = threading.Lock()
+
+# Ad-hoc template strings (e.g. AI-personalized wording) are cached by source
+MAX_SOURCE_ENTRIES = 512
+
+
+def template_cache_key(template: NotificationTemplate) -> Tuple:
+    return (template.template_type, template.channel, template.language, template.updated_at)
+
+
+def get_compiled_template(template: NotificationTemplate) -> CompiledTemplate:
+    """Return the compiled form of a template row."""
+    key = template_cache_key(template)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = CompiledTemplate(template.message_template)
+        with _lock:
+            _compiled[key] = compiled
+    return compiled
+
+
+def compile_source(source: str) -> CompiledTemplate:
+    """Return the compiled form of a raw template string."""
+    compiled = _by_source.get(source)
+    if compiled is None:
+        compiled = CompiledTemplate(source)
+        with _lock:
+            if len(_by_source) >= MAX_SOURCE_ENTRIES:
+                _by_source.clear()
+            _by_source[source] = compiled
+    return compiled
+
+
+def get_template(template_type: str, channel: str, language: Optional[str] = None) -> Optional[NotificationTemplate]:
+    """
+    Return the active template for (type, channel[, language]).
+
+    Rows are cached per process. The saving process invalidates immediately
+    through the post_save signal; other processes pick up edits after
+    NOTIFICATION_TEMPLATE_CACHE_TTL seconds.
+    """
+    key = (template_type, channel, language)
+    cached = _templates.get(key)
+    if cached and time.monotonic() - cached[0] < settings.NOTIFICATION_TEMPLATE_CACHE_TTL:
+        return cached[1]
+
+    templates = NotificationTemplate.objects.filter(
+        template_type=template_type,
+        channel=channel,
+        is_active=True
+    )
+    if language:
+        templates = templates.filter(language=language)
+    template = templates.first()
+
+    with _lock:
+        _templates[key] = (time.monotonic(), template)
+    return template
+
+
+def invalidate_template(template: NotificationTemplate):
+    """Forget cached rows and compiled forms for a template's type and channel."""
+    identity = (template.template_type, template.channel)
+    with _lock:
+        for key in [key for key in _templates if key[:2] == identity]:
+            del _templates[key]
+        for key in [key for key in _compiled if key[:2] == identity]:
+            del _compiled[key]
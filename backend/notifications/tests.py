@@ -1,3 +1,1444 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import re
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+from selenium.common.exceptions import WebDriverException
+
+from lockers.models import Locker
+from . import dom, inbox, services
+from .async_delivery import AsyncDeliveryRunner
+from .coalesce import DIGEST_HEADER, hold_for_digest, merge_digests
+from .dispatch import WhatsAppBatchDispatcher
+from .dom import (
+    CHAT_LIST_JS, CHAT_MESSAGES_JS, MESSAGE_JID_RE, OPEN_CHAT_MESSAGE_ID_JS, ChatMessage,
+    open_chat_phone, read_chat, read_chat_list
+)
+from .driver_pool import PooledDriver, WhatsAppDriverPool
+from .idempotency import claim_idempotency_key, make_idempotency_key, release_idempotency_key
+from .inbox import InboxScanner, _local_hwm
+from .lanes import (
+    BULK_QUEUE, DEFAULT_QUEUE, URGENT_QUEUE, WHATSAPP_QUEUE, WHATSAPP_URGENT_QUEUE,
+    queue_for_priority, whatsapp_queue_for_priority
+)
+from .otp import HOTPGenerator, RandomOTPGenerator, TOTPGenerator, hotp
+from .otp_store import OTPStore, record_verify_result
+from .maintenance import archive_otps
+from .models import (
+    ArchivedOTPVerification, Notification, NotificationTemplate, OTPVerification, WhatsAppMessage, WhatsAppSession
+)
+from .profiles import ChromeProfileManager
+from .ratelimit import Bucket, LocalBuckets, WhatsAppRateLimiter
+from .receipts import _local_buffer, flush_receipts, record_receipt, record_receipts
+from .redis_store import get_redis
+from .retry import dead_letter_queryset, retry_delay, schedule_retries
+from .scheduler import NotificationScheduler, claim_due_notifications, dispatch_due_notifications
+from .services import LAST_OUTGOING_MESSAGE_JS, NotificationService, WhatsAppAutomationService
+from .session_router import SessionRouter, normalize_phone, reset_session_router
+from .standin import ReplyRule, StandInState, WhatsAppWebStandIn
+from .templating import CompiledTemplate, get_compiled_template, get_template
+from .transports import FakeTransport, WhatsAppWebTransport, _registry, get_transport, register_transport
+
+User = get_user_model()
+
+
+def _redis_available() -> bool:
+    try:
+        return bool(get_redis().ping())
+    except RedisError:
+        return False
+
+
+# Tests of the Lua scripts need a real server; the local fallbacks are tested without one
+requires_redis = skipUnless(_redis_available(), 'Needs a reachable Redis at REDIS_URL')
+
+
+def make_notifications(count, template_type='system_notification', channel='whatsapp', **fields):
+    """Pending notifications, one new user each."""
+    template, _ = NotificationTemplate.objects.get_or_create(
+        template_type=template_type, channel=channel, language='en',
+        defaults={'name': template_type, 'message_template': '{message}'}
+    )
+    first = User.objects.count()
+    notifications = []
+    for index in range(first, first + count):
+        phone = f"+1555000{index:04d}"
+        user = User.objects.create(username=f"user{index}", phone_number=phone)
+        notifications.append(Notification.objects.create(
+            recipient=user, template=template, message=f"Message {index}", recipient_phone=phone, **fields
+        ))
+    return notifications
+
+
+def make_whatsapp_messages(count, session=None):
+    """Queued WhatsAppMessage rows with their notifications, one user each."""
+    session = session or WhatsAppSession.objects.create(
+        session_id='session-1', phone_number='+10000000000', status='active'
+    )
+    return [
+        WhatsAppMessage.objects.create(
+            notification=notification, session=session, recipient_phone=notification.recipient_phone,
+            message_content=notification.message, status='queued'
+        )
+        for notification in make_notifications(count)
+    ]
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are checked on PostgreSQL only')
+class HotQueryIndexTests(TestCase):
+    """
+    The hot lookup paths must be able to use their Meta.indexes. Test tables
+    are nearly empty, so sequential scans are disabled for the planner to
+    show whether an index applies at all.
+    """
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('RESET enable_seqscan')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+        self.assertRegex(plan, r'Index (Only )?Scan|Bitmap Index Scan', plan)
+
+    def test_otp_verification_lookup(self):
+        self.assertUsesIndex(
+            OTPVerification.objects.filter(
+                user_id=1, otp_type='login', status='sent', expires_at__gt=timezone.now()
+            ),
+            'otp_user_type_status_idx'
+        )
+
+    def test_otp_expiry_sweep(self):
+        self.assertUsesIndex(
+            OTPVerification.objects.filter(
+                expires_at__lt=timezone.now(), status__in=['generated', 'sent']
+            ),
+            'otp_outstanding_expiry_idx'
+        )
+
+    def test_pending_approvals(self):
+        self.assertUsesIndex(
+            WhatsAppMessage.objects.filter(
+                session_id=1, message_type='approval', requires_response=True,
+                user_response='', status='sent'
+            ).order_by('sent_at'),
+            'wa_msg_pending_approval_idx'
+        )
+
+    def test_queued_messages(self):
+        self.assertUsesIndex(
+            WhatsAppMessage.objects.filter(status='queued').order_by('created_at'),
+            'wa_msg_queued_idx'
+        )
+
+    def test_receipt_lookup(self):
+        self.assertUsesIndex(
+            WhatsAppMessage.objects.filter(whatsapp_message_id__in=['true_1@c.us_A', 'true_1@c.us_B']),
+            'wa_msg_whatsapp_id_idx'
+        )
+
+    def test_active_sessions(self):
+        self.assertUsesIndex(
+            WhatsAppSession.objects.filter(status='active'),
+            'wa_session_status_activity_idx'
+        )
+
+    def test_available_locker(self):
+        self.assertUsesIndex(
+            Locker.objects.filter(status='available', locker_type='standard'),
+            'locker_available_idx'
+        )
+
+
+@override_settings(WHATSAPP_DISPATCH_CLAIM_TIMEOUT=300)
+class DispatcherClaimTests(TestCase):
+    """A batch that takes longer than the claim timeout must not be requeued under a live worker."""
+
+    def setUp(self):
+        self.messages = make_whatsapp_messages(4)
+        self.clock = [timezone.now()]
+        self.sent = []
+
+        patcher = mock.patch('notifications.dispatch.timezone.now', side_effect=lambda: self.clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in ('_throttle', '_record_receipts'):
+            patcher = mock.patch.object(WhatsAppBatchDispatcher, name, return_value='')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def send_message(self, phone, content, message_type, throttle=True):
+        # Each send takes two thirds of the claim timeout, and meanwhile another dispatcher runs
+        self.clock[0] += timedelta(seconds=200)
+        self.assertEqual(WhatsAppBatchDispatcher().release_stale_claims(), 0)
+        self.sent.append(phone)
+        return True
+
+    def fake_pool(self):
+        service = mock.Mock(send_message=self.send_message, last_sent_message_id='')
+        pool = mock.Mock()
+
+        @contextmanager
+        def lease(session, revive=False):
+            yield service
+
+        pool.lease = lease
+        return pool
+
+    def test_long_batch_is_not_requeued_while_sending(self):
+        dispatcher = WhatsAppBatchDispatcher()
+        with mock.patch('notifications.dispatch.get_driver_pool', return_value=self.fake_pool()):
+            results = dispatcher.send_batch(dispatcher.claim_batch())
+
+        self.assertEqual(results['sent'], 4)
+        self.assertEqual(sorted(self.sent), sorted(m.recipient_phone for m in self.messages))
+        self.assertEqual(WhatsAppMessage.objects.filter(status='sent').count(), 4)
+        self.assertEqual(dispatcher.claim_batch(), [])
+
+    def test_abandoned_claims_are_requeued(self):
+        dispatcher = WhatsAppBatchDispatcher()
+        self.assertEqual(len(dispatcher.claim_batch()), 4)
+
+        self.clock[0] += timedelta(seconds=301)
+        self.assertEqual(dispatcher.release_stale_claims(), 4)
+        self.assertEqual(WhatsAppMessage.objects.filter(status='queued').count(), 4)
+
+
+class DispatcherFailoverTests(TestCase):
+    """Messages of a session whose driver dies move to another session, if there is one."""
+
+    def setUp(self):
+        self.messages = make_whatsapp_messages(2)
+        reset_session_router()
+        self.addCleanup(reset_session_router)
+        for name in ('_throttle', '_record_receipts'):
+            patcher = mock.patch.object(WhatsAppBatchDispatcher, name, return_value='')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def send_batch(self):
+        @contextmanager
+        def lease(session, revive=False):
+            raise WebDriverException('chrome not reachable')
+            yield
+
+        dispatcher = WhatsAppBatchDispatcher()
+        with mock.patch('notifications.dispatch.get_driver_pool', return_value=mock.Mock(lease=lease)):
+            return dispatcher.send_batch(dispatcher.claim_batch())
+
+    def test_messages_move_to_another_active_session(self):
+        spare = WhatsAppSession.objects.create(session_id='session-2', phone_number='+10000000001', status='active')
+
+        results = self.send_batch()
+        self.assertEqual((results['requeued'], results['failed']), (2, 0))
+        self.assertEqual(
+            set(WhatsAppMessage.objects.values_list('status', 'session_id')), {('queued', spare.pk)}
+        )
+
+    def test_messages_fail_for_retry_without_another_session(self):
+        results = self.send_batch()
+        self.assertEqual((results['requeued'], results['failed']), (0, 2))
+        self.assertEqual(set(WhatsAppMessage.objects.values_list('status', flat=True)), {'failed'})
+        for message in self.messages:
+            message.notification.refresh_from_db()
+            self.assertEqual((message.notification.status, message.notification.retry_count), ('pending', 1))
+            self.assertIsNotNone(message.notification.scheduled_at)
+
+        # Nothing is left queued on the dead session for the next batch to spin on
+        self.assertEqual(WhatsAppBatchDispatcher().claim_batch(), [])
+
+
+class LocalTokenBucketTests(TestCase):
+    """In-process buckets, used by the rate limiter while Redis is down."""
+
+    def setUp(self):
+        self.buckets = LocalBuckets()
+        self.recipient = Bucket('recipient', 'test:recipient', rate=1.0, capacity=2)
+        self.session = Bucket('session', 'test:session', rate=10.0, capacity=10)
+
+    def test_burst_then_denied_with_wait(self):
+        self.assertEqual(self.buckets.take([self.recipient], now=100.0), (None, 0.0))
+        self.assertEqual(self.buckets.take([self.recipient], now=100.0), (None, 0.0))
+
+        scope, wait = self.buckets.take([self.recipient], now=100.0)
+        self.assertEqual(scope, 'recipient')
+        self.assertAlmostEqual(wait, 1.0)
+
+    def test_refills_at_rate_up_to_capacity(self):
+        for _ in range(2):
+            self.buckets.take([self.recipient], now=100.0)
+
+        self.assertEqual(self.buckets.take([self.recipient], now=100.5)[0], 'recipient')
+        self.assertEqual(self.buckets.take([self.recipient], now=101.0), (None, 0.0))
+
+        # A long idle period refills to capacity, not beyond
+        for _ in range(2):
+            self.assertEqual(self.buckets.take([self.recipient], now=1000.0), (None, 0.0))
+        self.assertEqual(self.buckets.take([self.recipient], now=1000.0)[0], 'recipient')
+
+    def test_blocked_send_takes_from_no_bucket(self):
+        for _ in range(2):
+            self.buckets.take([self.session, self.recipient], now=100.0)
+
+        self.assertEqual(self.buckets.take([self.session, self.recipient], now=100.0)[0], 'recipient')
+        # Only the two successful sends were charged to the session
+        tokens, _ = self.buckets._levels[self.session.key]
+        self.assertAlmostEqual(tokens, 8.0)
+
+    def test_limiter_falls_back_when_redis_is_down(self):
+        limiter = WhatsAppRateLimiter({'recipient': {'per_minute': 60, 'burst': 2}})
+        with mock.patch('notifications.ratelimit.get_redis', side_effect=RedisError('down')):
+            results = [limiter.acquire('session-1', '+15550001111')[0] for _ in range(3)]
+        self.assertEqual(results, [None, None, 'recipient'])
+
+
+@requires_redis
+class RedisTokenBucketTests(TestCase):
+    limits = {
+        'global': {'per_minute': 6000, 'burst': 100},
+        'recipient': {'per_minute': 60, 'burst': 2},
+    }
+
+    def setUp(self):
+        self.limiter = WhatsAppRateLimiter(self.limits)
+        self.phone = '+1555999' + str(id(self))[-4:]
+        self.keys = [bucket.key for bucket in self.limiter.buckets('session-1', self.phone)]
+        get_redis().delete(*self.keys)
+        self.addCleanup(get_redis().delete, *self.keys)
+
+    def test_refill_and_denial(self):
+        with mock.patch('notifications.ratelimit.time.time', return_value=1000.0):
+            self.assertEqual(self.limiter.acquire('session-1', self.phone), (None, 0.0))
+            self.assertEqual(self.limiter.acquire('session-1', self.phone), (None, 0.0))
+            scope, wait = self.limiter.acquire('session-1', self.phone)
+        self.assertEqual(scope, 'recipient')
+        self.assertAlmostEqual(wait, 1.0)
+
+        with mock.patch('notifications.ratelimit.time.time', return_value=1001.0):
+            self.assertEqual(self.limiter.acquire('session-1', self.phone), (None, 0.0))
+
+
+class SessionRingTests(TestCase):
+    """The ring keeps each recipient on one session while sessions come and go."""
+
+    phones = [f"+91 98{index:08d}" for index in range(500)]
+
+    def sessions(self, count):
+        return [WhatsAppSession(session_id=f"session-{index}", phone_number=f"+1000000000{index}") for index in range(count)]
+
+    def assignments(self, router):
+        return {phone: router.route(phone).session_id for phone in self.phones}
+
+    def test_recipient_is_sticky(self):
+        router = SessionRouter(self.sessions(3))
+        self.assertEqual(router.route('+91 9800000001').session_id, router.route('919800000001').session_id)
+        self.assertEqual(self.assignments(router), self.assignments(SessionRouter(self.sessions(3))))
+
+    def test_adding_a_session_only_moves_recipients_onto_it(self):
+        before = self.assignments(SessionRouter(self.sessions(3)))
+        after = self.assignments(SessionRouter(self.sessions(4)))
+
+        moved = [phone for phone in self.phones if before[phone] != after[phone]]
+        self.assertTrue(moved)
+        self.assertTrue(all(after[phone] == 'session-3' for phone in moved))
+        self.assertLess(len(moved), len(self.phones) / 2)
+
+    def test_removing_a_session_only_moves_its_recipients(self):
+        sessions = self.sessions(4)
+        before = self.assignments(SessionRouter(sessions))
+        after = self.assignments(SessionRouter(sessions[:1] + sessions[2:]))
+
+        for phone in self.phones:
+            if before[phone] != 'session-1':
+                self.assertEqual(after[phone], before[phone])
+            else:
+                self.assertNotEqual(after[phone], 'session-1')
+
+    def test_excluded_session_fails_over_to_next_on_ring(self):
+        router = SessionRouter(self.sessions(3))
+        home = router.home_session(self.phones[0])
+        fallback = router.route(self.phones[0], exclude=(home.session_id,))
+        self.assertNotEqual(fallback.session_id, home.session_id)
+        self.assertEqual(fallback.session_id, list(router.candidates(self.phones[0]))[1].session_id)
+        self.assertIsNone(SessionRouter([]).route(self.phones[0]))
+
+
+@override_settings(NOTIFICATION_RETRY_BASE_DELAY=10, NOTIFICATION_RETRY_MAX_DELAY=100)
+class RetryBackoffTests(TestCase):
+
+    def assertDelayBetween(self, retry_count, low, high):
+        with mock.patch('notifications.retry.random.uniform', side_effect=lambda a, b: a):
+            self.assertAlmostEqual(retry_delay(retry_count), low)
+        with mock.patch('notifications.retry.random.uniform', side_effect=lambda a, b: b):
+            self.assertAlmostEqual(retry_delay(retry_count), high)
+
+    def test_delay_doubles_with_equal_jitter(self):
+        self.assertDelayBetween(0, 5, 10)
+        self.assertDelayBetween(1, 10, 20)
+        self.assertDelayBetween(3, 40, 80)
+
+    def test_delay_is_capped(self):
+        self.assertDelayBetween(4, 50, 100)
+        self.assertDelayBetween(30, 50, 100)
+        for retry_count in range(40):
+            self.assertLessEqual(retry_delay(retry_count), 100)
+
+    def test_failed_notifications_are_rescheduled_then_dead_lettered(self):
+        retrying, exhausted = make_notifications(2, status='failed')
+        retrying.retry_count, retrying.max_retries = 1, 3
+        exhausted.retry_count, exhausted.max_retries = 3, 3
+
+        before = timezone.now()
+        self.assertEqual(schedule_retries([retrying, exhausted], 'boom'), (1, 1))
+
+        retrying.refresh_from_db()
+        self.assertEqual((retrying.status, retrying.retry_count, retrying.error_message), ('pending', 2, 'boom'))
+        self.assertGreaterEqual(retrying.scheduled_at, before + timedelta(seconds=10))
+        self.assertLessEqual(retrying.scheduled_at, timezone.now() + timedelta(seconds=20))
+
+        self.assertEqual(list(dead_letter_queryset()), [exhausted])
+
+
+class SchedulerClaimTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        self.due_high, self.due_low = make_notifications(2, scheduled_at=now - timedelta(minutes=1))
+        self.due_high.priority = 'high'
+        self.due_high.save(update_fields=['priority'])
+        self.due_low.priority = 'low'
+        self.due_low.save(update_fields=['priority'])
+        self.future, = make_notifications(1, scheduled_at=now + timedelta(hours=1))
+
+    def test_due_notifications_are_claimed_once(self):
+        claimed = claim_due_notifications(limit=10)
+        self.assertEqual(claimed, {
+            'high': [str(self.due_high.notification_id)],
+            'low': [str(self.due_low.notification_id)],
+        })
+        # A concurrent or later scheduler finds nothing left to claim
+        self.assertEqual(claim_due_notifications(limit=10), {})
+
+        self.due_high.refresh_from_db()
+        self.assertEqual(self.due_high.status, 'pending')
+        self.assertIsNone(self.due_high.scheduled_at)
+        self.future.refresh_from_db()
+        self.assertIsNotNone(self.future.scheduled_at)
+
+    def test_claim_respects_ids_and_limit(self):
+        self.assertEqual(claim_due_notifications(limit=10, ids=[self.due_low.pk, self.future.pk]), {
+            'low': [str(self.due_low.notification_id)],
+        })
+        self.assertEqual(sum(len(ids) for ids in claim_due_notifications(limit=1).values()), 1)
+
+    def test_dispatch_enqueues_each_notification_once(self):
+        with mock.patch('notifications.tasks.send_notifications_batch_task.apply_async') as apply_async:
+            self.assertEqual(dispatch_due_notifications(batch_size=10), 2)
+            self.assertEqual(dispatch_due_notifications(batch_size=10), 0)
+
+        sent = [notification_id for call in apply_async.call_args_list for notification_id in call.kwargs['args'][0]]
+        self.assertCountEqual(sent, [str(self.due_high.notification_id), str(self.due_low.notification_id)])
+
+    def test_heap_pops_due_entries_in_order(self):
+        scheduler = NotificationScheduler(lookahead=7200)
+        self.assertEqual(scheduler.refill(), 3)
+        self.assertEqual(scheduler.refill(), 0)
+
+        due = scheduler.pop_due(time.time())
+        self.assertCountEqual(due, [self.due_high.pk, self.due_low.pk])
+        self.assertEqual(scheduler.pop_due(time.time()), [])
+        self.assertEqual(scheduler.pop_due(time.time() + 7200), [self.future.pk])
+
+
+@override_settings(NOTIFICATION_COALESCE_WINDOW=120)
+class DigestTests(TestCase):
+
+    def setUp(self):
+        first, = make_notifications(1, template_type='booking_confirmation')
+        self.notifications = [first] + [
+            Notification.objects.create(
+                recipient=first.recipient, template=first.template,
+                message=f"Update {index}", recipient_phone=first.recipient_phone
+            )
+            for index in range(2)
+        ]
+
+    def test_recipient_notifications_share_one_window(self):
+        to_send, held = hold_for_digest(self.notifications)
+        self.assertEqual((to_send, held), ([], 3))
+
+        rows = Notification.objects.filter(pk__in=[n.pk for n in self.notifications])
+        self.assertEqual({row.metadata['digest'] for row in rows}, {'held'})
+        self.assertEqual(len({row.scheduled_at for row in rows}), 1)
+
+        # A later notification joins the open window instead of opening its own
+        late = Notification.objects.create(
+            recipient=self.notifications[0].recipient, template=self.notifications[0].template, message='Late'
+        )
+        hold_for_digest([late])
+        self.assertEqual(late.scheduled_at, rows[0].scheduled_at)
+
+    def test_exempt_notifications_are_not_held(self):
+        urgent, = make_notifications(1, template_type='booking_confirmation', priority='high')
+        broadcast, = make_notifications(1, template_type='booking_confirmation', metadata={'broadcast': True})
+        system, = make_notifications(1, template_type='system_notification')
+
+        to_send, held = hold_for_digest([urgent, broadcast, system])
+        self.assertEqual((to_send, held), ([urgent, broadcast, system], 0))
+
+    def test_released_window_is_merged_and_the_rest_cancelled(self):
+        hold_for_digest(self.notifications)
+        released = Notification.objects.select_related('template').get(pk=self.notifications[0].pk)
+
+        to_send = merge_digests([released])
+        self.assertEqual(len(to_send), 1)
+        carrier = to_send[0]
+        self.assertEqual(carrier.pk, self.notifications[0].pk)
+        self.assertEqual(carrier.metadata['digest'], 'sent')
+        self.assertIsNone(carrier.scheduled_at)
+        for notification in self.notifications:
+            self.assertIn(notification.message, carrier.message)
+
+        for notification in self.notifications[1:]:
+            notification.refresh_from_db()
+            self.assertEqual(notification.status, 'cancelled')
+            self.assertEqual(notification.metadata['digest_into'], str(carrier.notification_id))
+        self.assertCountEqual(
+            carrier.metadata['digest_of'], [str(n.notification_id) for n in self.notifications[1:]]
+        )
+
+        # A carrier passing through the pipeline again is not re-merged
+        carrier.refresh_from_db()
+        self.assertEqual(merge_digests([carrier]), [carrier])
+
+    def test_send_notification_sends_the_digest_carrier(self):
+        hold_for_digest(self.notifications)
+        released = Notification.objects.select_related('template').get(pk=self.notifications[2].pk)
+        transport = mock.Mock(deferred=False)
+        transport.send.return_value = True
+
+        with mock.patch('notifications.transports.get_transport', return_value=transport):
+            self.assertTrue(NotificationService().send_notification(released))
+
+        sent, = [call.args[0] for call in transport.send.call_args_list]
+        self.assertEqual(sent.pk, self.notifications[0].pk)
+        self.assertTrue(sent.message.startswith(DIGEST_HEADER.format(count=3)))
+        released.refresh_from_db()
+        self.assertEqual(released.status, 'cancelled')
+        self.assertEqual(Notification.objects.get(pk=sent.pk).status, 'sent')
+
+
+class IdempotencyTests(TestCase):
+
+    def test_key_depends_on_booking_type_and_payload_only(self):
+        key = make_idempotency_key('BK1', 'delivery_update', {'locker': 'A1', 'code': 'X'})
+        self.assertEqual(key, make_idempotency_key('BK1', 'delivery_update', {'code': 'X', 'locker': 'A1'}))
+        self.assertNotEqual(key, make_idempotency_key('BK1', 'delivery_update', {'locker': 'A2', 'code': 'X'}))
+        self.assertNotEqual(key, make_idempotency_key('BK2', 'delivery_update', {'locker': 'A1', 'code': 'X'}))
+        self.assertNotEqual(key, make_idempotency_key('BK1', 'booking_confirmation', {'locker': 'A1', 'code': 'X'}))
+
+    @requires_redis
+    def test_duplicate_claim_is_rejected_until_released(self):
+        key = make_idempotency_key(f"test-{id(self)}", 'delivery_update')
+        self.addCleanup(release_idempotency_key, key)
+
+        self.assertTrue(claim_idempotency_key(key, ttl=60))
+        self.assertFalse(claim_idempotency_key(key, ttl=60))
+        release_idempotency_key(key)
+        self.assertTrue(claim_idempotency_key(key, ttl=60))
+
+    def test_database_rejects_duplicate_when_redis_is_down(self):
+        from .utils import SmartNotificationManager
+
+        notification, = make_notifications(1, template_type='delivery_update')
+        key = make_idempotency_key('BK1', 'delivery_update')
+
+        with mock.patch('notifications.idempotency.get_redis', side_effect=RedisError('down')), \
+                mock.patch('notifications.utils.send_notification_task.apply_async') as apply_async:
+            self.assertTrue(claim_idempotency_key(key))
+            for _ in range(2):
+                self.assertTrue(SmartNotificationManager().send_personalized_notification(
+                    notification.recipient, 'delivery_update', idempotency_key=key
+                ))
+
+        self.assertEqual(Notification.objects.filter(idempotency_key=key).count(), 1)
+        self.assertEqual(apply_async.call_count, 1)
+
+
+class OTPVerifyTests(TestCase):
+    """OTPManager with Redis down, verifying against the database."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='otp-user', phone_number='+15550009999')
+        self.otp = OTPVerification.objects.create(
+            user=self.user, otp_type='login', otp_code='123456', phone_number=self.user.phone_number,
+            status='sent', expires_at=timezone.now() + timedelta(minutes=10)
+        )
+        for patcher in (
+            mock.patch('notifications.otp_store.get_redis', side_effect=RedisError('down')),
+            mock.patch('notifications.utils.get_otp_store', return_value=OTPStore()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def verify(self, code):
+        from .utils import OTPManager
+        return OTPManager.verify_otp(self.user, code, 'login')
+
+    def test_missing_or_blank_code_is_rejected(self):
+        for code in (None, '', '   '):
+            self.assertFalse(self.verify(code))
+        self.otp.refresh_from_db()
+        self.assertEqual(self.otp.status, 'sent')
+
+    def test_database_fallback_consumes_once(self):
+        self.assertTrue(self.verify(' 123456 '))
+        self.assertFalse(self.verify('123456'))
+        self.otp.refresh_from_db()
+        self.assertEqual((self.otp.status, self.otp.verification_attempts), ('verified', 1))
+
+    def test_database_fallback_enforces_attempt_limit(self):
+        self.otp.verification_attempts = self.otp.max_attempts
+        self.otp.save(update_fields=['verification_attempts'])
+
+        self.assertFalse(self.verify('123456'))
+        self.otp.refresh_from_db()
+        self.assertEqual(self.otp.status, 'failed')
+
+
+@requires_redis
+class RedisOTPStoreTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='otp-user', phone_number='+15550009999')
+        self.otp = OTPVerification.objects.create(
+            user=self.user, otp_type='login', otp_code='123456', phone_number=self.user.phone_number,
+            status='sent', expires_at=timezone.now() + timedelta(minutes=10)
+        )
+        self.store = OTPStore()
+        self.store.store(self.otp)
+        self.addCleanup(self.store.discard, self.user.id, 'login')
+
+    def outcomes(self, *codes):
+        return [self.store.verify(self.user.id, 'login', code).outcome for code in codes]
+
+    def test_code_is_consumed_once(self):
+        self.assertEqual(self.outcomes('000000', '123456', '123456'), ['invalid', 'verified', 'consumed'])
+
+    def test_attempt_limit_exhausts_the_code(self):
+        self.assertEqual(self.outcomes('000000', '111111', '222222'), ['invalid', 'invalid', 'exhausted'])
+        # The right code is refused once the attempts are used up
+        self.assertEqual(self.outcomes('123456'), ['consumed'])
+
+    def test_outcome_is_written_back(self):
+        result = self.store.verify(self.user.id, 'login', '123456')
+        record_verify_result(result)
+        self.otp.refresh_from_db()
+        self.assertEqual((self.otp.status, self.otp.verification_attempts), ('verified', 1))
+
+    def test_unknown_user_falls_back(self):
+        self.assertEqual(self.store.verify(self.user.id + 1000, 'login', '123456').outcome, 'missing')
+
+
+class OTPGeneratorTests(TestCase):
+    """Published test vectors, RFC 4226 appendix D and RFC 6238 appendix B."""
+
+    secret = b'12345678901234567890'
+    totp_times = (59, 1111111109, 1111111111, 1234567890, 2000000000, 20000000000)
+
+    def test_rfc4226_hotp(self):
+        self.assertEqual([hotp(self.secret, counter) for counter in range(10)], [
+            '755224', '287082', '359152', '969429', '338314',
+            '254676', '287922', '162583', '399871', '520489',
+        ])
+
+    def test_rfc6238_totp_sha1(self):
+        generator = TOTPGenerator(digits=8, step=30)
+        codes = []
+        with mock.patch.object(TOTPGenerator, 'user_key', return_value=self.secret):
+            for at in self.totp_times:
+                with mock.patch('notifications.otp.time.time', return_value=at):
+                    codes.append(generator.generate(1, 'login'))
+        self.assertEqual(codes, ['94287082', '07081804', '14050471', '89005924', '69279037', '65353130'])
+
+    def test_rfc6238_totp_sha256(self):
+        secret = b'12345678901234567890123456789012'
+        self.assertEqual(
+            [hotp(secret, at // 30, 8, hashlib.sha256) for at in self.totp_times],
+            ['46119246', '68084774', '67062674', '91819424', '90698825', '77737706']
+        )
+
+    def test_keys_differ_per_user_and_type(self):
+        generator = TOTPGenerator()
+        self.assertNotEqual(generator.user_key(1, 'login'), generator.user_key(2, 'login'))
+        self.assertNotEqual(generator.user_key(1, 'login'), generator.user_key(1, 'payment'))
+
+    def test_hotp_without_redis_still_issues_codes(self):
+        with mock.patch('notifications.otp.get_redis', side_effect=RedisError('down')):
+            code = HOTPGenerator(digits=6).generate(1, 'login')
+        self.assertRegex(code, r'^\d{6}$')
+
+    def test_random_codes_are_zero_padded(self):
+        with mock.patch('notifications.otp.secrets.randbelow', return_value=42):
+            self.assertEqual(RandomOTPGenerator(digits=6).generate(1, 'login'), '000042')
+
+
+class TemplateCacheTests(TestCase):
+
+    def setUp(self):
+        self.template = NotificationTemplate.objects.create(
+            template_type='collection_reminder', channel='whatsapp', name='Reminder',
+            message_template='Hi {username}, locker {locker_number} is waiting'
+        )
+
+    def test_render_fills_placeholders_and_reports_missing(self):
+        result = CompiledTemplate(self.template.message_template).render({'username': 'Asha'})
+        self.assertEqual(result.text, 'Hi Asha, locker {locker_number} is waiting')
+        self.assertEqual(result.missing, ('locker_number',))
+
+    def test_rows_and_compiled_forms_are_cached(self):
+        template = get_template('collection_reminder', 'whatsapp')
+        with self.assertNumQueries(0):
+            self.assertIs(get_template('collection_reminder', 'whatsapp'), template)
+        self.assertIs(get_compiled_template(template), get_compiled_template(template))
+
+    def test_saving_a_template_invalidates_the_cache(self):
+        stale = get_template('collection_reminder', 'whatsapp')
+        compiled = get_compiled_template(stale)
+
+        self.template.message_template = 'Locker {locker_number} is ready'
+        self.template.save()
+
+        fresh = get_template('collection_reminder', 'whatsapp')
+        self.assertEqual(fresh.message_template, 'Locker {locker_number} is ready')
+        self.assertIsNot(get_compiled_template(fresh), compiled)
+        self.assertEqual(get_compiled_template(fresh).render({'locker_number': 'A1'}).text, 'Locker A1 is ready')
+
+    def test_deleting_a_template_invalidates_the_cache(self):
+        self.assertIsNotNone(get_template('collection_reminder', 'whatsapp'))
+        self.template.delete()
+        self.assertIsNone(get_template('collection_reminder', 'whatsapp'))
+
+    @override_settings(NOTIFICATION_TEMPLATE_CACHE_TTL=0)
+    def test_edits_from_other_processes_show_after_the_ttl(self):
+        get_template('collection_reminder', 'whatsapp')
+        # A queryset update fires no signal, like an edit made by another process
+        NotificationTemplate.objects.filter(pk=self.template.pk).update(is_active=False)
+        self.assertIsNone(get_template('collection_reminder', 'whatsapp'))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'The archive statements are PostgreSQL-specific')
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='archive-user', phone_number='+15550008888')
+
+    def make_otps(self, count, age):
+        otps = [
+            OTPVerification.objects.create(
+                user=self.user, otp_type='login', otp_code='123456', phone_number=self.user.phone_number,
+                status='expired', expires_at=timezone.now()
+            )
+            for _ in range(count)
+        ]
+        # generated_at is auto_now_add, so age the rows afterwards
+        OTPVerification.objects.filter(id__in=[otp.id for otp in otps]).update(
+            generated_at=timezone.now() - age
+        )
+        return otps
+
+    def test_counts_moved_rows_across_batches(self):
+        old = self.make_otps(5, timedelta(days=40))
+        recent = self.make_otps(2, timedelta(days=1))
+
+        self.assertEqual(archive_otps(timedelta(days=30), batch_size=2, max_batches=10), 5)
+        self.assertEqual(
+            set(ArchivedOTPVerification.objects.values_list('id', flat=True)), {otp.id for otp in old}
+        )
+        self.assertEqual(
+            set(OTPVerification.objects.values_list('id', flat=True)), {otp.id for otp in recent}
+        )
+
+    def test_stops_after_max_batches(self):
+        self.make_otps(5, timedelta(days=40))
+        self.assertEqual(archive_otps(timedelta(days=30), batch_size=2, max_batches=1), 2)
+        self.assertEqual(OTPVerification.objects.count(), 3)
+
+    def test_already_archived_id_is_overwritten(self):
+        otp, = self.make_otps(1, timedelta(days=40))
+        ArchivedOTPVerification.objects.create(
+            id=otp.id, user_id=self.user.id, otp_type='login', phone_number='stale', status='sent',
+            generated_at=timezone.now(), expires_at=timezone.now(), archived_at=timezone.now()
+        )
+
+        self.assertEqual(archive_otps(timedelta(days=30), batch_size=10, max_batches=1), 1)
+        archived = ArchivedOTPVerification.objects.get(id=otp.id)
+        self.assertEqual((archived.phone_number, archived.status), (self.user.phone_number, 'expired'))
+        self.assertFalse(OTPVerification.objects.filter(id=otp.id).exists())
+
+
+class FakeChatDriver:
+    """
+    Stands in for Chrome on WhatsApp Web, answering the scripts in dom.py.
+
+    chats maps sidebar titles to {'unread': bool, 'rows': [CHAT_MESSAGES_JS
+    rows]}, in sidebar order; the chat's phone comes from the JID in its row
+    ids, as on the real page. bubbles are the successive states of the newest
+    outgoing bubble returned while a send waits for its tick.
+    """
+
+    def __init__(self, *bubbles, chats=None, open_title=None):
+        self.bubbles = list(bubbles)
+        self.chats = chats or {}
+        self.open_title = open_title
+        self.clicked = []
+
+    def execute_script(self, script, *args):
+        if script == LAST_OUTGOING_MESSAGE_JS:
+            return self.bubbles.pop(0) if len(self.bubbles) > 1 else self.bubbles[0]
+        if script == CHAT_LIST_JS:
+            return {
+                'chats': [[title, int(chat['unread'])] for title, chat in self.chats.items()],
+                'open': self.open_title,
+            }
+
+        rows = self.chats[self.open_title]['rows'] if self.open_title else []
+        if script == OPEN_CHAT_MESSAGE_ID_JS:
+            return rows[-1][0] if rows else None
+        if script == CHAT_MESSAGES_JS:
+            after_id, limit = args
+            ids = [row[0] for row in rows]
+            if after_id in ids:
+                rows = rows[ids.index(after_id) + 1:]
+            return rows[-limit:] if limit else rows
+        raise AssertionError(f"Unexpected script: {script[:40]}")
+
+    def find_element(self, by, selector):
+        return mock.Mock()
+
+    def find_elements(self, by, selector):
+        return [mock.Mock(click=mock.Mock(side_effect=lambda title=title: self.open(title))) for title in self.chats]
+
+    def open(self, title):
+        self.clicked.append(title)
+        self.open_title = title
+
+
+@override_settings(WHATSAPP_SEND_CONFIRM_TIMEOUT=0.2, WHATSAPP_SEND_CONFIRM_POLL=0.01)
+class SendConfirmationTests(TestCase):
+
+    def wait(self, previous_id, *bubbles):
+        service = WhatsAppAutomationService()
+        service.driver = FakeChatDriver(*bubbles)
+        return service._wait_for_send_confirmation(previous_id)
+
+    def test_returns_once_the_new_bubble_is_confirmed(self):
+        self.assertEqual(
+            self.wait(
+                'old',
+                {'id': 'old', 'confirmed': True},
+                {'id': 'new', 'confirmed': False},
+                {'id': 'new', 'confirmed': True},
+            ),
+            ('new', True)
+        )
+
+    def test_unconfirmed_bubble_is_reported_as_pending(self):
+        self.assertEqual(self.wait('old', {'id': 'new', 'confirmed': False}), ('new', False))
+
+    def test_previous_bubble_is_not_mistaken_for_the_sent_one(self):
+        self.assertEqual(self.wait('old', {'id': 'old', 'confirmed': True}), (None, False))
+        self.assertEqual(self.wait(None, None), (None, False))
+
+
+def fake_ensure_started(pooled, headless=True):
+    """PooledDriver.ensure_started without a browser."""
+    if not pooled.service.driver:
+        pooled.service.driver = mock.Mock()
+        pooled.started_at = time.monotonic()
+
+
+@override_settings(WHATSAPP_DRIVER_MAX_CRASHES=2, WHATSAPP_DRIVER_MAX_SEND_LATENCY=5)
+class DriverSupervisorTests(TestCase):
+
+    def setUp(self):
+        self.session = WhatsAppSession.objects.create(
+            session_id='session-1', phone_number='+10000000000', status='active'
+        )
+        self.pool = WhatsAppDriverPool(idle_timeout=0, headless=True)
+        for patcher in (
+            mock.patch.object(PooledDriver, 'ensure_started', autospec=True, side_effect=fake_ensure_started),
+            mock.patch('notifications.driver_pool.get_profile_manager'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def crash(self):
+        with self.assertRaises(WebDriverException):
+            with self.pool.lease(self.session):
+                raise WebDriverException('tab crashed')
+
+    def test_recycles_after_max_crashes(self):
+        self.crash()
+        self.crash()
+        pooled = self.pool._drivers['session-1']
+        self.assertEqual((pooled.crashes, pooled.recycles, pooled.started_at), (2, 0, None))
+
+        with self.pool.lease(self.session) as service:
+            self.assertIsNotNone(service.driver)
+        self.assertEqual((pooled.crashes, pooled.recycles), (0, 1))
+
+    def test_other_webdriver_errors_are_not_counted_as_crashes(self):
+        with self.assertRaises(WebDriverException):
+            with self.pool.lease(self.session):
+                raise WebDriverException('no such element')
+        self.assertEqual(self.pool._drivers['session-1'].crashes, 0)
+
+    def test_recycles_on_slow_sends(self):
+        with self.pool.lease(self.session) as service:
+            service.send_latencies.extend([1, 2, 3, 4, 5])
+        pooled = self.pool._drivers['session-1']
+        self.assertIsNone(self.pool.supervisor.check(pooled))
+
+        with self.pool.lease(self.session) as service:
+            service.send_latencies.extend([30] * 10)
+        self.assertIn('latency', self.pool.supervisor.check(pooled))
+        self.assertEqual(self.pool.supervisor.supervise(self.pool), {
+            'session-1': 'recycled (median send latency 30.0s)'
+        })
+        self.assertEqual((pooled.recycles, len(pooled.service.send_latencies)), (1, 0))
+
+
+class ReceiptTests(TestCase):
+    """Receipts buffered locally, as when Redis is down."""
+
+    def setUp(self):
+        for patcher in (
+            mock.patch('notifications.receipts.get_redis', side_effect=RedisError('down')),
+            mock.patch('notifications.receipts.get_channel_layer', return_value=None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(_local_buffer.clear)
+
+        self.message = make_whatsapp_messages(1)[0]
+        self.notification = self.message.notification
+        WhatsAppMessage.objects.filter(pk=self.message.pk).update(status='sent', whatsapp_message_id='wamid-1')
+        Notification.objects.filter(pk=self.notification.pk).update(status='sent')
+
+    def test_receipts_advance_status_and_never_go_backwards(self):
+        record_receipt('read', whatsapp_message_id='wamid-1')
+        self.assertEqual(flush_receipts(), 1)
+        self.message.refresh_from_db()
+        self.notification.refresh_from_db()
+        self.assertEqual((self.message.status, self.notification.status), ('read', 'read'))
+        self.assertIsNotNone(self.notification.delivered_at)
+        read_at = self.notification.read_at
+
+        record_receipt('delivered', notification_id=str(self.notification.notification_id))
+        self.assertEqual(flush_receipts(), 1)
+        self.notification.refresh_from_db()
+        self.assertEqual((self.notification.status, self.notification.read_at), ('read', read_at))
+
+    def test_invalid_receipts_are_not_buffered(self):
+        self.assertEqual(record_receipts([
+            {'status': 'read', 'notification_id': 'not-a-uuid'},
+            {'status': 'opened', 'whatsapp_message_id': 'wamid-1'},
+            {'status': 'read'},
+            {'status': 'delivered', 'notification_id': self.notification.notification_id},
+        ]), 1)
+        self.assertEqual(len(_local_buffer), 1)
+
+    def test_malformed_buffered_entries_do_not_lose_the_batch(self):
+        _local_buffer.extend([
+            'not json',
+            json.dumps({'status': 'read', 'notification_id': 'not-a-uuid', 'at': timezone.now().isoformat()}),
+        ])
+        record_receipt('delivered', notification_id=str(self.notification.notification_id))
+
+        self.assertEqual(flush_receipts(), 1)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, 'delivered')
+
+    @override_settings(NOTIFICATION_RECEIPT_SECRET='receipt-secret')
+    def test_api_rejects_bad_entries_and_counts_buffered_ones(self):
+        def post(*receipts):
+            return self.client.post(
+                '/api/notifications/receipts/', {'receipts': list(receipts)},
+                content_type='application/json', HTTP_X_RECEIPT_SECRET='receipt-secret'
+            )
+
+        response = post({'status': 'read', 'notification_id': 'not-a-uuid'})
+        self.assertEqual(response.status_code, 400)
+        response = post({'status': 'opened', 'whatsapp_message_id': 'wamid-1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(_local_buffer), 0)
+
+        response = post(
+            {'status': 'read', 'notification_id': str(self.notification.notification_id)},
+            {'status': 'delivered', 'whatsapp_message_id': 'wamid-1', 'at': '2026-01-01T10:00:00'},
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['accepted'], 2)
+
+
+class TransportTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(_registry, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(
+        NOTIFICATION_TRANSPORTS={'sms': 'notifications.transports.FakeTransport'},
+        NOTIFICATION_TRANSPORT_OPTIONS={'sms': {'failure_rate': 1.0}},
+    )
+    def test_registry_builds_transports_from_settings_once(self):
+        transport = get_transport('sms')
+        self.assertIsInstance(transport, FakeTransport)
+        self.assertEqual((transport.channel, transport.failure_rate), ('sms', 1.0))
+        self.assertIs(get_transport('sms'), transport)
+        self.assertIsNone(get_transport('pigeon'))
+
+        replacement = FakeTransport()
+        register_transport('sms', replacement)
+        self.assertIs(get_transport('sms'), replacement)
+        self.assertEqual(replacement.channel, 'sms')
+
+    def test_whatsapp_retry_requeues_the_existing_message(self):
+        message, = make_whatsapp_messages(1)
+        WhatsAppMessage.objects.filter(pk=message.pk).update(
+            status='failed', whatsapp_message_id='wamid-stale', error_message='Send failed'
+        )
+        reset_session_router()
+        self.addCleanup(reset_session_router)
+
+        transport = WhatsAppWebTransport()
+        with mock.patch.object(transport, '_wake_dispatcher') as wake:
+            results = transport.send_many([message.notification])
+
+        self.assertEqual(results, {message.notification.pk: True})
+        wake.assert_called_once()
+        requeued, = WhatsAppMessage.objects.filter(notification=message.notification)
+        self.assertEqual(requeued.pk, message.pk)
+        self.assertEqual(
+            (requeued.status, requeued.whatsapp_message_id, requeued.error_message), ('queued', '', '')
+        )
+
+
+@override_settings(WHATSAPP_JOB_TIMEOUT=60)
+class WhatsAppJobAPITests(TestCase):
+    """Browser work is queued for the WhatsApp worker and polled by job id."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='api-user', phone_number='+15550007777')
+        self.client.force_login(self.user)
+        patcher = mock.patch('notifications.utils.run_whatsapp_job')
+        self.job = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.job.apply_async.return_value = mock.Mock(id='job-1')
+
+    def test_send_message_is_queued(self):
+        WhatsAppSession.objects.create(session_id='session-1', phone_number='+10000000000', status='active')
+
+        response = self.client.post(
+            '/api/notifications/whatsapp/send-message/',
+            {'phone_number': '+15550001234', 'message': 'Hello'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['job_id'], 'job-1')
+        self.job.apply_async.assert_called_once_with(args=('send_message', '+15550001234', 'Hello'), expires=60)
+
+        response = self.client.get('/api/notifications/whatsapp/check-responses/', {'phone_number': '+15550001234'})
+        self.assertEqual((response.status_code, response.json()['job_id']), (202, 'job-1'))
+
+    def test_no_session_is_unavailable(self):
+        response = self.client.post(
+            '/api/notifications/whatsapp/send-message/',
+            {'phone_number': '+15550001234', 'message': 'Hello'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 503)
+        self.job.apply_async.assert_not_called()
+
+    def test_job_result_is_polled(self):
+        result = self.job.AsyncResult.return_value
+
+        def poll():
+            response = self.client.get('/api/notifications/whatsapp/jobs/job-1/')
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        result.ready.return_value = False
+        self.assertEqual(poll(), {'job_id': 'job-1', 'status': 'queued', 'result': None})
+
+        result.ready.return_value = True
+        result.successful.return_value = True
+        result.result = 'Approve'
+        self.assertEqual(poll(), {'job_id': 'job-1', 'status': 'done', 'result': 'Approve'})
+
+        result.successful.return_value = False
+        self.assertEqual(poll()['status'], 'failed')
+        self.job.AsyncResult.assert_called_with('job-1')
+
+
+def chat_row(phone, incoming, suffix, text='', receipt=''):
+    """A CHAT_MESSAGES_JS row for a one-to-one chat with phone (digits)."""
+    return [f"{'false' if incoming else 'true'}_{phone}@c.us_{suffix}", int(incoming), text, '', receipt]
+
+
+class InboxScannerTests(TestCase):
+
+    def setUp(self):
+        self.messages = make_whatsapp_messages(2)
+        WhatsAppMessage.objects.update(
+            message_type='approval', requires_response=True, status='sent', sent_at=timezone.now()
+        )
+        self.phone = normalize_phone(self.messages[0].recipient_phone)
+        other = normalize_phone(self.messages[1].recipient_phone)
+
+        self.driver = FakeChatDriver(chats={
+            # A saved contact: the title says nothing, the JID decides
+            'Asha': {'unread': True, 'rows': [
+                chat_row(self.phone, False, 'OUT1', 'Approve?', receipt='read'),
+                chat_row(self.phone, True, 'IN1', ' approve '),
+            ]},
+            # Titled with a number that is not pending: never opened
+            '+44 7700 900123': {'unread': True, 'rows': [chat_row('447700900123', True, 'X1', 'hi')]},
+            # Pending recipient, but nothing new
+            'Ben': {'unread': False, 'rows': [chat_row(other, True, 'IN0', 'deny')]},
+        })
+        service = WhatsAppAutomationService()
+        service.driver = self.driver
+        self.scanner = InboxScanner(service, self.messages[0].session)
+
+        for patcher in (
+            mock.patch('notifications.inbox.get_redis', side_effect=RedisError('down')),
+            mock.patch('notifications.inbox.record_receipts'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(_local_hwm.clear)
+
+    def test_matches_reply_by_jid(self):
+        matches = self.scanner.scan()
+        self.assertEqual([(message.pk, text) for message, text in matches], [(self.messages[0].pk, 'APPROVE')])
+        self.assertEqual(self.driver.clicked, ['Asha'])
+
+    def test_high_water_mark_skips_replies_already_seen(self):
+        self.scanner.scan()
+        self.assertEqual(self.scanner.scan(), [])
+
+        self.driver.chats['Asha']['rows'].append(chat_row(self.phone, True, 'IN2', 'Deny'))
+        matches = self.scanner.scan()
+        self.assertEqual([text for _, text in matches], ['DENY'])
+
+    def test_replies_before_our_last_message_do_not_count(self):
+        self.driver.chats['Asha']['rows'].append(chat_row(self.phone, False, 'OUT2', 'Reminder'))
+        self.assertEqual(self.scanner.scan(), [])
+
+
+class ChatDOMTests(TestCase):
+    """dom.py turns one script result into typed rows."""
+
+    def setUp(self):
+        self.driver = FakeChatDriver(chats={
+            'Asha': {'unread': False, 'rows': [
+                chat_row('15550001234', False, 'OUT1', 'Your code', receipt='delivered'),
+                chat_row('15550001234', True, 'IN1', 'Thanks'),
+            ]},
+            'Neighbours': {'unread': True, 'rows': [
+                ['false_120363000000000000@g.us_G1_15550001234@c.us', 1, 'Parcel here?', '', ''],
+            ]},
+            '': {'unread': True, 'rows': []},
+        }, open_title='Asha')
+
+    def test_read_chat(self):
+        self.assertEqual(read_chat(self.driver), [
+            ChatMessage('true_15550001234@c.us_OUT1', False, 'Your code', '', 'delivered'),
+            ChatMessage('false_15550001234@c.us_IN1', True, 'Thanks', '', ''),
+        ])
+        self.assertEqual([m.id for m in read_chat(self.driver, after_id='true_15550001234@c.us_OUT1')], [
+            'false_15550001234@c.us_IN1'
+        ])
+        self.assertEqual(len(read_chat(self.driver, limit=1)), 1)
+
+    def test_read_chat_list_keeps_one_row_per_item(self):
+        chat_list = read_chat_list(self.driver)
+        self.assertEqual(chat_list.chats, [('Asha', False), ('Neighbours', True), ('', True)])
+        self.assertEqual(chat_list.open_title, 'Asha')
+
+    def test_open_chat_phone_reads_the_jid(self):
+        self.assertEqual(open_chat_phone(self.driver), '15550001234')
+        self.driver.open('Neighbours')
+        self.assertIsNone(open_chat_phone(self.driver))
+        self.driver.open('')
+        self.assertIsNone(open_chat_phone(self.driver))
+
+    def test_empty_page(self):
+        driver = FakeChatDriver()
+        self.assertEqual(read_chat(driver), [])
+        self.assertEqual(read_chat_list(driver), ([], None))
+
+
+@override_settings(NOTIFICATION_SEND_CHUNK_SIZE=2)
+class BulkSendTests(TestCase):
+
+    def setUp(self):
+        NotificationTemplate.objects.create(
+            template_type='system_notification', channel='whatsapp', name='System',
+            message_template='Hi {username}, {event}'
+        )
+        self.users = [
+            User.objects.create(username=f"bulk{index}", phone_number=f"+1555111{index:04d}") for index in range(5)
+        ]
+        patcher = mock.patch('notifications.utils.send_notifications_batch_task')
+        self.task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def bulk_send(self, **kwargs):
+        from .utils import SmartNotificationManager
+        return SmartNotificationManager().bulk_send_notifications(
+            User.objects.filter(username__startswith='bulk'), 'system_notification',
+            context_data={'event': 'the lift is down'}, **kwargs
+        )
+
+    def test_creates_rows_and_enqueues_chunks(self):
+        self.assertEqual(self.bulk_send(priority='urgent'), 5)
+
+        notifications = Notification.objects.filter(recipient__in=self.users)
+        self.assertEqual(
+            sorted(notifications.values_list('message', flat=True)),
+            [f"Hi bulk{index}, the lift is down" for index in range(5)]
+        )
+        self.assertTrue(all(n.metadata['broadcast'] for n in notifications))
+
+        calls = self.task.apply_async.call_args_list
+        self.assertEqual([len(call.kwargs['args'][0]) for call in calls], [2, 2, 1])
+        self.assertEqual(
+            {notification_id for call in calls for notification_id in call.kwargs['args'][0]},
+            {str(n.notification_id) for n in notifications}
+        )
+        self.assertEqual({call.kwargs['queue'] for call in calls}, {queue_for_priority('urgent')})
+
+    def test_future_sends_are_left_to_the_scheduler(self):
+        self.assertEqual(self.bulk_send(scheduled_at=timezone.now() + timedelta(hours=1)), 5)
+        self.assertEqual(Notification.objects.filter(recipient__in=self.users).count(), 5)
+        self.task.apply_async.assert_not_called()
+
+
+class UrgentLaneTests(TestCase):
+
+    def setUp(self):
+        self.messages = make_whatsapp_messages(5)
+        self.urgent = self.messages[3]
+        Notification.objects.filter(pk=self.urgent.notification_id).update(priority='urgent')
+
+    def test_priorities_map_to_lanes(self):
+        self.assertEqual(
+            [queue_for_priority(p) for p in ('urgent', 'high', 'medium', 'low')],
+            [URGENT_QUEUE, URGENT_QUEUE, DEFAULT_QUEUE, BULK_QUEUE]
+        )
+        self.assertEqual(
+            [whatsapp_queue_for_priority(p) for p in ('urgent', 'high', 'medium')],
+            [WHATSAPP_URGENT_QUEUE, WHATSAPP_URGENT_QUEUE, WHATSAPP_QUEUE]
+        )
+
+    def test_urgent_messages_wake_the_urgent_lane(self):
+        with mock.patch('notifications.tasks.dispatch_whatsapp_messages') as task:
+            WhatsAppWebTransport()._wake_dispatcher([self.urgent.notification])
+            task.apply_async.assert_called_once_with(kwargs={'urgent_only': True}, queue=WHATSAPP_URGENT_QUEUE)
+
+            WhatsAppWebTransport()._wake_dispatcher([self.messages[0].notification])
+            task.delay.assert_called_once_with()
+
+    def test_urgent_messages_are_claimed_first(self):
+        claimed = [m.pk for m in WhatsAppBatchDispatcher(batch_size=2).claim_batch()]
+        self.assertEqual(claimed, [self.messages[0].pk, self.urgent.pk])
+
+    def test_urgent_only_dispatcher_claims_urgent_messages_only(self):
+        self.assertEqual([m.pk for m in WhatsAppBatchDispatcher(urgent_only=True).claim_batch()], [self.urgent.pk])
+
+    def run_dispatcher(self, dispatcher, depth):
+        results = {'sent': 0, 'failed': 0, 'requeued': 0, 'deferred': 0}
+        with mock.patch('notifications.dispatch.queue_depth', return_value=depth), \
+                mock.patch.object(dispatcher, 'send_batch', return_value=results) as send_batch, \
+                mock.patch('notifications.tasks.dispatch_whatsapp_messages') as task:
+            dispatcher.run(max_batches=5)
+        return send_batch.call_count, task.delay.call_count
+
+    def test_regular_run_yields_when_urgent_jobs_wait(self):
+        self.assertEqual(self.run_dispatcher(WhatsAppBatchDispatcher(batch_size=2), depth=1), (1, 1))
+
+    def test_regular_run_drains_when_urgent_lane_is_empty(self):
+        self.assertEqual(self.run_dispatcher(WhatsAppBatchDispatcher(batch_size=2), depth=0), (3, 0))
+
+    def test_urgent_run_does_not_yield(self):
+        self.assertEqual(self.run_dispatcher(WhatsAppBatchDispatcher(batch_size=2, urgent_only=True), depth=1), (1, 0))
+
+
+class SlowTransport(FakeTransport):
+    """Succeeds at once, except for pks in hang (never finish) and fail (raise)."""
+
+    def __init__(self, hang=(), fail=()):
+        super().__init__()
+        self.hang, self.fail = set(hang), set(fail)
+        self.cancelled = []
+
+    async def send_async(self, notification, client):
+        if notification.pk in self.fail:
+            raise ConnectionError('provider down')
+        if notification.pk in self.hang:
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                self.cancelled.append(notification.pk)
+                raise
+        return self._record(notification)
+
+
+class AsyncDeliveryTests(TestCase):
+
+    def setUp(self):
+        self.runner = AsyncDeliveryRunner(concurrency=10, timeout=0.05)
+        self.addCleanup(self.runner.shutdown)
+        self.notifications = make_notifications(4, channel='sms')
+
+    def test_results_per_notification(self):
+        ok, failing = self.notifications[:2]
+        results = self.runner.deliver(SlowTransport(fail=[failing.pk]), [ok, failing])
+        self.assertEqual(results, {ok.pk: True, failing.pk: False})
+
+    def test_timeout_cancels_the_rest_and_keeps_finished_results(self):
+        hung = self.notifications[-1]
+        transport = SlowTransport(hang=[hung.pk])
+
+        results = self.runner.deliver(transport, self.notifications)
+        self.assertEqual(results, {n.pk: n.pk != hung.pk for n in self.notifications})
+
+        deadline = time.monotonic() + 2
+        while not transport.cancelled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(transport.cancelled, [hung.pk])
+
+
+class ChromeProfileTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.snapshots = os.path.join(self.tmp, 'snapshots')
+        self.session = WhatsAppSession.objects.create(
+            session_id='session-1', phone_number='+10000000000', status='active'
+        )
+
+    def manager(self, name, keep=2):
+        return ChromeProfileManager(root=os.path.join(self.tmp, name), snapshot_root=self.snapshots, keep=keep)
+
+    def write(self, path, content='x'):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def logged_in_profile(self, manager):
+        path = manager.profile_dir(self.session)
+        self.write(os.path.join(path, 'Default', 'Cookies'), 'logged in')
+        self.write(os.path.join(path, 'Default', 'Cache', 'data_0'))
+        self.write(os.path.join(path, 'SingletonLock'))
+        return path
+
+    def test_snapshot_restores_on_another_worker(self):
+        source = self.manager('worker-a')
+        meta = source.snapshot(self.session, self.logged_in_profile(source))
+        self.assertEqual(self.session.session_data['profile_snapshot'], meta)
+
+        path = self.manager('worker-b').prepare(self.session)
+        with open(os.path.join(path, 'Default', 'Cookies')) as f:
+            self.assertEqual(f.read(), 'logged in')
+        self.assertFalse(os.path.exists(os.path.join(path, 'Default', 'Cache')))
+        self.assertFalse(os.path.exists(os.path.join(path, 'SingletonLock')))
+
+    def test_corrupt_snapshot_is_not_restored(self):
+        source = self.manager('worker-a')
+        meta = source.snapshot(self.session, self.logged_in_profile(source))
+        with open(meta['path'], 'ab') as f:
+            f.write(b'garbage')
+
+        target = self.manager('worker-b')
+        path = target.profile_dir(self.session)
+        self.assertFalse(target.restore(self.session, path))
+        self.assertFalse(os.path.exists(path))
+
+    def test_prune_keeps_the_newest_archives(self):
+        for stamp in (100, 300, 200, 400):
+            self.write(os.path.join(self.snapshots, f"session-1-{stamp}.tar.gz"))
+        self.write(os.path.join(self.snapshots, 'session-10-50.tar.gz'))
+
+        self.manager('worker-a', keep=2)._prune(self.session)
+        self.assertEqual(
+            sorted(os.listdir(self.snapshots)),
+            ['session-1-300.tar.gz', 'session-1-400.tar.gz', 'session-10-50.tar.gz']
+        )
+
+
+class StandInServerTests(TestCase):
+    """The stand-in must keep serving the DOM markers the driver code looks for."""
+
+    def setUp(self):
+        state = StandInState(
+            send_latency=0, deliver_after=0, read_after=60,
+            reply_rules=[ReplyRule(re.compile('Approval'), 'APPROVE', 0)]
+        )
+        self.server = WhatsAppWebStandIn(port=0, state=state).start()
+        self.addCleanup(self.server.stop)
+
+    def request(self, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(
+            f"{self.server.url}{path}", data=data, headers={'Content-Type': 'application/json'}
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            body = response.read().decode('utf-8')
+        return json.loads(body) if path.startswith('/api/') else body
+
+    def test_page_has_the_markers_the_driver_uses(self):
+        page = self.request('/send?phone=15550001234')
+        test_ids = {
+            test_id
+            for module in (dom, inbox, services)
+            for test_id in re.findall(r"data-testid='([\w-]+)'", inspect.getsource(module))
+        }
+        self.assertIn('msg-container', test_ids)
+        for marker in [*test_ids, 'data-id', 'message-in', 'message-out', 'data-pre-plain-text',
+                       'selectable-text', 'msg-check', 'msg-dblcheck', 'msg-dblcheck-ack']:
+            self.assertIn(marker, page)
+
+    def test_state_rows_match_what_dom_reads(self):
+        self.request('/api/send', {'phone': '+1 555 000 1234', 'text': 'Parcel Delivery Approval'})
+        state = self.request('/api/state?open=15550001234')
+
+        self.assertEqual(state['open'], '+15550001234')
+        self.assertEqual(state['chats'], [['+15550001234', 0]])
+        sent, reply = state['messages']
+        self.assertEqual((sent[1], sent[2], sent[4]), (0, 'Parcel Delivery Approval', 'delivered'))
+        self.assertEqual((reply[1], reply[2]), (1, 'APPROVE'))
+        for row in (sent, reply):
+            self.assertEqual(MESSAGE_JID_RE.match(row[0]).group(1), '15550001234')
@@ -0,0 +1,319 @@
+"""
+Pluggable delivery transports, one per NotificationTemplate.channel.
+
+NotificationService looks up the transport for a notification's channel in
+a registry built from settings.NOTIFICATION_TRANSPORTS, so a channel can be
+pointed at a real provider, a generic HTTP API or the in-process fake used
+for load testing without touching the send pipeline.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, Iterable, Optional
+
+import requests
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .lanes import URGENT_PRIORITIES, WHATSAPP_URGENT_QUEUE
+from .models import Notification, WhatsAppMessage
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationTransport:
+    """
+    Base class for channel transports.
+
+    send() returns True when the notification was delivered to the provider.
+    Deferred transports only hand the notification to another stage (e.g. the
+    WhatsApp batch dispatcher), which settles its status later.
+    """
+
+    channel = None
+    deferred = False
+
+    def __init__(self, **options):
+        self.options = options
+
+    def send(self, notification: Notification) -> bool:
+        raise NotImplementedError
+
+    def send_many(self, notifications: Iterable[Notification]) -> Dict[int, bool]:
+        """Send several notifications, returning success per notification pk."""
+        return {notification.pk: self.send(notification) for notification in notifications}
+
+    async def send_async(self, notification: Notification, client) -> bool:
+        """
+        Send from the async delivery runner. client is its shared
+        httpx.AsyncClient; transports without native async support run the
+        blocking send() in a thread.
+        """
+        return await asyncio.to_thread(self.send, notification)
+
+
+class WhatsAppWebTransport(NotificationTransport):
+    """Queues notifications for the Selenium batch dispatcher."""
+
+    channel = 'whatsapp'
+    deferred = True
+
+    def send(self, notification: Notification) -> bool:
+        return self.send_many([notification])[notification.pk]
+
+    def _wake_dispatcher(self, notifications: Iterable[Notification]):
+        """Trigger a dispatch run, on the urgent lane if any message needs it."""
+        from .tasks import dispatch_whatsapp_messages
+
+        if any(notification.priority in URGENT_PRIORITIES for notification in notifications):
+            dispatch_whatsapp_messages.apply_async(
+                kwargs={'urgent_only': True},
+                queue=WHATSAPP_URGENT_QUEUE
+            )
+        else:
+            dispatch_whatsapp_messages.delay()
+
+    def send_many(self, notifications: Iterable[Notification]) -> Dict[int, bool]:
+        """Queue all messages with one INSERT and wake the dispatcher once."""
+        from .services import NotificationService
+
+        notifications = list(notifications)
+        service = NotificationService()
+        results = {}
+        messages = []
+
+        # Retries already have a message row (one per notification): requeue it
+        retried = WhatsAppMessage.objects.filter(notification__in=notifications).in_bulk(
+            field_name='notification_id'
+        )
+        requeued = []
+        now = timezone.now()
+
+        for notification in notifications:
+            message = service.build_whatsapp_message(notification)
+            results[notification.pk] = message is not None
+            if not message:
+                continue
+
+            existing = retried.get(notification.pk)
+            if existing:
+                # Drop what the failed attempt left, so receipts cannot match its id
+                existing.session = message.session
+                existing.message_content = message.message_content
+                existing.status = 'queued'
+                existing.whatsapp_message_id = ''
+                existing.error_message = ''
+                existing.updated_at = now
+                requeued.append(existing)
+            else:
+                messages.append(message)
+
+        if messages:
+            WhatsAppMessage.objects.bulk_create(messages)
+        if requeued:
+            WhatsAppMessage.objects.bulk_update(requeued, [
+                'session', 'message_content', 'status', 'whatsapp_message_id', 'error_message', 'updated_at'
+            ])
+        if messages or requeued:
+            self._wake_dispatcher([notification for notification in notifications if results[notification.pk]])
+        return results
+
+
+class HTTPTransport(NotificationTransport):
+    """
+    Posts notifications as JSON to an HTTP API (e.g. SMS_API_ENDPOINT).
+
+    Connections are pooled and kept alive per process, so a worker sending a
+    burst reuses a handful of TCP/TLS connections instead of opening one per
+    message.
+    """
+
+    def __init__(self, endpoint: str = '', api_key: str = '', timeout: float = 10,
+                 pool_size: int = 20, max_retries: int = 2, **options):
+        super().__init__(**options)
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    adapter = HTTPAdapter(
+                        pool_connections=self.pool_size,
+                        pool_maxsize=self.pool_size,
+                        max_retries=Retry(
+                            total=self.max_retries,
+                            backoff_factor=0.2,
+                            status_forcelist=(502, 503, 504),
+                            allowed_methods=None,
+                        ),
+                    )
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def build_payload(self, notification: Notification) -> Dict:
+        return {
+            'id': str(notification.notification_id),
+            'channel': self.channel,
+            'to': notification.recipient_phone or notification.recipient_email,
+            'subject': notification.subject,
+            'message': notification.message,
+        }
+
+    def send(self, notification: Notification) -> bool:
+        if not self.endpoint:
+            logger.error(f"No endpoint configured for {self.channel} transport")
+            return False
+
+        try:
+            response = self.session.post(
+                self.endpoint,
+                json=self.build_payload(notification),
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return True
+        except requests.RequestException as e:
+            logger.error(f"Error sending {self.channel} notification {notification.notification_id}: {e}")
+            return False
+
+    async def send_async(self, notification: Notification, client) -> bool:
+        import httpx
+
+        if not self.endpoint:
+            logger.error(f"No endpoint configured for {self.channel} transport")
+            return False
+
+        try:
+            response = await client.post(
+                self.endpoint,
+                json=self.build_payload(notification),
+                headers=self.headers,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return True
+        except httpx.HTTPError as e:
+            logger.error(f"Error sending {self.channel} notification {notification.notification_id}: {e}")
+            return False
+
+
+class EmailTransport(NotificationTransport):
+    """Sends notifications through Django's configured email backend."""
+
+    channel = 'email'
+
+    def send(self, notification: Notification) -> bool:
+        try:
+            send_mail(
+                subject=notification.subject,
+                message=notification.message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[notification.recipient_email],
+                fail_silently=False,
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error sending email: {e}")
+            return False
+
+
+class LoggingTransport(NotificationTransport):
+    """Placeholder for channels without a provider yet: logs and succeeds."""
+
+    def send(self, notification: Notification) -> bool:
+        logger.info(f"{self.channel} notification {notification.notification_id} sent to user {notification.recipient_id}")
+        return True
+
+
+class FakeTransport(NotificationTransport):
+    """
+    In-process transport for load and pipeline testing.
+
+    Records what would have been sent, with optional simulated latency and
+    failure rate, so the pipeline can be benchmarked without a browser or
+    provider.
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, keep: int = 10000, **options):
+        super().__init__(**options)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = deque(maxlen=keep)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def send(self, notification: Notification) -> bool:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._record(notification)
+
+    async def send_async(self, notification: Notification, client) -> bool:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._record(notification)
+
+    def _record(self, notification: Notification) -> bool:
+        success = random.random() >= self.failure_rate
+        with self._lock:
+            self.counts['sent' if success else 'failed'] += 1
+            if success:
+                self.sent.append(notification.notification_id)
+        return success
+
+    def reset(self):
+        with self._lock:
+            self.sent.clear()
+            self.counts.clear()
+
+
+_registry: Dict[str, NotificationTransport] = {}
+_registry_lock = threading.Lock()
+
+
+def register_transport(channel: str, transport: NotificationTransport):
+    """Install a transport instance for a channel, replacing any existing one."""
+    transport.channel = channel
+    with _registry_lock:
+        _registry[channel] = transport
+
+
+def get_transport(channel: str) -> Optional[NotificationTransport]:
+    """Return the transport for a channel, building it from settings on first use."""
+    transport = _registry.get(channel)
+    if transport is not None:
+        return transport
+
+    path = settings.NOTIFICATION_TRANSPORTS.get(channel)
+    if not path:
+        return None
+
+    options = settings.NOTIFICATION_TRANSPORT_OPTIONS.get(channel, {})
+    with _registry_lock:
+        if channel not in _registry:
+            transport = import_string(path)(**options)
+            transport.channel = channel
+            _registry[channel] = transport
+        return _registry[channel]
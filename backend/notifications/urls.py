@@ -15,6 +15,7 @@ urlpatterns = [
     path('whatsapp/send-message/', views.send_whatsapp_message_api, name='send-whatsapp-message'),
     path('whatsapp/send-approval/', views.send_approval_request_api, name='send-approval-request'),
     path('whatsapp/check-responses/', views.check_responses_api, name='check-responses'),
+    path('whatsapp/jobs/<str:job_id>/', views.whatsapp_job_api, name='whatsapp-job'),
     path('whatsapp/process-responses/', views.process_responses_api, name='process-responses'),
     path('whatsapp/messages/', views.WhatsAppMessageView.as_view(), name='whatsapp-messages'),
     
@@ -25,4 +26,9 @@ urlpatterns = [
     
     # Personalized Notifications
     path('send-personalized/', views.send_personalized_notification_api, name='send-personalized-notification'),
+    
+    # Queue monitoring
+    path('lanes/', views.notification_lanes_api, name='notification-lanes'),
+    path('dead-letter/', views.dead_letter_notifications_api, name='dead-letter-notifications'),
+    path('receipts/', views.delivery_receipts_api, name='delivery-receipts'),
 ]
\ No newline at end of file
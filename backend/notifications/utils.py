@@ -5,18 +5,26 @@ These functions provide easy-to-use interfaces for common messaging tasks.
 
 import logging
 from typing import Dict, Optional, List
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from .models import (
     WhatsAppSession, WhatsAppMessage, AIBotConfiguration, 
-    OTPVerification, Notification, NotificationTemplate
+    OTPVerification, Notification
 )
 from .services import WhatsAppAutomationService, AIBotService, NotificationService
+from .lanes import queue_for_priority
+from .idempotency import claim_idempotency_key, make_idempotency_key, release_idempotency_key
+from .otp import generate_otp_code
+from .otp_store import get_otp_store, record_verify_result
+from .templating import CompiledTemplate, compile_source, get_compiled_template, get_template
 from .tasks import (
     send_notification_task, generate_ai_otp, send_otp_whatsapp,
-    process_whatsapp_responses
+    process_whatsapp_responses, run_whatsapp_job, send_notifications_batch_task,
+    record_otp_verification
 )
 
 User = get_user_model()
@@ -26,7 +34,11 @@ logger = logging.getLogger(__name__)
 class WhatsAppMessenger:
     """
     High-level interface for WhatsApp messaging operations.
-    Handles session management and provides simple methods for common tasks.
+    Browser work is handed to the WhatsApp worker, which keeps pooled
+    drivers warm, instead of starting Chrome in the calling process.
+    Methods queue the job and return its id without waiting for the
+    browser, so they are safe to call from request threads and tasks;
+    job_result() reports the outcome once the worker has run it.
     """
     
     def __init__(self):
@@ -44,39 +56,41 @@ class WhatsAppMessenger:
         self.service.session = self.session
         return True
     
-    def send_quick_message(self, phone_number: str, message: str) -> bool:
-        """Send a quick message without creating notification records."""
+    def _run_job(self, action: str, *args) -> str:
+        """Queue a WhatsApp job on the worker and return its id."""
+        result = run_whatsapp_job.apply_async(
+            args=(action, *args),
+            expires=settings.WHATSAPP_JOB_TIMEOUT
+        )
+        return result.id
+    
+    @staticmethod
+    def job_result(job_id: str) -> Dict:
+        """Status of a queued WhatsApp job: 'queued', 'done' or 'failed', with its result."""
+        result = run_whatsapp_job.AsyncResult(job_id)
+        if not result.ready():
+            return {'job_id': job_id, 'status': 'queued', 'result': None}
+        if not result.successful():
+            return {'job_id': job_id, 'status': 'failed', 'result': None}
+        return {'job_id': job_id, 'status': 'done', 'result': result.result}
+    
+    def send_quick_message(self, phone_number: str, message: str) -> Optional[str]:
+        """Queue a quick message without creating notification records; returns the job id."""
         if not self.ensure_active_session():
-            return False
-            
-        self.service.initialize_driver(headless=True)
-        success = self.service.send_message(phone_number, message)
-        self.service.close_session()
+            return None
         
-        return success
+        return self._run_job('send_message', phone_number, message)
     
     def send_otp(self, phone_number: str, user_id: int, otp_type: str = 'verification') -> Optional[str]:
-        """Generate and send OTP to user."""
+        """
+        Generate an OTP and queue it for sending. The code can be verified
+        once send_otp_whatsapp has delivered it and marked the row 'sent'.
+        """
         try:
             user = User.objects.get(id=user_id)
             
-            # Generate OTP using AI if available
-            ai_bot = AIBotConfiguration.objects.filter(
-                purpose='otp_generation',
-                is_active=True
-            ).first()
-            
-            ai_service = AIBotService()
-            
-            if ai_bot:
-                if ai_bot.provider == 'openai':
-                    ai_service.initialize_openai(ai_bot.api_key)
-                elif ai_bot.provider == 'google':
-                    ai_service.initialize_gemini(ai_bot.api_key)
-                
-                otp_code = ai_service.generate_otp(length=6, use_ai=True)
-            else:
-                otp_code = ai_service.generate_otp(length=6, use_ai=False)
+            # Codes are generated locally, see notifications/otp.py
+            otp_code = generate_otp_code(user.id, otp_type)
             
             # Create OTP verification record
             otp_verification = OTPVerification.objects.create(
@@ -84,54 +98,35 @@ class WhatsAppMessenger:
                 otp_type=otp_type,
                 otp_code=otp_code,
                 phone_number=phone_number,
-                expires_at=timezone.now() + timedelta(minutes=10),
-                generated_by_ai=bool(ai_bot),
-                ai_bot=ai_bot
+                expires_at=timezone.now() + timedelta(minutes=10)
             )
             
             # Send OTP via WhatsApp
             if not self.ensure_active_session():
-                return None
-                
-            self.service.initialize_driver(headless=True)
-            success = self.service.send_otp_message(phone_number, otp_code, otp_type)
-            self.service.close_session()
-            
-            if success:
-                otp_verification.status = 'sent'
-                otp_verification.sent_at = timezone.now()
-                otp_verification.save()
-                return otp_code
-            else:
                 otp_verification.status = 'failed'
-                otp_verification.save()
+                otp_verification.save(update_fields=['status'])
                 return None
+            
+            send_otp_whatsapp.delay(otp_verification.id)
+            return otp_code
                 
         except Exception as e:
             logger.error(f"Error sending OTP: {e}")
             return None
     
-    def send_parcel_approval_request(self, phone_number: str, booking_details: Dict) -> bool:
-        """Send parcel approval request to customer."""
+    def send_parcel_approval_request(self, phone_number: str, booking_details: Dict) -> Optional[str]:
+        """Queue a parcel approval request to the customer; returns the job id."""
         if not self.ensure_active_session():
-            return False
+            return None
             
-        self.service.initialize_driver(headless=True)
-        success = self.service.send_approval_request(phone_number, booking_details)
-        self.service.close_session()
-        
-        return success
+        return self._run_job('send_approval_request', phone_number, booking_details)
     
     def check_user_response(self, phone_number: str) -> Optional[str]:
-        """Check for user response in WhatsApp chat."""
+        """Queue a check of the user's WhatsApp chat for a response; returns the job id."""
         if not self.ensure_active_session():
             return None
             
-        self.service.initialize_driver(headless=True)
-        response = self.service.check_for_responses(phone_number)
-        self.service.close_session()
-        
-        return response
+        return self._run_job('check_for_responses', phone_number)
 
 
 class SmartNotificationManager:
@@ -149,31 +144,29 @@ class SmartNotificationManager:
         template_type: str, 
         channel: str = 'whatsapp',
         context_data: Dict = None,
-        priority: str = 'medium'
+        priority: str = 'medium',
+        scheduled_at: Optional[datetime] = None,
+        idempotency_key: Optional[str] = None
     ) -> bool:
         """
         Send a personalized notification using AI.
+        With a future scheduled_at the notification is left to the scheduler.
+        A repeated idempotency_key is acknowledged without sending again.
         """
+        if idempotency_key and not claim_idempotency_key(idempotency_key):
+            logger.info(f"Skipping duplicate {template_type} notification")
+            return True
+        
         try:
             # Get notification template
-            template = NotificationTemplate.objects.filter(
-                template_type=template_type,
-                channel=channel,
-                is_active=True
-            ).first()
+            template = get_template(template_type, channel)
             
             if not template:
                 logger.error(f"No template found for {template_type} - {channel}")
                 return False
             
             # Prepare user data for personalization
-            user_data = {
-                'name': user.get_full_name() or user.username,
-                'username': user.username,
-                'email': user.email,
-                'phone': getattr(user, 'phone_number', ''),
-                **(context_data or {})
-            }
+            user_data = self._user_data(user, context_data)
             
             # Get AI bot for message personalization
             ai_bot = AIBotConfiguration.objects.filter(
@@ -194,52 +187,149 @@ class SmartNotificationManager:
                     ai_bot
                 )
             else:
-                personalized_message = self.ai_service._simple_template_substitution(
-                    template.message_template, 
-                    user_data
+                personalized_message = self._render(get_compiled_template(template), user_data)
+            
+            # Create notification; a savepoint keeps a duplicate key from
+            # breaking the caller's transaction
+            with transaction.atomic():
+                notification = Notification.objects.create(
+                    recipient=user,
+                    template=template,
+                    subject=template.subject,
+                    message=personalized_message,
+                    recipient_phone=getattr(user, 'phone_number', ''),
+                    recipient_email=user.email,
+                    priority=priority,
+                    scheduled_at=scheduled_at,
+                    metadata=context_data or {},
+                    idempotency_key=idempotency_key
                 )
             
-            # Create notification
-            notification = Notification.objects.create(
-                recipient=user,
-                template=template,
-                subject=template.subject,
-                message=personalized_message,
-                recipient_phone=getattr(user, 'phone_number', ''),
-                recipient_email=user.email,
-                priority=priority,
-                metadata=context_data or {}
-            )
+            if scheduled_at and scheduled_at > timezone.now():
+                return True
             
-            # Send notification asynchronously
-            send_notification_task.delay(str(notification.notification_id))
+            # Send notification asynchronously on its priority lane
+            send_notification_task.apply_async(
+                args=(str(notification.notification_id),),
+                queue=queue_for_priority(priority)
+            )
             
             return True
             
+        except IntegrityError:
+            # The key outlived its Redis TTL but the notification exists
+            logger.info(f"Skipping duplicate {template_type} notification")
+            return True
         except Exception as e:
             logger.error(f"Error sending personalized notification: {e}")
+            if idempotency_key:
+                release_idempotency_key(idempotency_key)
             return False
     
+    @staticmethod
+    def _render(compiled: CompiledTemplate, user_data: Dict) -> str:
+        """Render a compiled template, reporting placeholders without a value."""
+        text, missing = compiled.render(user_data)
+        if missing:
+            logger.warning(f"Template placeholders without a value: {', '.join(missing)}")
+        return text
+    
+    @staticmethod
+    def _user_data(user: User, context_data: Dict = None) -> Dict:
+        """Template variables for a recipient."""
+        return {
+            'name': user.get_full_name() or user.username,
+            'username': user.username,
+            'email': user.email,
+            'phone': getattr(user, 'phone_number', ''),
+            **(context_data or {})
+        }
+    
     def bulk_send_notifications(
         self, 
         users: List[User], 
         template_type: str, 
         channel: str = 'whatsapp',
-        context_data: Dict = None
+        context_data: Dict = None,
+        priority: str = 'medium',
+        scheduled_at: Optional[datetime] = None
     ) -> int:
         """
         Send notifications to multiple users.
+        The template and AI bot are resolved once, rows are inserted with
+        bulk_create and sending is enqueued in chunks. With a future
+        scheduled_at nothing is enqueued; the scheduler sends them when due.
         Returns the number of successfully queued notifications.
         """
-        success_count = 0
-        
-        for user in users:
-            if self.send_personalized_notification(
-                user, template_type, channel, context_data
-            ):
-                success_count += 1
-        
-        return success_count
+        try:
+            template = get_template(template_type, channel)
+            
+            if not template:
+                logger.error(f"No template found for {template_type} - {channel}")
+                return 0
+            
+            ai_bot = AIBotConfiguration.objects.filter(
+                purpose='message_personalization',
+                is_active=True
+            ).first()
+            
+            # Personalize the shared wording once; per-user fields are
+            # substituted below without further AI calls
+            compiled = get_compiled_template(template)
+            if ai_bot:
+                if ai_bot.provider == 'openai':
+                    self.ai_service.initialize_openai(ai_bot.api_key)
+                elif ai_bot.provider == 'google':
+                    self.ai_service.initialize_gemini(ai_bot.api_key)
+                
+                compiled = compile_source(self.ai_service.personalize_message(
+                    template.message_template,
+                    context_data or {},
+                    ai_bot
+                ))
+            
+            if hasattr(users, 'only'):
+                users = users.only(
+                    'id', 'username', 'first_name', 'last_name', 'email', 'phone_number'
+                ).iterator(chunk_size=settings.NOTIFICATION_BULK_BATCH_SIZE)
+            
+            notifications = [
+                Notification(
+                    recipient=user,
+                    template=template,
+                    subject=template.subject,
+                    message=self._render(compiled, self._user_data(user, context_data)),
+                    recipient_phone=getattr(user, 'phone_number', ''),
+                    recipient_email=user.email,
+                    priority=priority,
+                    scheduled_at=scheduled_at,
+                    # One message to many users: nothing to gain from a per-recipient digest
+                    metadata={**(context_data or {}), 'broadcast': True}
+                )
+                for user in users
+            ]
+            
+            created = Notification.objects.bulk_create(
+                notifications,
+                batch_size=settings.NOTIFICATION_BULK_BATCH_SIZE
+            )
+            
+            if scheduled_at and scheduled_at > timezone.now():
+                return len(created)
+            
+            notification_ids = [str(notification.notification_id) for notification in created]
+            chunk_size = settings.NOTIFICATION_SEND_CHUNK_SIZE
+            for start in range(0, len(notification_ids), chunk_size):
+                send_notifications_batch_task.apply_async(
+                    args=(notification_ids[start:start + chunk_size],),
+                    queue=queue_for_priority(priority)
+                )
+            
+            return len(created)
+            
+        except Exception as e:
+            logger.error(f"Error sending bulk notifications: {e}")
+            return 0
 
 
 class OTPManager:
@@ -259,37 +349,53 @@ class OTPManager:
     
     @staticmethod
     def verify_otp(user: User, otp_code: str, otp_type: str = 'verification') -> bool:
-        """Verify OTP code."""
+        """
+        Verify OTP code. The live code is checked and consumed atomically in
+        Redis; the database row is updated in the background.
+        """
+        otp_code = str(otp_code).strip() if otp_code is not None else ''
+        if not otp_code:
+            return False
+        
+        result = get_otp_store().verify(user.id, otp_type, otp_code)
+        if result is not None and result.outcome != 'missing':
+            if result.otp_id and result.outcome != 'consumed':
+                try:
+                    record_otp_verification.delay(*result)
+                except Exception as e:
+                    logger.warning(f"Could not queue OTP update, applying inline: {e}")
+                    record_verify_result(result)
+            return result.verified
+        
+        return OTPManager._verify_otp_in_db(user, otp_code, otp_type)
+    
+    @staticmethod
+    def _verify_otp_in_db(user: User, otp_code: str, otp_type: str) -> bool:
+        """Verify against OTPVerification, locking the row so parallel attempts serialize."""
         try:
-            otp_verification = OTPVerification.objects.filter(
-                user=user,
-                otp_code=otp_code,
-                otp_type=otp_type,
-                status='sent',
-                expires_at__gt=timezone.now()
-            ).first()
-            
-            if not otp_verification:
-                return False
-            
-            # Check attempt limits
-            if otp_verification.verification_attempts >= otp_verification.max_attempts:
-                otp_verification.status = 'failed'
-                otp_verification.save()
-                return False
-            
-            # Increment attempts
-            otp_verification.verification_attempts += 1
-            
-            # Verify OTP
-            if otp_verification.otp_code == otp_code:
+            with transaction.atomic():
+                otp_verification = OTPVerification.objects.select_for_update().filter(
+                    user=user,
+                    otp_code=otp_code,
+                    otp_type=otp_type,
+                    status='sent',
+                    expires_at__gt=timezone.now()
+                ).first()
+                
+                if not otp_verification:
+                    return False
+                
+                # Check attempt limits
+                if otp_verification.verification_attempts >= otp_verification.max_attempts:
+                    otp_verification.status = 'failed'
+                    otp_verification.save(update_fields=['status'])
+                    return False
+                
+                otp_verification.verification_attempts += 1
                 otp_verification.status = 'verified'
                 otp_verification.verified_at = timezone.now()
-                otp_verification.save()
+                otp_verification.save(update_fields=['verification_attempts', 'status', 'verified_at'])
                 return True
-            else:
-                otp_verification.save()
-                return False
                 
         except Exception as e:
             logger.error(f"Error verifying OTP: {e}")
@@ -304,6 +410,7 @@ class OTPManager:
             otp_type=otp_type,
             status__in=['generated', 'sent']
         ).update(status='expired')
+        get_otp_store().discard(user.id, otp_type)
         
         # Generate and send new OTP
         return OTPManager.generate_and_send_otp(user, phone_number, otp_type)
@@ -332,7 +439,8 @@ class BookingNotificationHelper:
             'booking_confirmation',
             'whatsapp',
             context_data,
-            'high'
+            'high',
+            idempotency_key=make_idempotency_key(booking.booking_id, 'booking_confirmation', context_data)
         )
     
     @staticmethod
@@ -347,10 +455,10 @@ class BookingNotificationHelper:
             'recipient_apartment': booking.recipient_apartment
         }
         
-        return messenger.send_parcel_approval_request(
+        return bool(messenger.send_parcel_approval_request(
             booking.recipient_phone,
             booking_details
-        )
+        ))
     
     @staticmethod
     def send_locker_assignment_notification(booking, access_code: str) -> bool:
@@ -370,13 +478,14 @@ class BookingNotificationHelper:
             'delivery_update',
             'whatsapp',
             context_data,
-            'urgent'
+            'urgent',
+            idempotency_key=make_idempotency_key(booking.booking_id, 'delivery_update', context_data)
         )
 
 
 # Convenience functions for quick access
-def send_whatsapp_message(phone_number: str, message: str) -> bool:
-    """Quick function to send WhatsApp message."""
+def send_whatsapp_message(phone_number: str, message: str) -> Optional[str]:
+    """Quick function to queue a WhatsApp message; returns the job id."""
     messenger = WhatsAppMessenger()
     return messenger.send_quick_message(phone_number, message)
 
@@ -2,9 +2,12 @@ from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
+import hmac
 import logging
 
 from .models import (
@@ -16,6 +19,11 @@ from .utils import (
     send_whatsapp_message, send_otp_to_user, verify_user_otp
 )
 from .tasks import process_whatsapp_responses
+from .metrics import whatsapp_send_latency, whatsapp_confirm_latency
+from .lanes import lane_stats
+from .retry import dead_letter_queryset
+from .scheduler import enqueue_notifications
+from .receipts import receipt_error, record_receipts
 from .serializers import (
     WhatsAppSessionSerializer, WhatsAppMessageSerializer,
     OTPVerificationSerializer, NotificationSerializer
@@ -78,17 +86,17 @@ def send_whatsapp_message_api(request):
         )
     
     try:
-        success = send_whatsapp_message(phone_number, message)
+        job_id = send_whatsapp_message(phone_number, message)
         
-        if success:
+        if job_id:
             return Response(
-                {'success': True, 'message': 'Message sent successfully'}, 
-                status=status.HTTP_200_OK
+                {'success': True, 'message': 'Message queued', 'job_id': job_id}, 
+                status=status.HTTP_202_ACCEPTED
             )
         else:
             return Response(
-                {'success': False, 'error': 'Failed to send message'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'success': False, 'error': 'No active WhatsApp session'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
             
     except Exception as e:
@@ -134,10 +142,10 @@ def send_otp_api(request):
             return Response(
                 {
                     'success': True, 
-                    'message': 'OTP sent successfully',
+                    'message': 'OTP queued for sending',
                     'otp_code': otp_code  # Remove in production
                 }, 
-                status=status.HTTP_200_OK
+                status=status.HTTP_202_ACCEPTED
             )
         else:
             return Response(
@@ -219,17 +227,17 @@ def send_approval_request_api(request):
     
     try:
         messenger = WhatsAppMessenger()
-        success = messenger.send_parcel_approval_request(phone_number, booking_details)
+        job_id = messenger.send_parcel_approval_request(phone_number, booking_details)
         
-        if success:
+        if job_id:
             return Response(
-                {'success': True, 'message': 'Approval request sent successfully'}, 
-                status=status.HTTP_200_OK
+                {'success': True, 'message': 'Approval request queued', 'job_id': job_id}, 
+                status=status.HTTP_202_ACCEPTED
             )
         else:
             return Response(
-                {'success': False, 'error': 'Failed to send approval request'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'success': False, 'error': 'No active WhatsApp session'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
             
     except Exception as e:
@@ -244,7 +252,8 @@ def send_approval_request_api(request):
 @permission_classes([permissions.IsAuthenticated])
 def check_responses_api(request):
     """
-    API endpoint to check for WhatsApp responses.
+    API endpoint to check for WhatsApp responses. The check runs on the
+    WhatsApp worker; poll whatsapp/jobs/<job_id>/ for the response.
     """
     phone_number = request.query_params.get('phone_number')
     
@@ -256,15 +265,17 @@ def check_responses_api(request):
     
     try:
         messenger = WhatsAppMessenger()
-        response = messenger.check_user_response(phone_number)
+        job_id = messenger.check_user_response(phone_number)
+        
+        if not job_id:
+            return Response(
+                {'error': 'No active WhatsApp session'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         
         return Response(
-            {
-                'phone_number': phone_number,
-                'response': response,
-                'has_response': bool(response)
-            }, 
-            status=status.HTTP_200_OK
+            {'phone_number': phone_number, 'job_id': job_id}, 
+            status=status.HTTP_202_ACCEPTED
         )
         
     except Exception as e:
@@ -275,6 +286,15 @@ def check_responses_api(request):
         )
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def whatsapp_job_api(request, job_id):
+    """
+    API endpoint to poll a queued WhatsApp job.
+    """
+    return Response(WhatsAppMessenger.job_result(job_id), status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def process_responses_api(request):
@@ -442,6 +462,8 @@ def whatsapp_status_api(request):
                 'recent_messages_24h': recent_messages,
                 'pending_approvals': pending_approvals,
                 'active_ai_bots': ai_bots,
+                'send_latency': whatsapp_send_latency.summary(),
+                'confirm_latency': whatsapp_confirm_latency.summary(),
                 'system_status': 'operational' if active_sessions > 0 else 'inactive'
             }, 
             status=status.HTTP_200_OK
@@ -453,3 +475,146 @@ def whatsapp_status_api(request):
             {'error': str(e)}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def notification_lanes_api(request):
+    """
+    API endpoint to get queue depth and wait time per priority lane.
+    """
+    try:
+        return Response(lane_stats(), status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        logger.error(f"Error getting lane status: {e}")
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAdminUser])
+def dead_letter_notifications_api(request):
+    """
+    API endpoint to list notifications that exhausted their retries (GET)
+    or requeue them (POST with notification_ids).
+    """
+    try:
+        dead = dead_letter_queryset()
+        
+        if request.method == 'GET':
+            notifications = dead.select_related('recipient', 'template').order_by('-updated_at')[:100]
+            return Response(
+                {
+                    'count': dead.count(),
+                    'notifications': NotificationSerializer(notifications, many=True).data
+                },
+                status=status.HTTP_200_OK
+            )
+        
+        notification_ids = request.data.get('notification_ids')
+        if not notification_ids:
+            return Response(
+                {'error': 'notification_ids is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rows = list(
+            dead.filter(notification_id__in=notification_ids).values_list('notification_id', 'priority')
+        )
+        Notification.objects.filter(notification_id__in=[row[0] for row in rows]).update(
+            status='pending',
+            retry_count=0,
+            scheduled_at=None,
+            error_message='',
+            updated_at=timezone.now()
+        )
+        
+        by_priority = {}
+        for notification_id, priority in rows:
+            by_priority.setdefault(priority, []).append(str(notification_id))
+        enqueue_notifications(by_priority)
+        
+        return Response(
+            {'success': True, 'requeued': len(rows)}, 
+            status=status.HTTP_200_OK
+        )
+        
+    except Exception as e:
+        logger.error(f"Error handling dead-letter notifications: {e}")
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+class HasReceiptSecret(permissions.BasePermission):
+    """
+    Lets transports post receipts with the shared secret in the
+    X-Receipt-Secret header instead of an admin login.
+    """
+
+    def has_permission(self, request, view):
+        secret = settings.NOTIFICATION_RECEIPT_SECRET
+        provided = request.headers.get('X-Receipt-Secret', '')
+        return bool(secret) and hmac.compare_digest(provided.encode('utf-8'), secret.encode('utf-8'))
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser | HasReceiptSecret])
+def delivery_receipts_api(request):
+    """
+    API endpoint for transports and providers to post delivery/read receipts.
+    Expects {'receipts': [{'notification_id' or 'whatsapp_message_id', 'status', 'at'}]}.
+    Naive 'at' timestamps are taken to be in the server's time zone.
+    """
+    receipts = request.data.get('receipts')
+    
+    if not isinstance(receipts, list) or not receipts:
+        return Response(
+            {'error': 'receipts must be a non-empty list'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    for index, receipt in enumerate(receipts):
+        if not isinstance(receipt, dict):
+            return Response(
+                {'error': f'receipts[{index}] must be an object'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        error = receipt_error(receipt)
+        if error:
+            return Response(
+                {'error': f'receipts[{index}]: {error}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if receipt.get('at'):
+            try:
+                at = parse_datetime(receipt['at']) if isinstance(receipt['at'], str) else None
+            except ValueError:
+                at = None
+            if at is None:
+                return Response(
+                    {'error': f'receipts[{index}].at must be an ISO 8601 datetime'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            receipt['at'] = timezone.make_aware(at) if timezone.is_naive(at) else at
+    
+    try:
+        accepted = record_receipts(receipts)
+        
+        return Response(
+            {'success': True, 'accepted': accepted}, 
+            status=status.HTTP_202_ACCEPTED
+        )
+        
+    except Exception as e:
+        logger.error(f"Error recording delivery receipts: {e}")
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
@@ -20,6 +20,26 @@ app.conf.beat_schedule = {
         'task': 'notifications.tasks.process_whatsapp_responses',
         'schedule': 60.0,  # Every minute
     },
+    'dispatch-whatsapp-messages': {
+        'task': 'notifications.tasks.dispatch_whatsapp_messages',
+        'schedule': 10.0,  # Safety net for messages queued without a dispatch trigger
+    },
+    'dispatch-scheduled-notifications': {
+        'task': 'notifications.tasks.dispatch_scheduled_notifications',
+        'schedule': 15.0,  # Not needed when run_notification_scheduler is running
+    },
+    'flush-delivery-receipts': {
+        'task': 'notifications.tasks.flush_delivery_receipts',
+        'schedule': 5.0,
+    },
+    'collect-whatsapp-receipts': {
+        'task': 'notifications.tasks.collect_whatsapp_receipts',
+        'schedule': 300.0,  # Every 5 minutes
+    },
+    'supervise-whatsapp-drivers': {
+        'task': 'notifications.tasks.supervise_whatsapp_drivers',
+        'schedule': 60.0,  # Every minute
+    },
     'cleanup-expired-sessions': {
         'task': 'notifications.tasks.cleanup_expired_sessions',
         'schedule': 3600.0,  # Every hour
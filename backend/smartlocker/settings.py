@@ -193,13 +193,46 @@ CHANNEL_LAYERS = {
 }
 
 # Celery Configuration
-CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
+REDIS_SOCKET_TIMEOUT = config('REDIS_SOCKET_TIMEOUT', default=1.0, cast=float)
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Priority lanes (see notifications/lanes.py). Each queue gets its own workers:
+#   celery -A smartlocker worker -Q notifications.urgent --concurrency=4
+#   celery -A smartlocker worker -Q notifications,notifications.bulk --concurrency=8
+#   celery -A smartlocker worker -Q whatsapp.urgent,whatsapp --pool=solo --prefetch-multiplier=1
+# The whatsapp queues are served by the one worker that keeps WhatsApp Web
+# warm (a second browser on the same session would fight over it). Urgent work
+# is isolated cooperatively instead: the worker prefetches nothing, and a
+# dispatch run on the whatsapp queue stops between batches as soon as
+# anything is waiting on whatsapp.urgent (see notifications/dispatch.py).
+CELERY_TASK_ROUTES = {
+    # OTPs, approvals and locker access codes
+    'notifications.tasks.run_whatsapp_job': {'queue': 'whatsapp.urgent'},
+    'notifications.tasks.process_whatsapp_responses': {'queue': 'whatsapp.urgent'},
+    'notifications.tasks.send_confirmation_message': {'queue': 'whatsapp.urgent'},
+    'notifications.tasks.notify_locker_assignment': {'queue': 'whatsapp.urgent'},
+    'notifications.tasks.send_otp_whatsapp': {'queue': 'whatsapp.urgent'},
+    'notifications.tasks.generate_ai_otp': {'queue': 'notifications.urgent'},
+    'notifications.tasks.record_otp_verification': {'queue': 'notifications.urgent'},
+    'notifications.tasks.process_approval_response': {'queue': 'notifications.urgent'},
+    'notifications.tasks.assign_locker_and_notify': {'queue': 'notifications.urgent'},
+    # Everything else is routed per call from Notification.priority
+    'notifications.tasks.dispatch_whatsapp_messages': {'queue': 'whatsapp'},
+    'notifications.tasks.send_notification_task': {'queue': 'notifications'},
+    'notifications.tasks.send_notifications_batch_task': {'queue': 'notifications'},
+    'notifications.tasks.dispatch_scheduled_notifications': {'queue': 'notifications'},
+    'notifications.tasks.flush_delivery_receipts': {'queue': 'notifications'},
+    'notifications.tasks.collect_whatsapp_receipts': {'queue': 'whatsapp'},
+    'notifications.tasks.supervise_whatsapp_drivers': {'queue': 'whatsapp'},
+}
+
 # Media Files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -213,7 +246,57 @@ RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET', default='')
 
 # WhatsApp Web Automation
 WHATSAPP_BUSINESS_NUMBER = config('WHATSAPP_BUSINESS_NUMBER', default='+1234567890')
+# Point at a stand-in (manage.py run_whatsapp_standin) to test without WhatsApp
+WHATSAPP_WEB_URL = config('WHATSAPP_WEB_URL', default='https://web.whatsapp.com').rstrip('/')
 WHATSAPP_SESSION_TIMEOUT = config('WHATSAPP_SESSION_TIMEOUT', default=3600, cast=int)
+WHATSAPP_SESSION_IDLE_EXPIRY = config('WHATSAPP_SESSION_IDLE_EXPIRY', default=7200, cast=int)  # seconds without activity before cleanup expires a session
+WHATSAPP_DRIVER_IDLE_TIMEOUT = config('WHATSAPP_DRIVER_IDLE_TIMEOUT', default=1800, cast=int)  # seconds, 0 keeps drivers forever
+# Pooled drivers are recycled when any of these is exceeded (0 disables the check)
+WHATSAPP_DRIVER_MAX_RSS_MB = config('WHATSAPP_DRIVER_MAX_RSS_MB', default=1500, cast=int)  # chromedriver + Chrome tree
+WHATSAPP_DRIVER_MAX_CRASHES = config('WHATSAPP_DRIVER_MAX_CRASHES', default=3, cast=int)
+WHATSAPP_DRIVER_MAX_SEND_LATENCY = config('WHATSAPP_DRIVER_MAX_SEND_LATENCY', default=20, cast=float)  # median seconds
+WHATSAPP_DRIVER_HEALTH_INTERVAL = config('WHATSAPP_DRIVER_HEALTH_INTERVAL', default=60, cast=int)  # seconds between memory checks
+WHATSAPP_DRIVER_MAX_START_FAILURES = config('WHATSAPP_DRIVER_MAX_START_FAILURES', default=2, cast=int)  # before the session is marked 'error'
+# Sessions the supervisor marked 'error' are retried after REVIVAL_BACKOFF seconds, doubling up to the max
+WHATSAPP_DRIVER_MAX_REVIVALS = config('WHATSAPP_DRIVER_MAX_REVIVALS', default=8, cast=int)
+WHATSAPP_DRIVER_REVIVAL_BACKOFF = config('WHATSAPP_DRIVER_REVIVAL_BACKOFF', default=60, cast=int)
+WHATSAPP_DRIVER_REVIVAL_BACKOFF_MAX = config('WHATSAPP_DRIVER_REVIVAL_BACKOFF_MAX', default=3600, cast=int)
+# Chrome profiles: one directory per session and worker process under
+# WHATSAPP_PROFILE_ROOT; logged-in snapshots go to WHATSAPP_PROFILE_SNAPSHOT_ROOT,
+# which should be shared storage when workers run on several hosts
+WHATSAPP_PROFILE_ROOT = config('WHATSAPP_PROFILE_ROOT', default='/tmp/whatsapp_profiles')
+WHATSAPP_PROFILE_SNAPSHOT_ROOT = config('WHATSAPP_PROFILE_SNAPSHOT_ROOT', default=os.path.join(BASE_DIR, 'whatsapp_snapshots'))
+WHATSAPP_PROFILE_SNAPSHOT_INTERVAL = config('WHATSAPP_PROFILE_SNAPSHOT_INTERVAL', default=3600, cast=int)  # seconds
+WHATSAPP_PROFILE_SNAPSHOTS_KEPT = config('WHATSAPP_PROFILE_SNAPSHOTS_KEPT', default=3, cast=int)
+WHATSAPP_JOB_TIMEOUT = config('WHATSAPP_JOB_TIMEOUT', default=120, cast=int)  # seconds before an unstarted WhatsApp job is dropped
+# A sent message counts as confirmed once its bubble contains one of these tick icons
+WHATSAPP_SEND_CONFIRM_SELECTOR = config(
+    'WHATSAPP_SEND_CONFIRM_SELECTOR',
+    default="[data-icon='msg-check'], [data-icon='msg-dblcheck'], [data-icon='msg-dblcheck-ack']"
+)
+WHATSAPP_SEND_CONFIRM_TIMEOUT = config('WHATSAPP_SEND_CONFIRM_TIMEOUT', default=15, cast=float)
+WHATSAPP_SEND_CONFIRM_POLL = config('WHATSAPP_SEND_CONFIRM_POLL', default=0.1, cast=float)
+# Token buckets shared by all workers (see notifications/ratelimit.py);
+# per_minute is the sustained rate, burst the bucket size, 0 disables a scope
+WHATSAPP_RATE_LIMITS = {
+    'global': {
+        'per_minute': config('WHATSAPP_RATE_GLOBAL_PER_MINUTE', default=120, cast=int),
+        'burst': config('WHATSAPP_RATE_GLOBAL_BURST', default=20, cast=int),
+    },
+    'session': {
+        'per_minute': config('WHATSAPP_RATE_SESSION_PER_MINUTE', default=20, cast=int),
+        'burst': config('WHATSAPP_RATE_SESSION_BURST', default=5, cast=int),
+    },
+    'recipient': {
+        'per_minute': config('WHATSAPP_RATE_RECIPIENT_PER_MINUTE', default=4, cast=int),
+        'burst': config('WHATSAPP_RATE_RECIPIENT_BURST', default=2, cast=int),
+    },
+}
+WHATSAPP_RATE_LIMIT_MAX_WAIT = config('WHATSAPP_RATE_LIMIT_MAX_WAIT', default=5, cast=float)  # seconds a send may block
+WHATSAPP_ROUTER_REFRESH = config('WHATSAPP_ROUTER_REFRESH', default=10, cast=int)  # seconds between active-session reloads
+WHATSAPP_DISPATCH_BATCH_SIZE = config('WHATSAPP_DISPATCH_BATCH_SIZE', default=50, cast=int)
+WHATSAPP_DISPATCH_MAX_BATCHES = config('WHATSAPP_DISPATCH_MAX_BATCHES', default=10, cast=int)
+WHATSAPP_DISPATCH_CLAIM_TIMEOUT = config('WHATSAPP_DISPATCH_CLAIM_TIMEOUT', default=300, cast=int)  # seconds before a 'sending' claim is requeued
 
 # AI Bot Configuration
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
@@ -224,6 +307,94 @@ HUGGINGFACE_API_KEY = config('HUGGINGFACE_API_KEY', default='')
 TEXTBELT_API_KEY = config('TEXTBELT_API_KEY', default='')
 SMS_API_ENDPOINT = config('SMS_API_ENDPOINT', default='')
 
+# Seconds a process reuses a cached NotificationTemplate row edited elsewhere
+NOTIFICATION_TEMPLATE_CACHE_TTL = config('NOTIFICATION_TEMPLATE_CACHE_TTL', default=60, cast=int)
+
+# Bulk notification fan-out
+NOTIFICATION_BULK_BATCH_SIZE = config('NOTIFICATION_BULK_BATCH_SIZE', default=1000, cast=int)  # rows per INSERT
+NOTIFICATION_SEND_CHUNK_SIZE = config('NOTIFICATION_SEND_CHUNK_SIZE', default=200, cast=int)  # notifications per send task
+
+# Failed sends are retried with exponential backoff (seconds) until
+# Notification.max_retries, then left 'failed' in the dead-letter view.
+NOTIFICATION_RETRY_BASE_DELAY = config('NOTIFICATION_RETRY_BASE_DELAY', default=30, cast=int)
+NOTIFICATION_RETRY_MAX_DELAY = config('NOTIFICATION_RETRY_MAX_DELAY', default=3600, cast=int)
+
+# Notifications with a scheduled_at are sent by the scheduler (beat task or
+# manage.py run_notification_scheduler), not by per-item ETA tasks
+NOTIFICATION_SCHEDULER_BATCH_SIZE = config('NOTIFICATION_SCHEDULER_BATCH_SIZE', default=500, cast=int)
+NOTIFICATION_SCHEDULER_MAX_BATCHES = config('NOTIFICATION_SCHEDULER_MAX_BATCHES', default=20, cast=int)
+NOTIFICATION_SCHEDULER_LOOKAHEAD = config('NOTIFICATION_SCHEDULER_LOOKAHEAD', default=60, cast=int)  # seconds
+
+# Delivery/read receipts are buffered in Redis and applied in bulk
+NOTIFICATION_RECEIPT_BATCH_SIZE = config('NOTIFICATION_RECEIPT_BATCH_SIZE', default=1000, cast=int)
+WHATSAPP_RECEIPT_SCAN_CHATS = config('WHATSAPP_RECEIPT_SCAN_CHATS', default=10, cast=int)  # chats opened per session and sweep
+# Shared secret transports send as X-Receipt-Secret to post receipts without an admin login (empty disables it)
+NOTIFICATION_RECEIPT_SECRET = config('NOTIFICATION_RECEIPT_SECRET', default='')
+
+# How long a booking notification's idempotency key blocks repeat sends (seconds)
+NOTIFICATION_IDEMPOTENCY_TTL = config('NOTIFICATION_IDEMPOTENCY_TTL', default=86400, cast=int)
+
+# Low and medium priority notifications to the same recipient within this
+# many seconds are merged into one digest (0 disables coalescing)
+NOTIFICATION_COALESCE_WINDOW = config('NOTIFICATION_COALESCE_WINDOW', default=120, cast=int)
+NOTIFICATION_COALESCE_CHANNELS = ('whatsapp', 'sms')
+# Only per-booking chatter is digested; payment receipts and system or
+# broadcast notices always go out on their own
+NOTIFICATION_COALESCE_TEMPLATE_TYPES = (
+    'booking_confirmation', 'delivery_update', 'collection_reminder',
+)
+
+# Notification transports, keyed by NotificationTemplate.channel.
+# Set NOTIFICATION_FAKE_TRANSPORTS=True to swap every channel for the
+# in-process fake, e.g. when load testing the pipeline.
+NOTIFICATION_FAKE_TRANSPORTS = config('NOTIFICATION_FAKE_TRANSPORTS', default=False, cast=bool)
+NOTIFICATION_TRANSPORTS = {
+    'whatsapp': 'notifications.transports.WhatsAppWebTransport',
+    'sms': 'notifications.transports.HTTPTransport' if SMS_API_ENDPOINT else 'notifications.transports.LoggingTransport',
+    'email': 'notifications.transports.EmailTransport',
+    'push': 'notifications.transports.LoggingTransport',
+}
+NOTIFICATION_TRANSPORT_OPTIONS = {
+    'sms': {
+        'endpoint': SMS_API_ENDPOINT,
+        'api_key': TEXTBELT_API_KEY,
+        'pool_size': config('SMS_API_POOL_SIZE', default=20, cast=int),
+    },
+}
+
+# Batches for non-browser channels are sent concurrently from an asyncio
+# loop per worker process (see notifications/async_delivery.py)
+NOTIFICATION_ASYNC_DELIVERY = config('NOTIFICATION_ASYNC_DELIVERY', default=True, cast=bool)
+NOTIFICATION_ASYNC_CONCURRENCY = config('NOTIFICATION_ASYNC_CONCURRENCY', default=200, cast=int)  # in-flight sends per process
+NOTIFICATION_ASYNC_MAX_CONNECTIONS = config('NOTIFICATION_ASYNC_MAX_CONNECTIONS', default=50, cast=int)
+NOTIFICATION_ASYNC_TIMEOUT = config('NOTIFICATION_ASYNC_TIMEOUT', default=10, cast=float)
+
+if NOTIFICATION_FAKE_TRANSPORTS:
+    NOTIFICATION_TRANSPORTS = {
+        channel: 'notifications.transports.FakeTransport' for channel in NOTIFICATION_TRANSPORTS
+    }
+    NOTIFICATION_TRANSPORT_OPTIONS = {
+        channel: {'latency': config('FAKE_TRANSPORT_LATENCY', default=0.0, cast=float)}
+        for channel in NOTIFICATION_TRANSPORTS
+    }
+
+# OTP codes (notifications/otp.py): RandomOTPGenerator, HOTPGenerator or TOTPGenerator
+OTP_GENERATOR = config('OTP_GENERATOR', default='notifications.otp.RandomOTPGenerator')
+OTP_GENERATOR_OPTIONS = {
+    'digits': config('OTP_DIGITS', default=6, cast=int),
+}
+
+# Locker access codes (lockers/access_codes.py); only their HMAC is stored
+LOCKER_ACCESS_CODE_BYTES = config('LOCKER_ACCESS_CODE_BYTES', default=4, cast=int)  # 8 hex characters
+
+# Hourly cleanup (notifications/maintenance.py): rows per statement and
+# statements per job and run
+MAINTENANCE_BATCH_SIZE = config('MAINTENANCE_BATCH_SIZE', default=5000, cast=int)
+MAINTENANCE_MAX_BATCHES = config('MAINTENANCE_MAX_BATCHES', default=100, cast=int)
+# Rows older than this move to the Archived* tables
+OTP_ARCHIVE_AFTER_DAYS = config('OTP_ARCHIVE_AFTER_DAYS', default=30, cast=int)
+AI_INTERACTION_ARCHIVE_AFTER_DAYS = config('AI_INTERACTION_ARCHIVE_AFTER_DAYS', default=90, cast=int)
+
 # Chrome WebDriver Settings
 CHROME_DRIVER_PATH = config('CHROME_DRIVER_PATH', default='')
 SELENIUM_HEADLESS = config('SELENIUM_HEADLESS', default=True, cast=bool)